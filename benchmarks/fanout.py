@@ -0,0 +1,182 @@
+"""
+Benchmark of hybrid fan-out against the follower distribution.
+
+Seeds users and follows into the database from DATABASE_URL (the tables are
+dropped and recreated, use a scratch database), then for every fan-out
+threshold posts tweets and reads feeds through the same code paths as the
+API and reports write amplification and latencies.
+
+Usage:
+    python -m benchmarks.fanout --users 2000 --follows 50 --distribution zipf \
+        --thresholds 0,100,500
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import case, delete, insert, text, update
+from sqlalchemy.future import select
+
+from server.api import services
+from server.api.feed import hydrate_tweets, select_feed_page
+from server.api.models import FANOUT_PULL, FANOUT_PUSH, Follow, Timeline, Tweet, User
+from server.api.ranking import RANKINGS
+from server.database.db_connection import AsyncSessionLocal, Base, engine
+
+
+def pick_followees(users: int, follows: int, distribution: str, rng: random.Random):
+    """
+    Yield (follower, followee) index pairs with the given popularity distribution.
+    """
+    weights = None
+    if distribution == "zipf":
+        weights = [1 / (rank + 1) for rank in range(users)]
+
+    for follower in range(users):
+        followees = set()
+        while len(followees) < min(follows, users - 1):
+            followee = rng.choices(range(users), weights=weights)[0]
+            if followee != follower:
+                followees.add(followee)
+        for followee in followees:
+            yield follower, followee
+
+
+async def seed(users: int, follows: int, distribution: str, seed_value: int):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+
+    rng = random.Random(seed_value)
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            insert(User),
+            [
+                {
+                    "username": f"user{i}",
+                    "api_key": f"key{i}",
+                    "name": f"User {i}",
+                    "email": f"user{i}@example.com",
+                }
+                for i in range(users)
+            ],
+        )
+        ids = (await db.execute(select(User.id).order_by(User.id))).scalars().all()
+        pairs = list(pick_followees(users, follows, distribution, rng))
+        await db.execute(
+            insert(Follow),
+            [
+                {"user_id": ids[follower], "follower_id": ids[followee]}
+                for follower, followee in pairs
+            ],
+        )
+        await db.execute(
+            text(
+                "UPDATE users SET follower_count = ("
+                "SELECT count(*) FROM followers WHERE followers.follower_id = users.id)"
+            )
+        )
+        await db.commit()
+    return ids
+
+
+async def run_threshold(threshold: int, ids, tweets: int, reads: int, rng):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Timeline))
+        await db.execute(delete(Tweet))
+        mode = FANOUT_PUSH
+        if threshold > 0:
+            mode = case(
+                (User.follower_count >= threshold, FANOUT_PULL), else_=FANOUT_PUSH
+            )
+        await db.execute(update(User).values(fanout_mode=mode))
+        await db.commit()
+
+        authors = (
+            (await db.execute(select(User).where(User.id.in_(ids)))).scalars().all()
+        )
+
+        write_times = []
+        for _ in range(tweets):
+            author = rng.choice(authors)
+            started = time.perf_counter()
+            tweet = Tweet(content="benchmark", user_id=author.id)
+            db.add(tweet)
+            await db.flush()
+            if not services.is_pull_author(author):
+                await services.fan_out_tweet(tweet, db)
+            await db.commit()
+            write_times.append(time.perf_counter() - started)
+
+        rows = (await db.execute(text("SELECT count(*) FROM timelines"))).scalar()
+
+        read_times = []
+        for _ in range(reads):
+            reader = rng.choice(ids)
+            started = time.perf_counter()
+            pull_authors = await services.get_pull_authors(reader, db)
+            page = await select_feed_page(
+                reader, pull_authors, RANKINGS["likes"], 50, None, db
+            )
+            await hydrate_tweets(page, db)
+            read_times.append(time.perf_counter() - started)
+
+    return rows, write_times, read_times
+
+
+def describe(times):
+    ordered = sorted(times)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"mean {statistics.mean(times) * 1000:7.2f} ms, p99 {p99 * 1000:7.2f} ms"
+
+
+async def main(args):
+    ids = await seed(args.users, args.follows, args.distribution, args.seed)
+
+    async with AsyncSessionLocal() as db:
+        counts = (
+            (
+                await db.execute(
+                    select(User.follower_count).order_by(User.follower_count.desc())
+                )
+            )
+            .scalars()
+            .all()
+        )
+    print(
+        f"{args.distribution}: {len(ids)} users, max followers {counts[0]}, "
+        f"median followers {statistics.median(counts)}"
+    )
+
+    for threshold in args.thresholds:
+        rng = random.Random(args.seed)
+        rows, write_times, read_times = await run_threshold(
+            threshold, ids, args.tweets, args.reads, rng
+        )
+        pull = sum(1 for count in counts if 0 < threshold <= count)
+        print(
+            f"threshold {threshold:>6}: pull authors {pull:>5}, "
+            f"timeline rows {rows:>8} | write {describe(write_times)} "
+            f"| read {describe(read_times)}"
+        )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.fanout")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--follows", type=int, default=50)
+    parser.add_argument("--distribution", choices=["uniform", "zipf"], default="zipf")
+    parser.add_argument("--tweets", type=int, default=500)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--thresholds",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[0, 1000, 200, 50],
+    )
+    asyncio.run(main(parser.parse_args()))
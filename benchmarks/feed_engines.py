@@ -0,0 +1,130 @@
+"""
+Benchmark of the ORM and the database-side JSON feed engines.
+
+Seeds users, follows, tweets, timelines and likes into the database from
+DATABASE_URL (the tables are dropped and recreated, use a scratch database),
+then renders the same first pages with both engines and reports latencies
+and body sizes.
+
+Usage:
+    python -m benchmarks.feed_engines --users 1000 --tweets 20 --likes 30 \
+        --page-sizes 20,50,200
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import insert, text
+from sqlalchemy.future import select
+
+from benchmarks.fanout import seed
+from server.api.feed import hydrate_tweets, select_first_feed_page
+from server.api.feed_json import render_feed_page
+from server.api.models import Like, Tweet
+from server.api.ranking import RANKINGS
+from server.api.schemas import TweetResponse
+from server.database.db_connection import AsyncSessionLocal, engine
+
+
+async def seed_activity(ids, tweets: int, likes: int, rng: random.Random):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            insert(Tweet),
+            [
+                {"content": f"Tweet {number} of user {user_id}", "user_id": user_id}
+                for user_id in ids
+                for number in range(tweets)
+            ],
+        )
+        tweet_ids = (await db.execute(select(Tweet.id))).scalars().all()
+        await db.execute(
+            insert(Like),
+            [
+                {"user_id": rng.choice(ids), "tweet_id": tweet_id}
+                for tweet_id in tweet_ids
+                for _ in range(rng.randint(0, likes * 2))
+            ],
+        )
+        await db.execute(
+            text(
+                "UPDATE tweets SET like_count = ("
+                "SELECT count(*) FROM likes WHERE likes.tweet_id = tweets.id)"
+            )
+        )
+        await db.execute(
+            text(
+                "INSERT INTO timelines (user_id, tweet_id, author_id) "
+                "SELECT followers.user_id, tweets.id, tweets.user_id "
+                "FROM followers JOIN tweets ON tweets.user_id = followers.follower_id"
+            )
+        )
+        await db.commit()
+
+
+async def render_orm(reader: int, limit: int, db) -> bytes:
+    tweets, version = await select_first_feed_page(
+        reader, [], RANKINGS["likes"], limit + 1, db
+    )
+    return (
+        TweetResponse(
+            result=True,
+            tweets=await hydrate_tweets(tweets[:limit], db),
+            version=version,
+        )
+        .model_dump_json()
+        .encode()
+    )
+
+
+async def render_sql(reader: int, limit: int, db) -> bytes:
+    return await render_feed_page(reader, [], RANKINGS["likes"], limit, None, db)
+
+
+def describe(times):
+    ordered = sorted(times)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"mean {statistics.mean(times) * 1000:7.2f} ms, p99 {p99 * 1000:7.2f} ms"
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    ids = await seed(args.users, args.follows, "uniform", args.seed)
+    await seed_activity(ids, args.tweets, args.likes, rng)
+    readers = [rng.choice(ids) for _ in range(args.reads)]
+
+    for limit in args.page_sizes:
+        for name, render in (("orm", render_orm), ("sql", render_sql)):
+            times, sizes = [], []
+            async with AsyncSessionLocal() as db:
+                await render(readers[0], limit, db)
+                for reader in readers:
+                    started = time.perf_counter()
+                    body = await render(reader, limit, db)
+                    times.append(time.perf_counter() - started)
+                    sizes.append(len(body))
+                    db.expunge_all()
+            print(
+                f"page {limit:>4} {name}: {describe(times)} "
+                f"| body {statistics.mean(sizes) / 1024:8.1f} KiB"
+            )
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.feed_engines")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follows", type=int, default=50)
+    parser.add_argument("--tweets", type=int, default=20)
+    parser.add_argument("--likes", type=int, default=30)
+    parser.add_argument("--reads", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--page-sizes",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[20, 50, 200],
+    )
+    asyncio.run(main(parser.parse_args()))
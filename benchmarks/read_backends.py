@@ -0,0 +1,104 @@
+"""
+Benchmark of the ORM, Core and raw asyncpg read paths per endpoint.
+
+Seeds the same dataset as benchmarks.feed_engines into the database from
+DATABASE_URL (the tables are dropped and recreated, use a scratch database),
+then builds the response bodies of the feed and profile endpoints with every
+read backend and reports latencies.
+
+Usage:
+    python -m benchmarks.read_backends --users 1000 --reads 200
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import statistics
+import time
+
+from benchmarks.feed_engines import seed_activity
+from benchmarks.fanout import seed
+from server.api.feed import hydrate_tweets, read_feed_page, select_first_feed_page
+from server.api.ranking import RANKINGS
+from server.api.reads import READ_BACKENDS, read_profile
+from server.api.schemas import TweetResponse, UserOut, UserResponse
+from server.api.services import get_followers, get_followings, get_user_by_id
+from server.database.db_connection import AsyncSessionLocal, engine
+
+
+async def feed_body(reader: int, backend: str, limit: int, db) -> bytes:
+    if backend == "orm":
+        tweets, version = await select_first_feed_page(
+            reader, [], RANKINGS["likes"], limit, db
+        )
+    else:
+        tweets, version = await read_feed_page(
+            reader, [], RANKINGS["likes"], limit, None, db, backend
+        )
+    return (
+        TweetResponse(
+            result=True,
+            tweets=await hydrate_tweets(tweets, db, backend=backend),
+            version=version,
+        )
+        .model_dump_json()
+        .encode()
+    )
+
+
+async def profile_body(reader: int, backend: str, limit: int, db) -> bytes:
+    if backend == "orm":
+        user = await get_user_by_id(reader, db)
+        profile = UserResponse(
+            result=True,
+            user=UserOut(id=user.id, name=user.name),
+            followers=await get_followers(user, db),
+            followings=await get_followings(user, db),
+        )
+    else:
+        profile = await read_profile(reader, db, backend)
+    return profile.model_dump_json().encode()
+
+
+def describe(times):
+    ordered = sorted(times)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"mean {statistics.mean(times) * 1000:7.2f} ms, p99 {p99 * 1000:7.2f} ms"
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    ids = await seed(args.users, args.follows, "uniform", args.seed)
+    await seed_activity(ids, args.tweets, args.likes, rng)
+    readers = [rng.choice(ids) for _ in range(args.reads)]
+
+    # Statement logging of the engine would dominate the measured times.
+    engine.echo = False
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
+    for endpoint, build in (("feed", feed_body), ("profile", profile_body)):
+        for backend in READ_BACKENDS:
+            times = []
+            async with AsyncSessionLocal() as db:
+                await build(readers[0], backend, args.page_size, db)
+                for reader in readers:
+                    started = time.perf_counter()
+                    await build(reader, backend, args.page_size, db)
+                    times.append(time.perf_counter() - started)
+                    db.expunge_all()
+            print(f"{endpoint:>7} {backend:>4}: {describe(times)}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.read_backends")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--follows", type=int, default=50)
+    parser.add_argument("--tweets", type=int, default=20)
+    parser.add_argument("--likes", type=int, default=30)
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--reads", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
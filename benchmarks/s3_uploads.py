@@ -0,0 +1,114 @@
+"""
+Benchmark of media uploads with a client per upload and with the long-lived client,
+and of large multipart uploads with sequential and concurrent parts.
+
+Uploads the same objects through S3Client twice: before start(), when every
+upload creates its own client and connection pool, and after it, when all
+uploads share the worker's client. Then streams one large file with
+upload_stream() at each concurrency. Runs against the in-process S3 stand-in
+of the tests by default (tests/conftest.py, importing it needs
+DATABASE_URL_TEST like the tests), where no TLS handshake is involved and
+--latency simulates the time of a request, or against real storage given its
+endpoint and credentials.
+
+Usage:
+    python -m benchmarks.s3_uploads --uploads 200 --size 65536
+    python -m benchmarks.s3_uploads --large-size 67108864 --concurrency 1,4,8 \
+        --latency 0.05
+    python -m benchmarks.s3_uploads --endpoint-url https://storage.example.com \
+        --bucket media --access-key ... --secret-key ...
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from io import BytesIO
+
+from server.api.models import S3Client
+
+
+def describe(times):
+    ordered = sorted(times)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return f"mean {statistics.mean(times) * 1000:7.2f} ms, p99 {p99 * 1000:7.2f} ms"
+
+
+async def measure(s3: S3Client, uploads: int, body: bytes):
+    times = []
+    for number in range(uploads):
+        started = time.perf_counter()
+        await s3.upload_file_obj(body, f"benchmark/{number}.bin")
+        times.append(time.perf_counter() - started)
+    return times
+
+
+class AsyncReader:
+    def __init__(self, data: bytes):
+        self.buffer = BytesIO(data)
+
+    async def read(self, size: int) -> bytes:
+        return self.buffer.read(size)
+
+
+async def main(args):
+    standin = None
+    if args.endpoint_url is None:
+        from tests.conftest import S3StandIn
+
+        standin = S3StandIn(args.bucket, latency=args.latency)
+        await standin.start()
+        args.endpoint_url = standin.endpoint_url
+
+    s3 = S3Client(
+        access_key=args.access_key,
+        secret_key=args.secret_key,
+        endpoint_url=args.endpoint_url,
+        bucket_name=args.bucket,
+        web_url=args.endpoint_url,
+    )
+    body = os.urandom(args.size)
+
+    print(f"client per upload: {describe(await measure(s3, args.uploads, body))}")
+    await s3.start()
+    await s3.upload_file_obj(body, "benchmark/warmup.bin")
+    print(f"shared client:     {describe(await measure(s3, args.uploads, body))}")
+
+    large = os.urandom(args.large_size)
+    for concurrency in args.concurrency:
+        started = time.perf_counter()
+        await s3.upload_stream(
+            AsyncReader(large),
+            "benchmark/large.bin",
+            args.part_size,
+            concurrency=concurrency,
+        )
+        elapsed = time.perf_counter() - started
+        print(
+            f"large file, {concurrency:>2} parts at once: {elapsed:6.2f} s, "
+            f"{args.large_size / elapsed / 1024**2:7.1f} MiB/s"
+        )
+    await s3.close()
+
+    if standin is not None:
+        await standin.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.s3_uploads")
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--large-size", type=int, default=64 * 1024 * 1024)
+    parser.add_argument("--part-size", type=int, default=5 * 1024 * 1024)
+    parser.add_argument(
+        "--concurrency",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[1, 4, 8],
+    )
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--endpoint-url")
+    parser.add_argument("--bucket", default="media")
+    parser.add_argument("--access-key", default="access")
+    parser.add_argument("--secret-key", default="secret")
+    asyncio.run(main(parser.parse_args()))
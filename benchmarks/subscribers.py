@@ -0,0 +1,115 @@
+"""
+Load test of the live feed event hub with many concurrent subscribers.
+
+Opens the given numbers of subscriptions, each consumed by its own coroutine
+running the same Server-Sent Events encoder as the API, and reports memory
+per subscription (tracemalloc) and the latency of delivering one event,
+published with pg_notify() on the database from DATABASE_URL, to all of them.
+No tables are touched.
+
+No HTTP clients are connected: bytes_per_subscription covers the Subscription,
+its queue and the encoding coroutine only. A real connection additionally
+costs the ASGI server's request and response objects, the socket and its
+kernel send and receive buffers, which this benchmark does not measure.
+
+Usage:
+    python -m benchmarks.subscribers --subscribers 1000,5000,10000 --authors 100
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from server.api.events import EventHub, encode_events
+from server.config import FEED_EVENTS_KEEPALIVE, get_database_url
+from server.database.db_connection import AsyncSessionLocal, engine
+
+
+async def consume(subscription, received: asyncio.Queue):
+    async for _ in encode_events(subscription, FEED_EVENTS_KEEPALIVE):
+        received.put_nowait(time.perf_counter())
+
+
+async def run(hub: EventHub, subscribers: int, authors: int, follows: int, rng):
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    received: asyncio.Queue = asyncio.Queue()
+    subscriptions = [
+        hub.subscribe(rng.sample(range(authors), min(follows, authors)))
+        for _ in range(subscribers)
+    ]
+    consumers = [
+        asyncio.create_task(consume(subscription, received))
+        for subscription in subscriptions
+    ]
+    await asyncio.sleep(0.1)
+
+    gc.collect()
+    per_subscription = (tracemalloc.get_traced_memory()[0] - baseline) / subscribers
+    tracemalloc.stop()
+
+    author_id = 0
+    audience = sum(
+        1 for subscription in subscriptions if author_id in subscription.author_ids
+    )
+    async with AsyncSessionLocal() as db:
+        started = time.perf_counter()
+        await hub.publish({"type": "tweet", "tweet_id": 1, "author_id": author_id}, db)
+        await db.commit()
+
+    latencies = []
+    for _ in range(audience):
+        latencies.append(await received.get() - started)
+
+    for consumer in consumers:
+        consumer.cancel()
+    await asyncio.gather(*consumers, return_exceptions=True)
+    for subscription in subscriptions:
+        hub.unsubscribe(subscription)
+
+    return per_subscription, audience, latencies
+
+
+async def main(args):
+    hub = EventHub("benchmark_feed_events", queue_size=args.queue_size)
+    await hub.start(get_database_url())
+
+    for subscribers in args.subscribers:
+        per_subscription, audience, latencies = await run(
+            hub, subscribers, args.authors, args.follows, random.Random(args.seed)
+        )
+        print(
+            json.dumps(
+                {
+                    "subscribers": subscribers,
+                    "bytes_per_subscription": round(per_subscription),
+                    "delivered_to": audience,
+                    "latency_mean_ms": round(statistics.mean(latencies) * 1000, 2),
+                    "latency_max_ms": round(max(latencies) * 1000, 2),
+                }
+            )
+        )
+
+    await hub.stop()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.subscribers")
+    parser.add_argument(
+        "--subscribers",
+        type=lambda value: [int(item) for item in value.split(",")],
+        default=[1000, 5000, 10000],
+    )
+    parser.add_argument("--authors", type=int, default=100)
+    parser.add_argument("--follows", type=int, default=20)
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
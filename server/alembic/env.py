@@ -19,7 +19,7 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from server.database.db_connection import Base
-from server.api.models import Tweet, User, Like, Follow, Media
+from server.api.models import Tweet, User, Like, Follow, Media, Timeline, CounterShard
 
 target_metadata = Base.metadata
 
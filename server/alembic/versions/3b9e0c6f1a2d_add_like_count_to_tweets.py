@@ -0,0 +1,40 @@
+"""add like_count to tweets
+
+Revision ID: 3b9e0c6f1a2d
+Revises:
+Create Date: 2026-10-15 10:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3b9e0c6f1a2d"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# The application creates missing tables with create_all on startup, so the
+# statements are idempotent to work both on fresh and on existing databases.
+# Existing rows start at zero; fill them with `python -m server.commands
+# backfill-like-counts`.
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE tweets "
+        "ADD COLUMN IF NOT EXISTS like_count INTEGER NOT NULL DEFAULT 0"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_tweets_user_id_like_count_id "
+        "ON tweets (user_id, like_count, id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweets_user_id_like_count_id", table_name="tweets")
+    op.drop_column("tweets", "like_count")
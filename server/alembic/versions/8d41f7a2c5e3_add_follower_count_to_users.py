@@ -0,0 +1,34 @@
+"""add follower_count to users
+
+Revision ID: 8d41f7a2c5e3
+Revises: 3b9e0c6f1a2d
+Create Date: 2026-10-15 12:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8d41f7a2c5e3"
+down_revision: Union[str, None] = "3b9e0c6f1a2d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE users "
+        "ADD COLUMN IF NOT EXISTS follower_count INTEGER NOT NULL DEFAULT 0"
+    )
+    op.execute(
+        "UPDATE users SET follower_count = ("
+        "SELECT count(*) FROM followers WHERE followers.follower_id = users.id"
+        ")"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "follower_count")
@@ -0,0 +1,31 @@
+"""add status and object_key to media
+
+Revision ID: a9d3e7f2c4b1
+Revises: f4a1c9e6b2d8
+Create Date: 2026-10-15 19:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a9d3e7f2c4b1"
+down_revision: Union[str, None] = "f4a1c9e6b2d8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("ALTER TABLE media ADD COLUMN IF NOT EXISTS object_key VARCHAR")
+    op.execute(
+        "ALTER TABLE media "
+        "ADD COLUMN IF NOT EXISTS status VARCHAR NOT NULL DEFAULT 'ready'"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("media", "status")
+    op.drop_column("media", "object_key")
@@ -0,0 +1,72 @@
+"""add timelines and counter_shards
+
+Revision ID: b5e8d2f1c3a7
+Revises: a9d3e7f2c4b1
+Create Date: 2026-10-15 20:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+from server.config import FANOUT_FOLLOWER_THRESHOLD
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b5e8d2f1c3a7"
+down_revision: Union[str, None] = "a9d3e7f2c4b1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Feeds are read from timelines only, so the timelines of existing follows are
+# filled with the tweets of their push-mode authors; tweets of authors at or
+# above the fan-out threshold are merged at read time and are not copied.
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS timelines ("
+        "id SERIAL PRIMARY KEY, "
+        "user_id INTEGER NOT NULL REFERENCES users (id), "
+        "tweet_id INTEGER NOT NULL REFERENCES tweets (id), "
+        "author_id INTEGER NOT NULL REFERENCES users (id), "
+        "CONSTRAINT unique_timeline_entry UNIQUE (user_id, tweet_id)"
+        ")"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_timelines_user_id_author_id "
+        "ON timelines (user_id, author_id)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_timelines_tweet_id ON timelines (tweet_id)"
+    )
+    op.execute(
+        "CREATE TABLE IF NOT EXISTS counter_shards ("
+        "id SERIAL PRIMARY KEY, "
+        "counter VARCHAR(50) NOT NULL, "
+        "object_id INTEGER NOT NULL, "
+        "shard INTEGER NOT NULL, "
+        "value INTEGER NOT NULL DEFAULT 0, "
+        "CONSTRAINT unique_counter_shard UNIQUE (counter, object_id, shard)"
+        ")"
+    )
+
+    push_authors = "TRUE"
+    if FANOUT_FOLLOWER_THRESHOLD > 0:
+        push_authors = f"authors.follower_count < {int(FANOUT_FOLLOWER_THRESHOLD)}"
+    op.execute(
+        "INSERT INTO timelines (user_id, tweet_id, author_id) "
+        "SELECT followers.user_id, tweets.id, tweets.user_id "
+        "FROM followers "
+        "JOIN tweets ON tweets.user_id = followers.follower_id "
+        "JOIN users AS authors ON authors.id = tweets.user_id "
+        f"WHERE {push_authors} "
+        "ON CONFLICT ON CONSTRAINT unique_timeline_entry DO NOTHING"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("counter_shards")
+    op.drop_table("timelines")
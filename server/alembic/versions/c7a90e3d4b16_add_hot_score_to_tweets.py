@@ -0,0 +1,44 @@
+"""add hot_score to tweets
+
+Revision ID: c7a90e3d4b16
+Revises: 8d41f7a2c5e3
+Create Date: 2026-10-15 14:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c7a90e3d4b16"
+down_revision: Union[str, None] = "8d41f7a2c5e3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Must match HOT_SCORE_DECAY in server/api/models.py.
+HOT_SCORE_DECAY = 12 * 60 * 60
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE tweets ADD COLUMN IF NOT EXISTS hot_score DOUBLE PRECISION "
+        "GENERATED ALWAYS AS "
+        f"(ln(1 + like_count) + extract(epoch from created_at) / {HOT_SCORE_DECAY}) "
+        "STORED"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_tweets_user_id_hot_score_id "
+        "ON tweets (user_id, hot_score, id)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_tweets_user_id_id ON tweets (user_id, id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweets_user_id_id", table_name="tweets")
+    op.drop_index("ix_tweets_user_id_hot_score_id", table_name="tweets")
+    op.drop_column("tweets", "hot_score")
@@ -0,0 +1,40 @@
+"""add fanout_mode to users
+
+Revision ID: d3c6a9f1e8b2
+Revises: b5e8d2f1c3a7
+Create Date: 2026-10-15 21:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+from server.config import FANOUT_FOLLOWER_THRESHOLD
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d3c6a9f1e8b2"
+down_revision: Union[str, None] = "b5e8d2f1c3a7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Authors at or above the fan-out threshold start in pull mode, matching the
+# timelines backfilled by the previous revision, which skipped their tweets.
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE users "
+        "ADD COLUMN IF NOT EXISTS fanout_mode VARCHAR NOT NULL DEFAULT 'push'"
+    )
+    if FANOUT_FOLLOWER_THRESHOLD > 0:
+        op.execute(
+            "UPDATE users SET fanout_mode = 'pull' "
+            f"WHERE follower_count >= {int(FANOUT_FOLLOWER_THRESHOLD)}"
+        )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "fanout_mode")
@@ -0,0 +1,36 @@
+"""add version to tweets
+
+Revision ID: e2f5b8c1d7a4
+Revises: c7a90e3d4b16
+Create Date: 2026-10-15 16:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e2f5b8c1d7a4"
+down_revision: Union[str, None] = "c7a90e3d4b16"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE SEQUENCE IF NOT EXISTS tweet_version_seq")
+    op.execute(
+        "ALTER TABLE tweets ADD COLUMN IF NOT EXISTS version BIGINT NOT NULL "
+        "DEFAULT nextval('tweet_version_seq')"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_tweets_user_id_version "
+        "ON tweets (user_id, version)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tweets_user_id_version", table_name="tweets")
+    op.drop_column("tweets", "version")
+    op.execute("DROP SEQUENCE IF EXISTS tweet_version_seq")
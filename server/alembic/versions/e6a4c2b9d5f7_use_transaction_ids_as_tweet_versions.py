@@ -0,0 +1,46 @@
+"""use transaction ids as tweet versions
+
+Revision ID: e6a4c2b9d5f7
+Revises: d3c6a9f1e8b2
+Create Date: 2026-10-15 22:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e6a4c2b9d5f7"
+down_revision: Union[str, None] = "d3c6a9f1e8b2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Sequence values were taken before commit, so a version could become visible
+# after a higher one and be skipped by readers. Versions are now the ID of the
+# writing transaction. Existing versions are reset to 0, below every
+# transaction ID; feed versions issued before the upgrade are not comparable
+# and clients should reload their feeds.
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE tweets "
+        "ALTER COLUMN version SET DEFAULT (pg_current_xact_id()::text::bigint)"
+    )
+    op.execute("UPDATE tweets SET version = 0")
+    op.execute("DROP SEQUENCE IF EXISTS tweet_version_seq")
+
+
+def downgrade() -> None:
+    op.execute("CREATE SEQUENCE IF NOT EXISTS tweet_version_seq")
+    op.execute(
+        "SELECT setval('tweet_version_seq', "
+        "greatest((SELECT max(version) FROM tweets), 1))"
+    )
+    op.execute(
+        "ALTER TABLE tweets "
+        "ALTER COLUMN version SET DEFAULT nextval('tweet_version_seq')"
+    )
@@ -0,0 +1,28 @@
+"""add likes tweet_id index
+
+Revision ID: f4a1c9e6b2d8
+Revises: e2f5b8c1d7a4
+Create Date: 2026-10-15 17:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f4a1c9e6b2d8"
+down_revision: Union[str, None] = "e2f5b8c1d7a4"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_likes_tweet_id_id ON likes (tweet_id, id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_likes_tweet_id_id", table_name="likes")
@@ -0,0 +1,44 @@
+"""add owner and created_at to media
+
+Revision ID: f8b3d1a6c9e4
+Revises: e6a4c2b9d5f7
+Create Date: 2026-10-15 23:00:00.000000
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f8b3d1a6c9e4"
+down_revision: Union[str, None] = "e6a4c2b9d5f7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Existing media get the time of the upgrade, so that pending uploads started
+# before it expire MEDIA_PENDING_TTL later. They have no owner and can no longer
+# be completed.
+
+
+def upgrade() -> None:
+    op.execute(
+        "ALTER TABLE media "
+        "ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users (id)"
+    )
+    op.execute(
+        "ALTER TABLE media ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT now()"
+    )
+    op.execute("ALTER TABLE media ALTER COLUMN created_at DROP DEFAULT")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_media_status_created_at "
+        "ON media (status, created_at)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_media_status_created_at", table_name="media")
+    op.drop_column("media", "created_at")
+    op.drop_column("media", "user_id")
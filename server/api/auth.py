@@ -0,0 +1,106 @@
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional, Tuple
+
+
+class Principal(NamedTuple):
+    """
+    Authenticated caller of the API, as much of the user as handlers need.
+
+    Loaded with a projection of two columns instead of a User instance; as a
+    named tuple it has no per-instance __dict__ and is never tracked by a session.
+
+    Attributes:
+        id (int): The ID of the user.
+        name (str): Name of the user.
+    """
+
+    id: int
+    name: str
+
+
+class PrincipalCache:
+    """
+    Per-process cache of API keys resolved to principals, with TTL.
+
+    Unknown keys are cached as well, for a shorter time, so repeated requests
+    with an invalid key do not reach the database. They are kept apart from
+    resolved keys with a smaller bound, so a flood of distinct invalid keys
+    cannot evict the principals of legitimate callers. Within each map, least
+    recently used entries are evicted first. A change of a key in this
+    process evicts it at once, other processes see it after the TTL.
+
+    Params:
+        ttl (float): Lifetime of a resolved key in seconds, 0 disables caching.
+        negative_ttl (float): Lifetime of an unknown key in seconds, 0 disables it.
+        max_entries (int): Upper bound of the number of cached resolved keys.
+        max_negative_entries (int): Upper bound of the number of cached unknown keys.
+        clock (Callable[[], float]): Source of monotonic time.
+
+    Methods:
+        get(api_key): Returns whether the key is cached and its principal.
+        set(api_key, principal): Caches a principal, None for an unknown key.
+        evict(api_key): Drops a key.
+        clear(): Drops all keys.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        negative_ttl: float,
+        max_entries: int,
+        max_negative_entries: int,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.max_negative_entries = max_negative_entries
+        self.clock = clock
+        self.entries: OrderedDict[str, Tuple[float, Principal]] = OrderedDict()
+        self.negative_entries: OrderedDict[str, float] = OrderedDict()
+
+    def get(self, api_key: str) -> Tuple[bool, Optional[Principal]]:
+        now = self.clock()
+        entry = self.entries.get(api_key)
+        if entry is not None:
+            expires_at, principal = entry
+            if expires_at > now:
+                self.entries.move_to_end(api_key)
+                return True, principal
+            del self.entries[api_key]
+
+        expires_at = self.negative_entries.get(api_key)
+        if expires_at is not None:
+            if expires_at > now:
+                self.negative_entries.move_to_end(api_key)
+                return True, None
+            del self.negative_entries[api_key]
+
+        return False, None
+
+    def set(self, api_key: str, principal: Optional[Principal]) -> None:
+        if principal is None:
+            entries, ttl, max_entries = (
+                self.negative_entries,
+                self.negative_ttl,
+                self.max_negative_entries,
+            )
+        else:
+            entries, ttl, max_entries = self.entries, self.ttl, self.max_entries
+        if ttl <= 0 or max_entries <= 0:
+            return
+
+        self.evict(api_key)
+        expires_at = self.clock() + ttl
+        entries[api_key] = expires_at if principal is None else (expires_at, principal)
+        while len(entries) > max_entries:
+            entries.popitem(last=False)
+
+    def evict(self, api_key: str) -> None:
+        self.entries.pop(api_key, None)
+        self.negative_entries.pop(api_key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.negative_entries.clear()
@@ -0,0 +1,413 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Type
+from urllib.parse import urlparse
+from uuid import uuid4
+
+from pydantic import BaseModel
+
+
+logger = logging.getLogger(__name__)
+
+
+class CacheError(Exception):
+    """
+    Raised by cache backends when the storage cannot serve a command.
+    """
+
+
+class CacheBackend(ABC):
+    """
+    Interface of the key-value storage used by response caches.
+
+    Keys are strings, values are bytes and every value has a TTL in seconds.
+    """
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        """
+        Return the value of a key or None if it is missing or expired.
+        """
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        """
+        Store a value under a key.
+        """
+
+    @abstractmethod
+    async def add(self, key: str, value: bytes, ttl: float) -> bytes:
+        """
+        Store a value only if the key is missing and return the stored value.
+        """
+
+    @abstractmethod
+    async def set_many(self, items: Dict[str, bytes], ttl: float) -> None:
+        """
+        Store several values at once.
+        """
+
+    async def add_many(self, items: Dict[str, bytes], ttl: float) -> List[bytes]:
+        """
+        Apply add() to several keys and return the stored values in order.
+        """
+        return [await self.add(key, value, ttl) for key, value in items.items()]
+
+    async def close(self) -> None:
+        """
+        Release resources held by the backend.
+        """
+
+
+class InMemoryCacheBackend(CacheBackend):
+    """
+    Per-process LRU storage with a byte budget and per-key TTL.
+
+    Params:
+        max_bytes (int): Upper bound of the total size of stored values, 0 disables storage.
+        clock (Callable[[], float]): Source of monotonic time.
+
+    Methods:
+        stats(): Returns hit, miss and eviction counters.
+        clear(): Drops all values.
+    """
+
+    def __init__(self, max_bytes: int, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.entries: OrderedDict[str, Tuple[float, bytes]] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    async def get(self, key: str) -> Optional[bytes]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        if len(key) + len(value) > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self._remove(key)
+
+        self.entries[key] = (self.clock() + ttl, value)
+        self.size += len(key) + len(value)
+
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bytes:
+        current = await self.get(key)
+        if current is not None:
+            return current
+
+        await self.set(key, value, ttl)
+        return value
+
+    async def set_many(self, items: Dict[str, bytes], ttl: float) -> None:
+        for key, value in items.items():
+            await self.set(key, value, ttl)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Return cache statistics.
+
+        Returns:
+            Dict[str, int]: Hit, miss and eviction counters and current usage.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self.entries),
+            "bytes": self.size,
+        }
+
+    def _remove(self, key: str) -> None:
+        _, value = self.entries.pop(key)
+        self.size -= len(key) + len(value)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Storage shared between workers, speaking the Redis protocol (RESP).
+
+    Commands are sent over a small pool of connections, several commands of
+    one call are pipelined into a single round-trip.
+
+    Params:
+        url (str): Server address, e.g. "redis://localhost:6379/0".
+        max_connections (int): Upper bound of simultaneously open connections.
+        timeout (float): Timeout of connecting and of one round-trip in seconds.
+    """
+
+    def __init__(self, url: str, max_connections: int = 10, timeout: float = 1.0):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.database = int(parsed.path.lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self.idle: asyncio.LifoQueue = asyncio.LifoQueue()
+        self.slots = asyncio.Semaphore(max_connections)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        (value,) = await self.execute(["GET", key])
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.execute(["SET", key, value, "PX", int(ttl * 1000)])
+
+    async def add(self, key: str, value: bytes, ttl: float) -> bytes:
+        _, current = await self.execute(
+            ["SET", key, value, "PX", int(ttl * 1000), "NX"], ["GET", key]
+        )
+        return value if current is None else current
+
+    async def set_many(self, items: Dict[str, bytes], ttl: float) -> None:
+        if items:
+            await self.execute(
+                *(
+                    ["SET", key, value, "PX", int(ttl * 1000)]
+                    for key, value in items.items()
+                )
+            )
+
+    async def add_many(self, items: Dict[str, bytes], ttl: float) -> List[bytes]:
+        if not items:
+            return []
+
+        commands = []
+        for key, value in items.items():
+            commands.append(["SET", key, value, "PX", int(ttl * 1000), "NX"])
+            commands.append(["GET", key])
+        replies = await self.execute(*commands)
+
+        return [
+            value if current is None else current
+            for value, current in zip(items.values(), replies[1::2])
+        ]
+
+    async def execute(self, *commands: List) -> List:
+        """
+        Send commands in one pipeline and return their replies in order.
+
+        Raises:
+            CacheError: If the server is unreachable or replies with an error.
+        """
+        async with self.slots:
+            connection = None
+            try:
+                connection = await self._acquire()
+                replies = await asyncio.wait_for(
+                    self._round_trip(connection, commands), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                if connection is not None:
+                    connection[1].close()
+                raise CacheError(f"Cache server is unavailable: {e}") from e
+
+            self.idle.put_nowait(connection)
+
+        errors = [reply for reply in replies if isinstance(reply, CacheError)]
+        if errors:
+            raise errors[0]
+        return replies
+
+    async def close(self) -> None:
+        while not self.idle.empty():
+            _, writer = self.idle.get_nowait()
+            writer.close()
+
+    async def _acquire(self):
+        if not self.idle.empty():
+            return self.idle.get_nowait()
+
+        connection = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        setup = []
+        if self.password:
+            setup.append(["AUTH", self.password])
+        if self.database:
+            setup.append(["SELECT", self.database])
+        if setup:
+            for reply in await self._round_trip(connection, setup):
+                if isinstance(reply, CacheError):
+                    connection[1].close()
+                    raise reply
+        return connection
+
+    async def _round_trip(self, connection, commands) -> List:
+        reader, writer = connection
+        writer.write(b"".join(self._encode(command) for command in commands))
+        await writer.drain()
+        return [await self._read_reply(reader) for _ in commands]
+
+    @staticmethod
+    def _encode(command: List) -> bytes:
+        parts = [b"*%d\r\n" % len(command)]
+        for argument in command:
+            if isinstance(argument, str):
+                argument = argument.encode()
+            elif isinstance(argument, int):
+                argument = str(argument).encode()
+            parts.append(b"$%d\r\n%s\r\n" % (len(argument), argument))
+        return b"".join(parts)
+
+    async def _read_reply(self, reader: asyncio.StreamReader):
+        line = await reader.readuntil(b"\r\n")
+        kind, payload = line[:1], line[1:-2]
+
+        if kind == b"+":
+            return payload
+        if kind == b"-":
+            return CacheError(payload.decode())
+        if kind == b":":
+            return int(payload)
+        if kind == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            return (await reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply(reader) for _ in range(length)]
+
+        raise CacheError(f"Unexpected reply from cache server: {line!r}")
+
+
+def create_cache_backend(kind: str, url: str, max_bytes: int) -> CacheBackend:
+    """
+    Create the cache backend selected by configuration.
+
+    Args:
+        kind (str): "memory" for a per-process cache or "redis" for a shared one.
+        url (str): Address of the Redis-compatible server.
+        max_bytes (int): Byte budget of the per-process cache.
+
+    Returns:
+        CacheBackend: The created backend.
+    """
+    if kind == "redis":
+        return RedisCacheBackend(url)
+    if kind == "memory":
+        return InMemoryCacheBackend(max_bytes)
+    raise ValueError(f"Unknown cache backend: {kind}")
+
+
+class ResponseCache:
+    """
+    Cache of encoded responses grouped by scope, e.g. the feed of one user.
+
+    Every scope has a version token, and entries are keyed by it, so
+    invalidating a scope means replacing its token: old entries are never
+    addressed again and expire on their own. Keys also include a hash of the
+    response schema, so a changed response shape never reads entries written
+    by an older deployment. Storage errors are logged and treated as misses.
+
+    Params:
+        backend (CacheBackend): Storage of the entries.
+        namespace (str): Prefix separating caches sharing one backend.
+        response_model (Type[BaseModel]): Model of the cached responses.
+        ttl (float): Lifetime of an entry in seconds.
+
+    Methods:
+        version(scope_id): Returns the current version token of a scope.
+        versions(scope_ids): Returns version tokens of several scopes in one call.
+        get(scope_id, version, key): Returns a stored body or None.
+        set(scope_id, version, key, body): Stores a body.
+        invalidate(scope_ids): Replaces version tokens of scopes.
+    """
+
+    version_ttl = 24 * 60 * 60
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        namespace: str,
+        response_model: Type[BaseModel],
+        ttl: float,
+    ):
+        self.backend = backend
+        schema = json.dumps(response_model.model_json_schema(), sort_keys=True)
+        self.prefix = f"{namespace}:{hashlib.sha1(schema.encode()).hexdigest()[:8]}"
+        self.ttl = ttl
+
+    async def version(self, scope_id: int) -> str:
+        try:
+            token = await self.backend.add(
+                self._version_key(scope_id), uuid4().hex.encode(), self.version_ttl
+            )
+        except CacheError as e:
+            logger.warning("Cache version lookup failed: %s", e)
+            return uuid4().hex
+        return token.decode()
+
+    async def versions(self, scope_ids: Iterable[int]) -> List[str]:
+        tokens = {
+            self._version_key(scope_id): uuid4().hex.encode() for scope_id in scope_ids
+        }
+        try:
+            stored = await self.backend.add_many(tokens, self.version_ttl)
+        except CacheError as e:
+            logger.warning("Cache version lookup failed: %s", e)
+            return [uuid4().hex for _ in tokens]
+        return [token.decode() for token in stored]
+
+    async def get(self, scope_id: int, version: str, key: str) -> Optional[bytes]:
+        try:
+            return await self.backend.get(self._entry_key(scope_id, version, key))
+        except CacheError as e:
+            logger.warning("Cache lookup failed: %s", e)
+            return None
+
+    async def set(self, scope_id: int, version: str, key: str, body: bytes) -> None:
+        try:
+            await self.backend.set(
+                self._entry_key(scope_id, version, key), body, self.ttl
+            )
+        except CacheError as e:
+            logger.warning("Cache store failed: %s", e)
+
+    async def invalidate(self, scope_ids: Iterable[int]) -> None:
+        tokens = {
+            self._version_key(scope_id): uuid4().hex.encode()
+            for scope_id in set(scope_ids)
+        }
+        try:
+            await self.backend.set_many(tokens, self.version_ttl)
+        except CacheError as e:
+            logger.warning("Cache invalidation failed: %s", e)
+
+    def _version_key(self, scope_id: int) -> str:
+        return f"{self.prefix}:{scope_id}:version"
+
+    def _entry_key(self, scope_id: int, version: str, key: str) -> str:
+        return f"{self.prefix}:{scope_id}:{version}:{key}"
@@ -0,0 +1,181 @@
+import random
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import func, update, delete
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import CounterShard
+
+
+class ShardedCounter:
+    """
+    Counter maintained on a model column, optionally spread over shard rows.
+
+    With sharding disabled every change updates the column directly. With
+    sharding enabled a change is added to a random shard row instead, so that
+    concurrent changes of one hot object do not serialize on its row lock.
+    Shards are folded back into the column by compact(); until then the column
+    lags behind and exact values are read with totals().
+
+    Params:
+        column: Integer column holding the counter, e.g. Tweet.like_count.
+        shards (int): Number of shards per object, sharding is disabled below 2.
+        touch (Optional[Dict[str, Any]]): Values of other columns set whenever the counter
+            column is written, e.g. a version bump.
+
+    Methods:
+        add(object_id, delta, db): Changes the counter of an object.
+        totals(object_ids, db): Returns exact counter values for objects.
+        expression(): Returns an SQL expression of the exact counter value.
+        compact(db): Folds all shards into the counter column.
+        lock(db, wait): Takes the lock of the counter for the current transaction.
+    """
+
+    def __init__(self, column, shards: int = 0, touch: Optional[Dict[str, Any]] = None):
+        self.column = column
+        self.model = column.class_
+        self.name = f"{self.model.__tablename__}.{column.key}"
+        self.shards = shards
+        self.touch = touch or {}
+
+    @property
+    def sharded(self) -> bool:
+        return self.shards > 1
+
+    async def add(self, object_id: int, delta: int, db: AsyncSession) -> None:
+        """
+        Change the counter of an object within the current transaction.
+
+        Args:
+            object_id (int): Primary key of the object.
+            delta (int): Change of the counter.
+            db (AsyncSession): Database session.
+        """
+        if not self.sharded:
+            await db.execute(
+                update(self.model)
+                .where(self.model.id == object_id)
+                .values({self.column.key: self.column + delta, **self.touch})
+            )
+            return
+
+        statement = insert(CounterShard).values(
+            counter=self.name,
+            object_id=object_id,
+            shard=random.randrange(self.shards),
+            value=delta,
+        )
+        await db.execute(
+            statement.on_conflict_do_update(
+                constraint="unique_counter_shard",
+                set_={"value": CounterShard.value + statement.excluded.value},
+            )
+        )
+
+    async def totals(
+        self, object_ids: Iterable[int], db: AsyncSession
+    ) -> Dict[int, int]:
+        """
+        Read exact counter values, including not yet compacted shards.
+
+        Args:
+            object_ids (Iterable[int]): Primary keys of the objects.
+            db (AsyncSession): Database session.
+
+        Returns:
+            Dict[int, int]: Counter value by object ID.
+        """
+        object_ids = list(object_ids)
+        if not object_ids:
+            return {}
+
+        totals_query = await db.execute(
+            select(self.model.id, self.expression()).where(
+                self.model.id.in_(object_ids)
+            )
+        )
+        return dict(totals_query.all())
+
+    def expression(self):
+        """
+        Build an SQL expression of the exact counter value of a row of the model.
+
+        Returns:
+            The counter column, plus the sum of its shards when sharding is enabled.
+        """
+        if not self.sharded:
+            return self.column
+
+        shard_sum = (
+            select(func.coalesce(func.sum(CounterShard.value), 0))
+            .where(
+                CounterShard.counter == self.name,
+                CounterShard.object_id == self.model.id,
+            )
+            .scalar_subquery()
+        )
+        return self.column + shard_sum
+
+    async def lock(self, db: AsyncSession, wait: bool = False) -> bool:
+        """
+        Take the advisory lock of the counter until the end of the transaction.
+
+        Writers of the column other than add(), such as compaction and
+        recounts, hold it so that they do not overwrite each other's changes.
+
+        Args:
+            db (AsyncSession): Database session.
+            wait (bool): Whether to wait for the lock instead of giving up.
+
+        Returns:
+            bool: True if the lock was taken.
+        """
+        key = func.hashtext(self.name)
+        if wait:
+            await db.execute(select(func.pg_advisory_xact_lock(key)))
+            return True
+        locked = await db.execute(select(func.pg_try_advisory_xact_lock(key)))
+        return locked.scalar()
+
+    async def compact(self, db: AsyncSession) -> int:
+        """
+        Fold all shards of the counter into the column and commit.
+
+        Shard rows are deleted and their values added to the column in one
+        statement, so changes made concurrently land in new shards and are not lost.
+        A transaction-level advisory lock per counter lets only one worker
+        compact at a time; the others skip the round instead of updating the
+        same rows in a different order and deadlocking.
+
+        Args:
+            db (AsyncSession): Database session.
+
+        Returns:
+            int: Number of objects whose column was updated, 0 if another worker
+                is compacting the counter.
+        """
+        if not await self.lock(db):
+            await db.rollback()
+            return 0
+
+        drained = (
+            delete(CounterShard)
+            .where(CounterShard.counter == self.name)
+            .returning(CounterShard.object_id, CounterShard.value)
+            .cte("drained")
+        )
+        sums = (
+            select(drained.c.object_id, func.sum(drained.c.value).label("value"))
+            .group_by(drained.c.object_id)
+            .cte("sums")
+        )
+        result = await db.execute(
+            update(self.model)
+            .where(self.model.id == sums.c.object_id)
+            .values({self.column.key: self.column + sums.c.value, **self.touch})
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        return result.rowcount
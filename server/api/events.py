@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+from contextlib import suppress
+from typing import AsyncIterator, Dict, Iterable, Optional, Set
+
+import asyncpg
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """
+    Bounded queue of feed events of one connected client.
+
+    When the client falls behind and the queue is full, pending events are
+    replaced by a single "resync" event telling the client to reload its feed.
+
+    Params:
+        author_ids (Iterable[int]): Authors whose events are delivered.
+        max_size (int): Maximum number of pending events.
+    """
+
+    __slots__ = ("author_ids", "queue")
+
+    def __init__(self, author_ids: Iterable[int], max_size: int):
+        self.author_ids = frozenset(author_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(max_size)
+
+    def put(self, event: Dict) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({"type": "resync"})
+
+    async def get(self) -> Dict:
+        return await self.queue.get()
+
+
+class EventHub:
+    """
+    In-process pub/sub of feed events, shared by all workers through Postgres.
+
+    Events are published with pg_notify() inside the writing transaction, so
+    they are delivered only if the transaction commits. Every worker keeps one
+    LISTEN connection and dispatches received events to the subscriptions of
+    the event's author; a connected client costs one subscription and the
+    coroutine waiting on it.
+
+    Params:
+        channel (str): Name of the Postgres notification channel.
+        queue_size (int): Maximum number of pending events per subscription.
+
+    Methods:
+        publish(event, db): Sends an event when the transaction of db commits.
+        subscribe(author_ids): Registers a subscription to events of authors.
+        unsubscribe(subscription): Removes a subscription.
+        start(database_url, timeout): Starts listening for notifications.
+        stop(): Stops listening.
+    """
+
+    reconnect_delay = 1.0
+
+    def __init__(self, channel: str, queue_size: int):
+        self.channel = channel
+        self.queue_size = queue_size
+        self.subscriptions: Dict[int, Set[Subscription]] = {}
+        self.listener: Optional[asyncio.Task] = None
+
+    async def publish(self, event: Dict, db: AsyncSession) -> None:
+        await db.execute(select(func.pg_notify(self.channel, json.dumps(event))))
+
+    def subscribe(self, author_ids: Iterable[int]) -> Subscription:
+        subscription = Subscription(author_ids, self.queue_size)
+        for author_id in subscription.author_ids:
+            self.subscriptions.setdefault(author_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for author_id in subscription.author_ids:
+            subscribers = self.subscriptions.get(author_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self.subscriptions[author_id]
+
+    def dispatch(self, event: Dict) -> None:
+        """
+        Deliver an event to the subscriptions of its author in this process.
+        """
+        for subscription in self.subscriptions.get(event.get("author_id"), ()):
+            subscription.put(event)
+
+    async def start(self, database_url: str, timeout: Optional[float] = None) -> None:
+        """
+        Start the listener and wait up to `timeout` seconds for its connection.
+
+        If the database cannot be reached in time, the worker starts without
+        live events: the listener keeps reconnecting in the background and
+        sends "resync" to all subscriptions once it is connected, so clients
+        reload the feed they could only poll meanwhile.
+        """
+        if self.listener is not None:
+            return
+
+        connected = asyncio.Event()
+        self.listener = asyncio.create_task(
+            self._listen(database_url, connected, timeout)
+        )
+        try:
+            await asyncio.wait_for(connected.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Feed event listener not connected after %s s, starting without it",
+                timeout,
+            )
+
+    async def stop(self) -> None:
+        if self.listener is None:
+            return
+
+        self.listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await self.listener
+        self.listener = None
+
+    async def _listen(
+        self,
+        database_url: str,
+        connected: asyncio.Event,
+        timeout: Optional[float] = None,
+    ) -> None:
+        url = make_url(database_url).set(drivername="postgresql")
+        dsn = url.render_as_string(hide_password=False)
+
+        missed = False
+        while True:
+            try:
+                connection = await asyncpg.connect(dsn, timeout=timeout or 60)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                logger.warning("Feed event listener cannot connect: %s", e)
+                missed = True
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            closed = asyncio.Event()
+            connection.add_termination_listener(lambda _: closed.set())
+            failed = False
+            try:
+                await connection.add_listener(self.channel, self._on_notification)
+                connected.set()
+                if missed:
+                    self._resync_all()
+                    missed = False
+                await closed.wait()
+                logger.warning("Feed event listener lost its connection")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning("Feed event listener failed: %s", e)
+                failed = True
+            finally:
+                await connection.close()
+            missed = True
+            if failed:
+                await asyncio.sleep(self.reconnect_delay)
+
+    def _resync_all(self) -> None:
+        """
+        Tell every subscription that events may have been missed.
+        """
+        for subscribers in list(self.subscriptions.values()):
+            for subscription in subscribers:
+                subscription.put({"type": "resync"})
+
+    def _on_notification(self, connection, pid, channel, payload) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Malformed feed event: %r", payload)
+            return
+        self.dispatch(event)
+
+
+async def encode_events(
+    subscription: Subscription, keepalive: float
+) -> AsyncIterator[bytes]:
+    """
+    Encode the events of a subscription as a Server-Sent Events stream.
+
+    A comment line is sent after `keepalive` seconds without events, so
+    proxies do not close an idle connection.
+
+    Args:
+        subscription (Subscription): The subscription to read events from.
+        keepalive (float): Interval of keepalive comments in seconds.
+
+    Yields:
+        bytes: Encoded events.
+    """
+    while True:
+        try:
+            event = await asyncio.wait_for(subscription.get(), keepalive)
+        except asyncio.TimeoutError:
+            yield b": keepalive\n\n"
+            continue
+        yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
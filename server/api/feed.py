@@ -0,0 +1,500 @@
+import json
+from typing import (
+    AsyncIterator,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from sqlalchemy import Select, func, tuple_, union
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from .models import Tweet, Like, User, Timeline, Follow, xid_bigint
+from .ranking import RankingStrategy
+from .reads import TWEET_ROW_COLUMNS, TweetRow, fetch_rows
+from .schemas import TweetOut, TweetPreviewOut, UserOut, Like as LikeOut
+from .services import encode_cursor, like_counter
+
+
+class LikesPreview(NamedTuple):
+    """
+    Request to render likes of tweets as a preview instead of full lists.
+
+    Attributes:
+        size (int): Number of first likers included with each tweet.
+        viewer_id (int): The ID of the reader, used for the liked_by_me flag.
+    """
+
+    size: int
+    viewer_id: int
+
+
+class UserIdentityMap:
+    """
+    Per-request map of user IDs to their public representation.
+
+    Users referenced by a feed (authors and likers) are collected first and
+    resolved with a single query, so hydration cost does not depend on the
+    number of likes.
+
+    Params:
+        db (AsyncSession): Database session used to resolve users.
+        backend (str): Read backend of the query, see fetch_rows().
+    """
+
+    def __init__(self, db: AsyncSession, backend: str = "orm"):
+        self.db = db
+        self.backend = backend
+        self.users: Dict[int, UserOut] = {}
+
+    async def load(self, user_ids: Iterable[int]) -> None:
+        """
+        Resolve all not yet known users in one query.
+
+        Args:
+            user_ids (Iterable[int]): IDs of the users to resolve.
+        """
+        missing = set(user_ids) - self.users.keys()
+        if not missing:
+            return
+
+        users_query = await fetch_rows(
+            select(User.id, User.name).where(User.id.in_(missing)),
+            self.db,
+            self.backend,
+        )
+        for user_id, name in users_query:
+            self.users[user_id] = UserOut(id=user_id, name=name)
+
+    def __getitem__(self, user_id: int) -> UserOut:
+        return self.users[user_id]
+
+
+def feed_watermark_column():
+    """
+    Build an expression of the feed version of a statement: the xmin of its snapshot.
+
+    Tweet.version is the ID of the transaction that last wrote the tweet, and
+    every transaction with an ID below the snapshot's xmin has ended before
+    the statement, so its changes are visible to it. Transactions still in
+    progress, and those starting later, have IDs at or above it, whatever
+    order they commit in, so changes since this version include every change
+    the statement could not see; tweets it did see may be returned again.
+
+    Returns:
+        Expression of the feed version as bigint.
+    """
+    return xid_bigint(func.pg_snapshot_xmin(func.pg_current_snapshot()))
+
+
+def feed_page_query(
+    user_id: int,
+    pull_authors: Sequence[int],
+    ranking: RankingStrategy,
+    limit: int,
+    after: Optional[Tuple[float, int]],
+    with_version: bool = False,
+    columns: Optional[Sequence] = None,
+) -> Select:
+    """
+    Build the query of one page of a user's feed ordered by (score, tweet id) descending.
+
+    Tweets come from the user's materialized timeline merged with the tweets
+    of followed pull-mode authors, which are not fanned out on write. Each
+    source is cut to the page size on its own before the merge.
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        pull_authors (Sequence[int]): IDs of followed authors merged at read time.
+        ranking (RankingStrategy): Strategy providing the score column.
+        limit (int): Maximum number of tweets to select.
+        after (Optional[Tuple[float, int]]): Sort key of the last tweet of the previous page.
+        with_version (bool): Whether to add the feed version as the last column.
+        columns (Optional[Sequence]): Columns to select instead of Tweet entities.
+
+    Returns:
+        Select: Query selecting Tweet entities or the columns of the page in feed order.
+    """
+    sources = [
+        select(Tweet.id)
+        .join(Timeline, Timeline.tweet_id == Tweet.id)
+        .where(Timeline.user_id == user_id)
+    ]
+    if pull_authors:
+        sources.append(select(Tweet.id).where(Tweet.user_id.in_(pull_authors)))
+
+    order = (ranking.column.desc(), Tweet.id.desc())
+    if after is not None:
+        sources = [
+            source.where(tuple_(ranking.column, Tweet.id) < tuple_(*after))
+            for source in sources
+        ]
+    sources = [source.order_by(*order).limit(limit) for source in sources]
+
+    if len(sources) == 1:
+        page_ids = sources[0].subquery()
+    else:
+        page_ids = union(*sources).subquery()
+
+    query = (
+        select(*(columns or [Tweet]))
+        .where(Tweet.id.in_(select(page_ids.c.id)))
+        .order_by(*order)
+        .limit(limit)
+        .execution_options(populate_existing=True)
+    )
+    if with_version:
+        query = query.add_columns(feed_watermark_column())
+    return query
+
+
+async def select_feed_page(
+    user_id: int,
+    pull_authors: Sequence[int],
+    ranking: RankingStrategy,
+    limit: int,
+    after: Optional[Tuple[float, int]],
+    db: AsyncSession,
+) -> List[Tweet]:
+    """
+    Select one page of a user's feed, see feed_page_query().
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        pull_authors (Sequence[int]): IDs of followed authors merged at read time.
+        ranking (RankingStrategy): Strategy providing the score column.
+        limit (int): Maximum number of tweets to select.
+        after (Optional[Tuple[float, int]]): Sort key of the last tweet of the previous page.
+        db (AsyncSession): Database session.
+
+    Returns:
+        List[Tweet]: Tweets of the page in feed order.
+    """
+    tweets = await db.execute(
+        feed_page_query(user_id, pull_authors, ranking, limit, after)
+    )
+    return tweets.scalars().all()
+
+
+async def select_first_feed_page(
+    user_id: int,
+    pull_authors: Sequence[int],
+    ranking: RankingStrategy,
+    limit: int,
+    db: AsyncSession,
+) -> Tuple[List[Tweet], int]:
+    """
+    Select the first page of a user's feed together with the feed version.
+
+    The version is read in the same statement and snapshot as the page, see
+    feed_watermark_column(). A feed without tweets has version 0.
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        pull_authors (Sequence[int]): IDs of followed authors merged at read time.
+        ranking (RankingStrategy): Strategy providing the score column.
+        limit (int): Maximum number of tweets to select.
+        db (AsyncSession): Database session.
+
+    Returns:
+        Tuple[List[Tweet], int]: Tweets of the page in feed order and the feed version.
+    """
+    rows = await db.execute(
+        feed_page_query(user_id, pull_authors, ranking, limit, None, with_version=True)
+    )
+    rows = rows.all()
+    return [tweet for tweet, _ in rows], rows[0][1] if rows else 0
+
+
+async def read_feed_page(
+    user_id: int,
+    pull_authors: Sequence[int],
+    ranking: RankingStrategy,
+    limit: int,
+    after: Optional[Tuple[float, int]],
+    db: AsyncSession,
+    backend: str,
+) -> Tuple[List[TweetRow], Optional[int]]:
+    """
+    Select one page of a user's feed as plain rows, without the ORM.
+
+    Same query as select_feed_page() and select_first_feed_page(), but only
+    the columns needed for rendering are read, and no objects enter the
+    session's identity map.
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        pull_authors (Sequence[int]): IDs of followed authors merged at read time.
+        ranking (RankingStrategy): Strategy providing the score column.
+        limit (int): Maximum number of tweets to select.
+        after (Optional[Tuple[float, int]]): Sort key of the last tweet of the previous page.
+        db (AsyncSession): Database session.
+        backend (str): "core" or "raw", see fetch_rows().
+
+    Returns:
+        Tuple[List[TweetRow], Optional[int]]: Tweets of the page in feed order and,
+            for the first page, the feed version.
+    """
+    with_version = after is None
+    rows = await fetch_rows(
+        feed_page_query(
+            user_id,
+            pull_authors,
+            ranking,
+            limit,
+            after,
+            with_version,
+            columns=[getattr(Tweet, name) for name in TWEET_ROW_COLUMNS],
+        ),
+        db,
+        backend,
+    )
+    tweets = [TweetRow(*row[: len(TWEET_ROW_COLUMNS)]) for row in rows]
+    if not with_version:
+        return tweets, None
+    return tweets, rows[0][-1] if rows else 0
+
+
+async def select_feed_changes(
+    user_id: int,
+    since_version: int,
+    limit: int,
+    after: Optional[Tuple[int, int]],
+    watermark: Optional[int],
+    db: AsyncSession,
+) -> Tuple[List[Tweet], int]:
+    """
+    Select tweets of a user's feed created or changed since a feed version.
+
+    Tweets of followed authors are looked up by (user_id, version) in
+    ix_tweets_user_id_version, so the cost depends on the number of followed
+    authors and of changes, not on the size of the feed. Since versions are
+    transaction IDs, several tweets can share one, so the changes are paged
+    by keyset on (version, tweet id). The new feed version is read before
+    the first page, see feed_watermark_column(), and holds for all its pages.
+    Deleted tweets are not reported.
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        since_version (int): Feed version the client already has.
+        limit (int): Maximum number of tweets to select.
+        after (Optional[Tuple[int, int]]): Version and ID of the last tweet of the
+            previous page of the same changes.
+        watermark (Optional[int]): New feed version read with the first page of the
+            same changes, read now if omitted.
+        db (AsyncSession): Database session.
+
+    Returns:
+        Tuple[List[Tweet], int]: Changed tweets ordered by (version, id) and the new
+            feed version.
+    """
+    if watermark is None:
+        watermark = (await db.execute(select(feed_watermark_column()))).scalar()
+
+    changes = select(Tweet).where(
+        Tweet.user_id.in_(select(Follow.follower_id).where(Follow.user_id == user_id)),
+        Tweet.version >= since_version,
+    )
+    if after is not None:
+        changes = changes.where(tuple_(Tweet.version, Tweet.id) > tuple_(*after))
+    tweets = await db.execute(
+        changes.order_by(Tweet.version, Tweet.id)
+        .limit(limit)
+        .execution_options(populate_existing=True)
+    )
+    return tweets.scalars().all(), watermark
+
+
+async def stream_feed_page(
+    session_factory: sessionmaker,
+    user_id: int,
+    pull_authors: Sequence[int],
+    ranking: RankingStrategy,
+    limit: int,
+    after: Optional[Tuple[float, int]],
+    batch_size: int,
+    preview: Optional[LikesPreview] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Encode one page of a user's feed as a TweetResponse body, batch by batch.
+
+    Tweets are read through a server-side cursor, hydrated and encoded
+    batch_size at a time and dropped from the session afterwards, so memory
+    per request is bounded by the batch size instead of the page size. The
+    encoded bytes are identical to TweetResponse.model_dump_json(), the first
+    page carries the feed version as in select_first_feed_page().
+
+    The generator runs after the request dependencies are closed and uses
+    its own session.
+
+    Args:
+        session_factory (sessionmaker): Factory of the session used for the page.
+        user_id (int): The ID of the user reading the feed.
+        pull_authors (Sequence[int]): IDs of followed authors merged at read time.
+        ranking (RankingStrategy): Strategy providing the score column.
+        limit (int): Maximum number of tweets on the page.
+        after (Optional[Tuple[float, int]]): Sort key of the last tweet of the previous page.
+        batch_size (int): Number of tweets fetched and encoded at a time.
+        preview (Optional[LikesPreview]): Render likes as a preview instead of full lists.
+
+    Yields:
+        bytes: Consecutive parts of the response body.
+    """
+    async with session_factory() as db:
+        with_version = after is None
+        rows = await db.stream(
+            feed_page_query(
+                user_id, pull_authors, ranking, limit + 1, after, with_version
+            ).execution_options(yield_per=batch_size)
+        )
+
+        yield b'{"result":true,"tweets":['
+        sent = 0
+        last = None
+        has_more = False
+        version = 0 if with_version else None
+        async for partition in rows.partitions():
+            batch = [row[0] for row in partition]
+            if with_version:
+                version = partition[0][1]
+            if sent + len(batch) > limit:
+                has_more = True
+                batch = batch[: limit - sent]
+            if not batch:
+                break
+
+            rendered = await hydrate_tweets(batch, db, preview=preview)
+            chunk = b",".join(tweet.model_dump_json().encode() for tweet in rendered)
+            yield (b"," + chunk) if sent else chunk
+
+            sent += len(batch)
+            last = (ranking.score_of(batch[-1]), batch[-1].id)
+            db.expunge_all()
+        await rows.close()
+
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor(ranking.name, *last)
+    yield (
+        b'],"next_cursor":'
+        + json.dumps(next_cursor).encode()
+        + b',"version":'
+        + json.dumps(version).encode()
+        + b"}"
+    )
+
+
+async def hydrate_tweets(
+    tweets: Sequence[Tweet],
+    db: AsyncSession,
+    identity_map: Optional[UserIdentityMap] = None,
+    preview: Optional[LikesPreview] = None,
+    backend: str = "orm",
+) -> List[TweetOut]:
+    """
+    Build response models for a page of tweets with a fixed number of queries.
+
+    Likes of all tweets are fetched with one query and every referenced user
+    with one more, regardless of how many likes the tweets have. With a
+    preview, only the first likers of every tweet and the reader's own likes
+    are fetched, so the cost no longer grows with the number of likes, and
+    tweets are TweetPreviewOut carrying like_count and liked_by_me instead.
+
+    Args:
+        tweets (Sequence[Tweet]): Tweets to render, in feed order.
+        db (AsyncSession): Database session.
+        identity_map (Optional[UserIdentityMap]): Map shared with other builders of the
+            same request, a new one is created if omitted.
+        preview (Optional[LikesPreview]): Render likes as a preview instead of full lists.
+        backend (str): Read backend of the queries, see fetch_rows().
+
+    Returns:
+        List[TweetOut]: Rendered tweets in the same order.
+    """
+    if not tweets:
+        return []
+
+    if identity_map is None:
+        identity_map = UserIdentityMap(db, backend)
+
+    tweet_ids = [tweet.id for tweet in tweets]
+    likes_by_tweet: Dict[int, List[int]] = {}
+    liked_by_viewer = set()
+    if preview is None:
+        likes_query = await fetch_rows(
+            select(Like.tweet_id, Like.user_id)
+            .where(Like.tweet_id.in_(tweet_ids))
+            .order_by(Like.id),
+            db,
+            backend,
+        )
+        for tweet_id, user_id in likes_query:
+            likes_by_tweet.setdefault(tweet_id, []).append(user_id)
+    else:
+        ranked = (
+            select(
+                Like.id,
+                Like.tweet_id,
+                Like.user_id,
+                func.row_number()
+                .over(partition_by=Like.tweet_id, order_by=Like.id)
+                .label("position"),
+            )
+            .where(Like.tweet_id.in_(tweet_ids))
+            .subquery()
+        )
+        likes_query = await fetch_rows(
+            select(ranked.c.tweet_id, ranked.c.user_id, ranked.c.position)
+            .where(
+                (ranked.c.position <= preview.size)
+                | (ranked.c.user_id == preview.viewer_id)
+            )
+            .order_by(ranked.c.id),
+            db,
+            backend,
+        )
+        for tweet_id, user_id, position in likes_query:
+            if position <= preview.size:
+                likes_by_tweet.setdefault(tweet_id, []).append(user_id)
+            if user_id == preview.viewer_id:
+                liked_by_viewer.add(tweet_id)
+
+        if like_counter.sharded:
+            like_counts = await like_counter.totals(tweet_ids, db)
+        else:
+            like_counts = {tweet.id: tweet.like_count for tweet in tweets}
+
+    await identity_map.load(
+        [tweet.user_id for tweet in tweets]
+        + [user_id for likers in likes_by_tweet.values() for user_id in likers]
+    )
+
+    rendered = []
+    for tweet in tweets:
+        fields = dict(
+            id=tweet.id,
+            content=tweet.content,
+            attachments=tweet.attachment if tweet.attachment else [],
+            user=identity_map[tweet.user_id],
+            likes=[
+                LikeOut(user_id=user_id, name=identity_map[user_id].name)
+                for user_id in likes_by_tweet.get(tweet.id, [])
+            ],
+        )
+        if preview is None:
+            rendered.append(TweetOut(**fields))
+        else:
+            rendered.append(
+                TweetPreviewOut(
+                    **fields,
+                    like_count=like_counts[tweet.id],
+                    liked_by_me=tweet.id in liked_by_viewer,
+                )
+            )
+    return rendered
@@ -0,0 +1,157 @@
+import json
+from typing import Optional, Sequence, Tuple
+
+from sqlalchemy import Text, cast, exists, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from .feed import LikesPreview, feed_page_query, feed_watermark_column
+from .models import Like, User
+from .ranking import RankingStrategy
+from .services import encode_cursor, like_counter
+
+
+EMPTY_JSON_ARRAY = literal_column("'[]'::json")
+
+
+def likes_json_column(tweet_id, preview: Optional[LikesPreview]):
+    """
+    Build a scalar subquery of the JSON array of likers of a tweet, in like order.
+    """
+    liker = aliased(User, name="liker")
+    likes = (
+        select(Like.id, Like.user_id, liker.name)
+        .join(liker, liker.id == Like.user_id)
+        .where(Like.tweet_id == tweet_id)
+        .order_by(Like.id)
+        .correlate_except(Like, liker)
+    )
+    if preview is not None:
+        likes = likes.limit(preview.size)
+    likes = likes.subquery("tweet_likes")
+
+    like_json = func.json_build_object("user_id", likes.c.user_id, "name", likes.c.name)
+    return func.coalesce(
+        select(func.json_agg(aggregate_order_by(like_json, likes.c.id)))
+        .select_from(likes)
+        .scalar_subquery(),
+        EMPTY_JSON_ARRAY,
+    )
+
+
+async def render_feed_page(
+    user_id: int,
+    pull_authors: Sequence[int],
+    ranking: RankingStrategy,
+    limit: int,
+    after: Optional[Tuple[float, int]],
+    db: AsyncSession,
+    preview: Optional[LikesPreview] = None,
+) -> bytes:
+    """
+    Render one page of a user's feed as a TweetResponse body in a single statement.
+
+    Postgres selects the page as in feed_page_query() and assembles the JSON
+    of the tweets with their authors, attachments and likers using
+    json_build_object() and json_agg(); the text is passed to the client
+    without ORM objects or Pydantic models. The body has the same structure
+    as TweetResponse.model_dump_json(), only the whitespace differs.
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        pull_authors (Sequence[int]): IDs of followed authors merged at read time.
+        ranking (RankingStrategy): Strategy providing the score column.
+        limit (int): Maximum number of tweets on the page.
+        after (Optional[Tuple[float, int]]): Sort key of the last tweet of the previous page.
+        db (AsyncSession): Database session.
+        preview (Optional[LikesPreview]): Render likes as a preview instead of full lists.
+
+    Returns:
+        bytes: The encoded response.
+    """
+    page = feed_page_query(user_id, pull_authors, ranking, limit + 1, after)
+    if preview is not None:
+        page = page.add_columns(like_counter.expression().label("like_total"))
+    page = page.subquery("page")
+
+    score = page.c[ranking.column.key]
+    ranked = select(
+        page,
+        func.row_number()
+        .over(order_by=(score.desc(), page.c.id.desc()))
+        .label("position"),
+    ).subquery("ranked")
+    score = ranked.c[ranking.column.key]
+
+    # Tweets without a preview have no like_count and liked_by_me, see TweetOut.
+    preview_fields = []
+    if preview is not None:
+        liked_by_me = exists().where(
+            Like.tweet_id == ranked.c.id, Like.user_id == preview.viewer_id
+        )
+        preview_fields = ["like_count", ranked.c.like_total, "liked_by_me", liked_by_me]
+
+    author = aliased(User, name="author")
+    tweet_json = func.json_build_object(
+        "content",
+        ranked.c.content,
+        "id",
+        ranked.c.id,
+        "attachments",
+        func.coalesce(func.to_json(ranked.c.attachment), EMPTY_JSON_ARRAY),
+        "user",
+        func.json_build_object("id", author.id, "name", author.name),
+        "likes",
+        likes_json_column(ranked.c.id, preview),
+        *preview_fields,
+    )
+    on_page = ranked.c.position <= limit
+    last = ranked.c.position == limit
+
+    columns = [
+        cast(
+            func.coalesce(
+                func.json_agg(aggregate_order_by(tweet_json, ranked.c.position)).filter(
+                    on_page
+                ),
+                EMPTY_JSON_ARRAY,
+            ),
+            Text,
+        ),
+        func.count(),
+        func.max(score).filter(last),
+        func.max(ranked.c.id).filter(last),
+    ]
+    if after is None:
+        columns.append(feed_watermark_column())
+
+    row = (
+        await db.execute(
+            select(*columns).select_from(
+                ranked.join(author, author.id == ranked.c.user_id)
+            )
+        )
+    ).one()
+    tweets, selected, last_score, last_id = row[:4]
+    version = None
+    if after is None:
+        # Like select_first_feed_page(), a feed without tweets has version 0.
+        version = row[4] if selected else 0
+
+    next_cursor = None
+    if selected > limit:
+        next_cursor = encode_cursor(ranking.name, last_score, last_id)
+
+    return b"".join(
+        [
+            b'{"result":true,"tweets":',
+            tweets.encode(),
+            b',"next_cursor":',
+            json.dumps(next_cursor).encode(),
+            b',"version":',
+            json.dumps(version).encode(),
+            b"}",
+        ]
+    )
@@ -1,24 +1,61 @@
-from contextlib import asynccontextmanager
+import asyncio
+import logging
+import random
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime
+from typing import Optional
 
 
+from aiobotocore.config import AioConfig
 from aiobotocore.session import get_session
-from botocore.exceptions import ClientError
+from botocore.exceptions import BotoCoreError, ClientError
 from sqlalchemy import (
     Column,
     Integer,
+    BigInteger,
+    Float,
     String,
     Text,
     ARRAY,
     DateTime,
     ForeignKey,
+    Index,
     UniqueConstraint,
+    Computed,
+    cast,
+    text,
 )
 from sqlalchemy.orm import relationship, backref
 
 from server.database.db_connection import Base
 
 
+logger = logging.getLogger(__name__)
+
+# Error codes S3 answers with 4xx statuses that are worth a retry.
+TRANSIENT_ERROR_CODES = frozenset({"RequestTimeout", "SlowDown", "Throttling"})
+
+
+# Media is "pending" from issuing a presigned upload URL until the upload is completed.
+MEDIA_PENDING = "pending"
+MEDIA_READY = "ready"
+
+# Tweets of "push" authors are fanned out to timelines on write, those of
+# "pull" authors are merged into feeds at read time.
+FANOUT_PUSH = "push"
+FANOUT_PULL = "pull"
+
+# Time constant of the exponential decay of tweet scores, in seconds.
+HOT_SCORE_DECAY = 12 * 60 * 60
+
+
+def xid_bigint(xid):
+    """
+    Cast an xid8 expression, e.g. pg_current_xact_id(), to bigint like Tweet.version.
+    """
+    return cast(cast(xid, Text), BigInteger)
+
+
 class Tweet(Base):
     """
     Model representing tweets in the system.
@@ -29,6 +66,10 @@ class Tweet(Base):
         attachment (ARRAY[str]): An array of strings, storing media file links.
         user_id (int): Foreign key referring to the user who created the tweet.
         created_at (datetime): The timestamp when the tweet was created, defaults to current time.
+        like_count (int): Number of likes, maintained together with the likes table.
+        hot_score (float): Like count with exponential time decay, generated by the database.
+        version (int): ID of the transaction that created the tweet or last changed
+            its like_count, used to return changes since a feed version.
     """
 
     __tablename__ = "tweets"
@@ -37,9 +78,29 @@ class Tweet(Base):
     attachment = Column(ARRAY(String))
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    like_count = Column(Integer, nullable=False, default=0, server_default="0")
+    hot_score = Column(
+        Float,
+        Computed(
+            f"ln(1 + like_count) + extract(epoch from created_at) / {HOT_SCORE_DECAY}"
+        ),
+    )
+
+    version = Column(
+        BigInteger,
+        nullable=False,
+        server_default=text("(pg_current_xact_id()::text::bigint)"),
+    )
 
     user = relationship("User", backref=backref("tweets", lazy=True))
 
+    __table_args__ = (
+        Index("ix_tweets_user_id_like_count_id", "user_id", "like_count", "id"),
+        Index("ix_tweets_user_id_hot_score_id", "user_id", "hot_score", "id"),
+        Index("ix_tweets_user_id_id", "user_id", "id"),
+        Index("ix_tweets_user_id_version", "user_id", "version"),
+    )
+
 
 class User(Base):
     """
@@ -52,6 +113,8 @@ class User(Base):
         name (str): Real name of the user.
         email (str): Email address of the user (unique).
         created_at (datetime): Timestamp when the user was created.
+        follower_count (int): Number of followers, maintained together with the followers table.
+        fanout_mode (str): FANOUT_PUSH or FANOUT_PULL, switched when the author tweets.
     """
 
     __tablename__ = "users"
@@ -61,6 +124,10 @@ class User(Base):
     name = Column(String(50), nullable=False)
     email = Column(String(50), unique=True, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    follower_count = Column(Integer, nullable=False, default=0, server_default="0")
+    fanout_mode = Column(
+        String, nullable=False, default=FANOUT_PUSH, server_default=FANOUT_PUSH
+    )
 
 
 class Like(Base):
@@ -82,6 +149,8 @@ class Like(Base):
     user = relationship("User", backref=backref("likes", lazy=True))
     tweet = relationship("Tweet", backref=backref("likes", lazy=True))
 
+    __table_args__ = (Index("ix_likes_tweet_id_id", "tweet_id", "id"),)
+
 
 class Follow(Base):
     """
@@ -116,18 +185,88 @@ class Media(Base):
     Attributes:
         id (int): Unique identifier for the media file.
         file_link (str): Link to the media file stored in S3.
+        object_key (str): Key of the file in the bucket.
+        status (str): MEDIA_READY, or MEDIA_PENDING until a direct upload is completed.
         tweet_id (int): Foreign key referring to the tweet the media is attached to.
+        user_id (int): Foreign key referring to the user who started a direct upload.
+        created_at (datetime): The timestamp when the media was created.
     """
 
     __tablename__ = "media"
 
     id = Column(Integer, autoincrement=True, primary_key=True)
     file_link = Column(String)
+    object_key = Column(String)
+    status = Column(
+        String, nullable=False, default=MEDIA_READY, server_default=MEDIA_READY
+    )
     tweet_id = Column(Integer, ForeignKey("tweets.id"))
+    user_id = Column(Integer, ForeignKey("users.id"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_media_status_created_at", "status", "created_at"),)
 
     tweet = relationship("Tweet", backref=backref("media_files", lazy=True))
 
 
+class Timeline(Base):
+    """
+    Model representing materialized home timeline entries.
+
+    Each row places one tweet into the feed of one reader. Rows are written
+    when a tweet is posted (fan-out on write) and when a follow is created,
+    so that the feed is read with a single range scan over the reader's entries.
+
+    Attributes:
+        id (int): Unique identifier for the timeline entry.
+        user_id (int): Foreign key referring to the user who owns the timeline.
+        tweet_id (int): Foreign key referring to the tweet placed into the timeline.
+        author_id (int): Foreign key referring to the author of the tweet.
+    """
+
+    __tablename__ = "timelines"
+
+    id = Column(Integer, autoincrement=True, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    tweet_id = Column(Integer, ForeignKey("tweets.id"), nullable=False)
+    author_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "tweet_id", name="unique_timeline_entry"),
+        Index("ix_timelines_user_id_author_id", "user_id", "author_id"),
+        Index("ix_timelines_tweet_id", "tweet_id"),
+    )
+
+
+class CounterShard(Base):
+    """
+    Model representing one shard of a sharded counter.
+
+    A hot counter column can be spread over several shard rows per object, so
+    that concurrent increments lock different rows. The true value is the
+    column plus the sum of its shards until the shards are compacted into it.
+
+    Attributes:
+        id (int): Unique identifier for the shard.
+        counter (str): Name of the counter column, e.g. "tweets.like_count".
+        object_id (int): Primary key of the row the counter belongs to.
+        shard (int): Number of the shard.
+        value (int): Accumulated delta of the shard.
+    """
+
+    __tablename__ = "counter_shards"
+
+    id = Column(Integer, autoincrement=True, primary_key=True)
+    counter = Column(String(50), nullable=False)
+    object_id = Column(Integer, nullable=False)
+    shard = Column(Integer, nullable=False)
+    value = Column(Integer, nullable=False, default=0, server_default="0")
+
+    __table_args__ = (
+        UniqueConstraint("counter", "object_id", "shard", name="unique_counter_shard"),
+    )
+
+
 class S3Client:
     """
     Class for interacting with S3-compatible storage.
@@ -138,10 +277,21 @@ class S3Client:
         endpoint_url (str): URL of the S3-compatible storage.
         bucket_name (str): Name of the S3 bucket where files are uploaded.
         web_url (str): Base URL for accessing files via HTTP.
+        max_connections (int): Size of the connection pool of the client.
+        connect_timeout (float): Timeout of establishing a connection in seconds.
+        read_timeout (float): Timeout of reading a response in seconds.
+        keepalive_timeout (float): Seconds an idle pooled connection is kept open.
+        max_attempts (Optional[int]): Attempts of a request by botocore itself,
+            its default when None.
 
     Methods:
+        start(): Opens the long-lived client of the worker.
+        close(): Closes the long-lived client.
         get_client(): Returns an S3 client for interacting with storage.
         upload_file_obj(file_obj, object_name): Asynchronously uploads a file to S3.
+        upload_stream(file_obj, object_name, part_size, ...): Uploads a file part by part.
+        presigned_put_url(object_name, expires_in, content_type): Returns an upload URL.
+        object_exists(object_name): Checks whether a file is stored.
     """
 
     def __init__(
@@ -151,21 +301,68 @@ class S3Client:
         endpoint_url: str,
         bucket_name: str,
         web_url: str,
+        max_connections: int = 10,
+        connect_timeout: float = 5,
+        read_timeout: float = 30,
+        keepalive_timeout: float = 30,
+        max_attempts: Optional[int] = None,
     ):
         self.config = {
             "aws_access_key_id": access_key,
             "aws_secret_access_key": secret_key,
             "endpoint_url": endpoint_url,
+            "config": AioConfig(
+                max_pool_connections=max_connections,
+                connect_timeout=connect_timeout,
+                read_timeout=read_timeout,
+                connector_args={"keepalive_timeout": keepalive_timeout},
+                # Presigned URLs would otherwise use the deprecated version 2.
+                signature_version="s3v4",
+                retries=(
+                    {"total_max_attempts": max_attempts, "mode": "standard"}
+                    if max_attempts is not None
+                    else None
+                ),
+            ),
         }
         self.bucket_name = bucket_name
         self.web_url = web_url
         self.session = get_session()
+        self.client = None
+        self.exit_stack = None
+
+    async def start(self):
+        """
+        Open the client shared by all requests of the worker, with its connection pool.
+        """
+        if self.client is not None:
+            return
+        self.exit_stack = AsyncExitStack()
+        self.client = await self.exit_stack.enter_async_context(
+            self.session.create_client("s3", **self.config, verify=False)
+        )
+
+    async def close(self):
+        """
+        Close the shared client and its pooled connections.
+        """
+        if self.exit_stack is not None:
+            await self.exit_stack.aclose()
+        self.client = None
+        self.exit_stack = None
 
     @asynccontextmanager
     async def get_client(self):
         """
         Asynchronous context manager for obtaining an S3 client.
+
+        Yields the shared client once start() was called, otherwise a client
+        created for this use only, e.g. in scripts running without the app.
         """
+        if self.client is not None:
+            yield self.client
+            return
+
         async with self.session.create_client(
             "s3", **self.config, verify=False
         ) as client:
@@ -188,3 +385,212 @@ class S3Client:
                 )
         except ClientError as e:
             print(f"Error uploading file: {e}")
+
+    async def upload_stream(
+        self,
+        file_obj,
+        object_name: str,
+        part_size: int,
+        concurrency: int = 1,
+        retries: int = 0,
+        backoff: float = 0.5,
+    ):
+        """
+        Asynchronously uploads a file object to S3 without reading it whole.
+
+        A file smaller than one part is uploaded with a single request, a
+        larger one with a multipart upload whose parts are sent by up to
+        concurrency requests at a time, so at most concurrency + 1 parts are
+        held in memory. A part failing with a transient error is retried with
+        exponential backoff; if it still fails, or the file cannot be read,
+        the multipart upload is aborted so that no stored parts are left behind.
+
+        Params:
+            file_obj: Object with an asynchronous read(size) method, e.g. UploadFile.
+            object_name (str): The name of the file in the bucket.
+            part_size (int): Size of the parts; S3 requires at least 5 MiB.
+            concurrency (int): Maximum number of parts uploaded at once.
+            retries (int): Number of retries of a failed part.
+            backoff (float): Delay before the first retry in seconds, doubled after each.
+
+        Raises:
+            ClientError: If the storage rejects the upload.
+        """
+        part = await read_part(file_obj, part_size)
+        async with self.get_client() as client:
+            if len(part) < part_size:
+                await client.put_object(
+                    Bucket=self.bucket_name, Key=object_name, Body=part
+                )
+                return
+
+            upload = await client.create_multipart_upload(
+                Bucket=self.bucket_name, Key=object_name
+            )
+            upload_id = upload["UploadId"]
+            slots = asyncio.Semaphore(concurrency)
+            tasks = []
+
+            async def send(number: int, body: bytes) -> dict:
+                try:
+                    etag = await self.upload_part(
+                        client, object_name, upload_id, number, body, retries, backoff
+                    )
+                finally:
+                    slots.release()
+                return {"ETag": etag, "PartNumber": number}
+
+            try:
+                while part:
+                    await slots.acquire()
+                    for task in tasks:
+                        if task.done() and task.exception() is not None:
+                            raise task.exception()
+                    tasks.append(asyncio.create_task(send(len(tasks) + 1, part)))
+                    part = await read_part(file_obj, part_size)
+
+                parts = await asyncio.gather(*tasks)
+                await client.complete_multipart_upload(
+                    Bucket=self.bucket_name,
+                    Key=object_name,
+                    UploadId=upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await self.abort_upload(client, object_name, upload_id)
+                raise
+
+    async def upload_part(
+        self,
+        client,
+        object_name: str,
+        upload_id: str,
+        number: int,
+        body: bytes,
+        retries: int,
+        backoff: float,
+    ) -> str:
+        """
+        Upload a part of a multipart upload, retrying transient failures.
+
+        Returns:
+            str: The ETag of the stored part.
+        """
+        for attempt in range(retries + 1):
+            try:
+                response = await client.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=object_name,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body,
+                )
+                return response["ETag"]
+            except (ClientError, BotoCoreError, asyncio.TimeoutError) as e:
+                if attempt == retries or not is_transient(e):
+                    raise
+                delay = backoff * 2**attempt * random.uniform(0.5, 1)
+                logger.warning(
+                    "Retrying part %s of %s in %.2f s: %s",
+                    number,
+                    object_name,
+                    delay,
+                    e,
+                )
+                await asyncio.sleep(delay)
+
+    async def presigned_put_url(
+        self, object_name: str, expires_in: int, content_type: Optional[str] = None
+    ) -> str:
+        """
+        Create a URL a client uploads a file to directly, with a PUT request.
+
+        Params:
+            object_name (str): The name of the file in the bucket.
+            expires_in (int): Lifetime of the URL in seconds.
+            content_type (Optional[str]): Content type the upload must be sent with.
+
+        Returns:
+            str: The signed URL.
+        """
+        params = {"Bucket": self.bucket_name, "Key": object_name}
+        if content_type:
+            params["ContentType"] = content_type
+        async with self.get_client() as client:
+            return await client.generate_presigned_url(
+                "put_object", Params=params, ExpiresIn=expires_in
+            )
+
+    async def object_exists(self, object_name: str) -> bool:
+        """
+        Check whether a file is stored in the bucket.
+
+        Params:
+            object_name (str): The name of the file in the bucket.
+
+        Raises:
+            ClientError: If the storage fails with another error than a missing file.
+        """
+        async with self.get_client() as client:
+            try:
+                await client.head_object(Bucket=self.bucket_name, Key=object_name)
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                    return False
+                raise
+        return True
+
+    async def abort_upload(self, client, object_name: str, upload_id: str):
+        """
+        Abort a multipart upload, dropping its stored parts.
+
+        Failures are logged only, the storage's lifecycle rules are the last resort.
+        """
+        try:
+            await client.abort_multipart_upload(
+                Bucket=self.bucket_name, Key=object_name, UploadId=upload_id
+            )
+        except ClientError as e:
+            logger.warning(
+                "Failed to abort upload %s of %s: %s", upload_id, object_name, e
+            )
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Tell whether a failed S3 request may succeed when repeated.
+    """
+    if not isinstance(error, ClientError):
+        return True
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+    code = error.response.get("Error", {}).get("Code")
+    return status >= 500 or status == 429 or code in TRANSIENT_ERROR_CODES
+
+
+async def read_part(file_obj, size: int) -> bytes:
+    """
+    Read the next size bytes of a file, fewer only at its end.
+
+    Args:
+        file_obj: Object with an asynchronous read(size) method.
+        size (int): Number of bytes to read.
+
+    Returns:
+        bytes: The data read, empty at the end of the file.
+    """
+    data = await file_obj.read(size)
+    if not data or len(data) == size:
+        return data
+
+    chunks = [data]
+    missing = size - len(data)
+    while missing:
+        data = await file_obj.read(missing)
+        if not data:
+            break
+        chunks.append(data)
+        missing -= len(data)
+    return b"".join(chunks)
@@ -0,0 +1,90 @@
+from abc import ABC, abstractmethod
+from typing import Dict
+
+from .models import Tweet
+
+
+class RankingStrategy(ABC):
+    """
+    Base class of feed ranking strategies.
+
+    A strategy names an indexed column of tweets holding the score. Feeds are
+    ordered by (score, tweet id) descending in the database and paginated by
+    keyset on the same pair, so a strategy never sorts in Python.
+
+    Attributes:
+        name (str): Name used in the `ranking` query parameter and in cursors.
+        column: Column of Tweet holding the score.
+    """
+
+    name: str
+
+    @property
+    @abstractmethod
+    def column(self):
+        """
+        Return the column of Tweet holding the score.
+        """
+
+    def score_of(self, tweet: Tweet):
+        """
+        Return the score of a loaded tweet, used to build the next cursor.
+        """
+        return getattr(tweet, self.column.key)
+
+
+class LikesRanking(RankingStrategy):
+    """
+    Most liked tweets first.
+    """
+
+    name = "likes"
+
+    @property
+    def column(self):
+        return Tweet.like_count
+
+
+class RecencyRanking(RankingStrategy):
+    """
+    Newest tweets first, tweet IDs grow with creation time.
+    """
+
+    name = "recency"
+
+    @property
+    def column(self):
+        return Tweet.id
+
+
+class DecayRanking(RankingStrategy):
+    """
+    Likes with exponential time decay.
+
+    Ordering by likes * exp(-age / T) is the same as ordering by
+    ln(1 + likes) + created_at / T, which does not depend on the current time
+    and is kept in the generated column Tweet.hot_score.
+    """
+
+    name = "decay"
+
+    @property
+    def column(self):
+        return Tweet.hot_score
+
+
+RANKINGS: Dict[str, RankingStrategy] = {}
+
+
+def register_ranking(strategy: RankingStrategy) -> None:
+    """
+    Make a ranking strategy selectable by its name.
+
+    Args:
+        strategy (RankingStrategy): The strategy to register.
+    """
+    RANKINGS[strategy.name] = strategy
+
+
+for _strategy in (LikesRanking(), RecencyRanking(), DecayRanking()):
+    register_ranking(_strategy)
@@ -0,0 +1,116 @@
+from typing import List, NamedTuple, Optional, Sequence
+
+from fastapi import HTTPException
+from sqlalchemy import Executable
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import User, Follow
+from .schemas import UserOut, UserResponse
+
+
+READ_BACKENDS = ("orm", "core", "raw")
+
+
+class TweetRow(NamedTuple):
+    """
+    Columns of a tweet needed to render and paginate a feed, read without the ORM.
+
+    Provides the same attributes as Tweet for hydrate_tweets() and for
+    RankingStrategy.score_of().
+    """
+
+    id: int
+    content: str
+    attachment: Optional[List[str]]
+    user_id: int
+    like_count: int
+    hot_score: float
+
+
+TWEET_ROW_COLUMNS = (
+    "id",
+    "content",
+    "attachment",
+    "user_id",
+    "like_count",
+    "hot_score",
+)
+
+
+async def fetch_rows(statement: Executable, db: AsyncSession, backend: str) -> Sequence:
+    """
+    Execute a read-only Core statement and return its rows as tuples.
+
+    "orm" and "core" run the statement through the session. "raw" compiles it
+    with the session's dialect and runs the SQL string with exec_driver_sql(),
+    skipping statement compilation caching and result type processing; it
+    must only be used with statements whose parameters and columns need no
+    type conversion. Going through the connection rather than the asyncpg one
+    beneath it makes the driver begin the session's transaction first, so the
+    read shares its snapshot with the other statements of the request.
+
+    Args:
+        statement (Executable): The statement to run, selecting columns, not entities.
+        db (AsyncSession): Database session, its transaction is used by all backends.
+        backend (str): One of READ_BACKENDS.
+
+    Returns:
+        Sequence: Rows supporting positional access.
+    """
+    if backend != "raw":
+        return (await db.execute(statement)).all()
+
+    compiled = statement.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True}
+    )
+    params = compiled.construct_params()
+    connection = await db.connection()
+    result = await connection.exec_driver_sql(
+        compiled.string, tuple(params[name] for name in compiled.positiontup)
+    )
+    return result.all()
+
+
+async def read_profile(user_id: int, db: AsyncSession, backend: str) -> UserResponse:
+    """
+    Read the profile of a user with Core statements, without loading ORM objects.
+
+    Args:
+        user_id (int): The ID of the user whose profile is requested.
+        db (AsyncSession): Database session.
+        backend (str): "core" or "raw", see fetch_rows().
+
+    Raises:
+        HTTPException: If the user with the given ID is not found.
+
+    Returns:
+        UserResponse: The profile with followers and followings.
+    """
+    users = await fetch_rows(
+        select(User.id, User.name).where(User.id == user_id), db, backend
+    )
+    if not users:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    followers = await fetch_rows(
+        select(User.id, User.name)
+        .join(Follow, Follow.user_id == User.id)
+        .where(Follow.follower_id == user_id),
+        db,
+        backend,
+    )
+    followings = await fetch_rows(
+        select(User.id, User.name)
+        .join(Follow, Follow.follower_id == User.id)
+        .where(Follow.user_id == user_id),
+        db,
+        backend,
+    )
+
+    return UserResponse(
+        result=True,
+        user=UserOut(id=users[0][0], name=users[0][1]),
+        followers=[UserOut(id=row[0], name=row[1]) for row in followers],
+        followings=[UserOut(id=row[0], name=row[1]) for row in followings],
+    )
@@ -1,24 +1,118 @@
+import hashlib
 import os
 from uuid import uuid4
-from typing import Dict, Any
-
-from fastapi import Depends, HTTPException, APIRouter, UploadFile, File
-from sqlalchemy import func
+from typing import Dict, Any, List, Optional
+
+from fastapi import (
+    Depends,
+    HTTPException,
+    APIRouter,
+    UploadFile,
+    File,
+    Query,
+    Header,
+    Response,
+)
+from fastapi.responses import StreamingResponse
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
-from server.database.db_connection import get_db
-from .models import Tweet, Media, Like, User, Follow, S3Client
+from server.database.db_connection import get_db, get_session_factory, is_replica
+from .auth import Principal
+from .cache import CacheError, ResponseCache, create_cache_backend
+from .events import EventHub, encode_events
+from .feed import (
+    LikesPreview,
+    hydrate_tweets,
+    select_feed_page,
+    select_first_feed_page,
+    select_feed_changes,
+    read_feed_page,
+    stream_feed_page,
+)
+from .feed_json import render_feed_page
+from .reads import read_profile
+from .ranking import RANKINGS
+from .models import (
+    Tweet,
+    Media,
+    Like,
+    User,
+    Follow,
+    S3Client,
+    MEDIA_PENDING,
+    MEDIA_READY,
+)
 from .schemas import (
     TweetIn,
+    MediaUploadIn,
     TweetResponse,
+    LikesResponse,
+    Like as LikeOut,
     UserOut,
-    TweetOut,
     UserResponse,
 )
-from .services import get_current_user, get_user_by_id, get_followers, get_followings
-from server.config import ACCESS_KEY, SECRET_KEY, ENDPOINT_URL, BUCKET_NAME, WEB_URL
+from .services import (
+    get_current_user,
+    get_user_by_id,
+    get_followers,
+    get_followings,
+    fan_out_tweet,
+    remove_tweet_from_timelines,
+    get_timeline_readers,
+    add_author_to_timeline,
+    remove_author_from_timeline,
+    apply_like_delta,
+    follower_counter,
+    is_pull_author,
+    switch_fanout_mode,
+    get_pull_authors,
+    encode_changes_cursor,
+    encode_cursor,
+    decode_changes_cursor,
+    decode_cursor,
+    make_etag,
+    etag_matches,
+    get_api_key_user,
+    get_token_claims,
+    token_signer,
+    token_revocations,
+)
+from server.config import (
+    ACCESS_KEY,
+    SECRET_KEY,
+    ENDPOINT_URL,
+    BUCKET_NAME,
+    WEB_URL,
+    S3_MAX_CONNECTIONS,
+    S3_CONNECT_TIMEOUT,
+    S3_READ_TIMEOUT,
+    S3_KEEPALIVE_TIMEOUT,
+    S3_PART_SIZE,
+    S3_UPLOAD_CONCURRENCY,
+    S3_PART_RETRIES,
+    S3_RETRY_BACKOFF,
+    S3_PRESIGNED_URL_TTL,
+    FEED_PAGE_SIZE,
+    FEED_MAX_PAGE_SIZE,
+    FEED_RANKING,
+    FEED_STREAM_MAX_PAGE_SIZE,
+    FEED_STREAM_BATCH_SIZE,
+    FEED_ENGINE,
+    READ_BACKEND,
+    FEED_LIKES_MODE,
+    LIKE_PREVIEW_SIZE,
+    LIKES_PAGE_SIZE,
+    LIKES_MAX_PAGE_SIZE,
+    CACHE_BACKEND,
+    CACHE_URL,
+    CACHE_MAX_BYTES,
+    FEED_CACHE_TTL,
+    PROFILE_CACHE_TTL,
+    FEED_EVENTS_CHANNEL,
+    FEED_EVENTS_QUEUE_SIZE,
+    FEED_EVENTS_KEEPALIVE,
+)
 
 
 s3_client = S3Client(
@@ -27,17 +121,82 @@ s3_client = S3Client(
     endpoint_url=ENDPOINT_URL,
     bucket_name=BUCKET_NAME,
     web_url=WEB_URL,
+    max_connections=S3_MAX_CONNECTIONS,
+    connect_timeout=S3_CONNECT_TIMEOUT,
+    read_timeout=S3_READ_TIMEOUT,
+    keepalive_timeout=S3_KEEPALIVE_TIMEOUT,
+)
+
+cache_backend = create_cache_backend(CACHE_BACKEND, CACHE_URL, CACHE_MAX_BYTES)
+feed_cache = ResponseCache(cache_backend, "feed", TweetResponse, ttl=FEED_CACHE_TTL)
+author_versions = ResponseCache(
+    cache_backend, "author", TweetResponse, ttl=FEED_CACHE_TTL
+)
+profile_cache = ResponseCache(
+    cache_backend, "profile", UserResponse, ttl=PROFILE_CACHE_TTL
 )
+event_hub = EventHub(FEED_EVENTS_CHANNEL, FEED_EVENTS_QUEUE_SIZE)
 
 router: APIRouter = APIRouter(
     prefix="/api",
 )
 
 
+@router.post("/auth/token")
+async def issue_token(user: Principal = Depends(get_api_key_user)) -> Dict[str, Any]:
+    """
+    Exchange an API key for a short-lived signed session token.
+
+    The token is sent as "Authorization: Bearer <token>" and is verified
+    without the database until it expires after AUTH_TOKEN_TTL seconds.
+    Tokens need signing keys and a reachable revocation store, as a token
+    whose revocation cannot be looked up is refused.
+
+    Args:
+        user (Principal): The user authenticated by API key (from dependencies).
+
+    Raises:
+        HTTPException: If token authentication is not configured or unavailable.
+
+    Returns:
+        dict: The token and its expiry time as a Unix timestamp.
+    """
+    if not token_signer.enabled or not token_revocations.enabled:
+        raise HTTPException(
+            status_code=503, detail="Token authentication is not configured"
+        )
+    if not await token_revocations.available():
+        raise HTTPException(status_code=503, detail="Token revocation unavailable")
+
+    token, claims = token_signer.issue(user)
+    return {"result": True, "token": token, "expires_at": claims.expires_at}
+
+
+@router.delete("/auth/token")
+async def revoke_token(claims=Depends(get_token_claims)) -> Dict[str, Any]:
+    """
+    Revoke the session token of the request.
+
+    Args:
+        claims (TokenClaims): Claims of the verified token (from dependencies).
+
+    Raises:
+        HTTPException: If the revocation list cannot be written.
+
+    Returns:
+        dict: The result of the operation.
+    """
+    try:
+        await token_revocations.revoke(claims)
+    except CacheError:
+        raise HTTPException(status_code=503, detail="Token revocation unavailable")
+    return {"result": True}
+
+
 @router.post("/tweets")
 async def create_new_tweet(
     tweet: TweetIn,
-    user: User = Depends(get_current_user),
+    user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
     """
@@ -45,30 +204,43 @@ async def create_new_tweet(
 
     Args:
         tweet (TweetIn): The tweet data.
-        user (User): The authenticated user (from dependencies).
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
         dict: The result of the operation with the tweet ID.
     """
-    new_tweet = Tweet(content=tweet.content, user_id=user.id)
-
-    db.add(new_tweet)
-    await db.commit()
-    await db.refresh(new_tweet)
+    # The mode is switched under the row lock, which follows wait for.
+    author = await get_user_by_id(user.id, db, lock="update")
+    author, readers = await switch_fanout_mode(author, db)
 
+    new_tweet = Tweet(content=tweet.content, user_id=user.id)
+    # Attached in the inserting transaction, so the tweet's version covers them.
+    media_files = []
     if tweet.tweet_media_ids:
-        media_files = await db.execute(
-            select(Media).where(Media.id.in_(tweet.tweet_media_ids))
+        media_query = await db.execute(
+            select(Media).where(
+                Media.id.in_(tweet.tweet_media_ids), Media.status == MEDIA_READY
+            )
         )
-        media_files = media_files.scalars().all()
-
-        for media in media_files:
-            media.tweet_id = new_tweet.id
+        media_files = media_query.scalars().all()
 
         new_tweet.attachment = [media.file_link for media in media_files]
 
-        await db.commit()
+    db.add(new_tweet)
+    await db.flush()
+    for media in media_files:
+        media.tweet_id = new_tweet.id
+    if not is_pull_author(author):
+        readers += await fan_out_tweet(new_tweet, db)
+    await event_hub.publish(
+        {"type": "tweet", "tweet_id": new_tweet.id, "author_id": user.id}, db
+    )
+    await db.commit()
+    await db.refresh(new_tweet)
+
+    await feed_cache.invalidate(readers)
+    await author_versions.invalidate([user.id])
 
     return {"result": True, "tweet_id": new_tweet.id}
 
@@ -80,6 +252,10 @@ async def upload_media(
     """
     Upload a media file to S3 and create a record in the database.
 
+    The file is streamed to S3 in parts of S3_PART_SIZE bytes, up to
+    S3_UPLOAD_CONCURRENCY of them at once, so memory per upload does not grow
+    with the file size.
+
     Args:
         file (UploadFile): The media file to upload.
         db (AsyncSession): Database session (from dependencies).
@@ -91,12 +267,18 @@ async def upload_media(
     unique_filename = f"{uuid4()}{file_extension}"
 
     try:
-        file_content = await file.read()
-        await s3_client.upload_file_obj(file_content, unique_filename)
+        await s3_client.upload_stream(
+            file,
+            unique_filename,
+            S3_PART_SIZE,
+            concurrency=S3_UPLOAD_CONCURRENCY,
+            retries=S3_PART_RETRIES,
+            backoff=S3_RETRY_BACKOFF,
+        )
 
         file_link = f"{s3_client.web_url}/{s3_client.bucket_name}/{unique_filename}"
 
-        media = Media(file_link=file_link)
+        media = Media(file_link=file_link, object_key=unique_filename)
         db.add(media)
         await db.commit()
         await db.refresh(media)
@@ -107,16 +289,113 @@ async def upload_media(
         raise HTTPException(status_code=500, detail=f"Failed to upload media: {e}")
 
 
+@router.post("/medias/uploads")
+async def create_media_upload(
+    upload: MediaUploadIn,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> Dict[str, Any]:
+    """
+    Start a direct upload of a media file to S3, bypassing the API server.
+
+    Creates a pending media record and a presigned URL, valid for
+    S3_PRESIGNED_URL_TTL seconds, to which the client sends the file with a
+    PUT request (with the given Content-Type, if any). The media can be
+    attached to tweets once the upload is completed with
+    POST /medias/{idx}/complete; uploads not completed within
+    MEDIA_PENDING_TTL seconds are removed by
+    `python -m server.commands expire-pending-media`.
+
+    Args:
+        upload (MediaUploadIn): Name and content type of the file.
+        user (Principal): The authenticated user (from dependencies).
+        db (AsyncSession): Database session (from dependencies).
+
+    Returns:
+        dict: The result of the operation with the media ID and the upload URL.
+    """
+    object_key = f"{uuid4()}{os.path.splitext(upload.filename)[1]}"
+
+    try:
+        upload_url = await s3_client.presigned_put_url(
+            object_key, S3_PRESIGNED_URL_TTL, upload.content_type
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create upload: {e}")
+
+    media = Media(
+        file_link=f"{s3_client.web_url}/{s3_client.bucket_name}/{object_key}",
+        object_key=object_key,
+        status=MEDIA_PENDING,
+        user_id=user.id,
+    )
+    db.add(media)
+    await db.commit()
+    await db.refresh(media)
+
+    return {
+        "result": True,
+        "media_id": media.id,
+        "upload_url": upload_url,
+        "expires_in": S3_PRESIGNED_URL_TTL,
+    }
+
+
+@router.post("/medias/{idx}/complete")
+async def complete_media_upload(
+    idx: int,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> Dict[str, Any]:
+    """
+    Complete a direct upload of a media file after the client sent it to S3.
+
+    Args:
+        idx (int): The ID of the media.
+        user (Principal): The authenticated user (from dependencies).
+        db (AsyncSession): Database session (from dependencies).
+
+    Raises:
+        HTTPException: If the media is not found among the user's uploads, or its
+            file is not stored yet.
+
+    Returns:
+        dict: The result of the operation with the media ID.
+    """
+    media_query = await db.execute(
+        select(Media).where(Media.id == idx, Media.user_id == user.id)
+    )
+    media = media_query.scalars().first()
+
+    if media is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    if media.status == MEDIA_PENDING:
+        try:
+            stored = await s3_client.object_exists(media.object_key)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to check media: {e}")
+        if not stored:
+            raise HTTPException(status_code=409, detail="Media file is not uploaded")
+
+        media.status = MEDIA_READY
+        await db.commit()
+
+    return {"result": True, "media_id": media.id}
+
+
 @router.delete("/tweets/{idx}")
 async def delete_own_tweet(
-    idx: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    idx: int,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
     """
     Delete a tweet created by the authenticated user.
 
     Args:
         idx (int): The ID of the tweet to delete.
-        user (User): The authenticated user (from dependencies).
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
@@ -132,28 +411,35 @@ async def delete_own_tweet(
             status_code=403, detail="You can only delete your own tweets"
         )
 
+    readers = await remove_tweet_from_timelines(tweet.id, db)
     await db.delete(tweet)
     await db.commit()
 
+    await feed_cache.invalidate(readers)
+    await author_versions.invalidate([user.id])
+
     return {"result": True}
 
 
 @router.post("/users/{idx}/follow")
 async def follow_user(
-    idx: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    idx: int,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
     """
     Follow another user.
 
     Args:
         idx (int): The ID of the user to follow.
-        user (User): The authenticated user (from dependencies).
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
         dict: The result of the follow operation.
     """
-    follower = await get_user_by_id(idx, db)
+    # Keeps the author's fan-out mode from changing until the follow is committed.
+    follower = await get_user_by_id(idx, db, lock="key share")
 
     if user.id == follower.id:
         raise HTTPException(status_code=400, detail="You cannot follow yourself")
@@ -171,27 +457,35 @@ async def follow_user(
     new_follow = Follow(user_id=user.id, follower_id=follower.id)
 
     db.add(new_follow)
+    if not is_pull_author(follower):
+        await add_author_to_timeline(user.id, follower.id, db)
+    await follower_counter.add(follower.id, 1, db)
     await db.commit()
 
+    await feed_cache.invalidate([user.id])
+    await profile_cache.invalidate([user.id, follower.id])
+
     return {"result": True}
 
 
 @router.delete("/users/{idx}/follow")
 async def unfollow_user(
-    idx: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    idx: int,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
     """
     Unfollow a user.
 
     Args:
         idx (int): The ID of the user to unfollow.
-        user (User): The authenticated user (from dependencies).
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
         dict: The result of the unfollow operation.
     """
-    follower = await get_user_by_id(idx, db)
+    follower = await get_user_by_id(idx, db, lock="key share")
 
     existing_follow = await db.execute(
         select(Follow).where(
@@ -204,21 +498,28 @@ async def unfollow_user(
         raise HTTPException(status_code=400, detail="You are not following this user")
 
     await db.delete(follow)
+    await remove_author_from_timeline(user.id, follower.id, db)
+    await follower_counter.add(follower.id, -1, db)
     await db.commit()
 
+    await feed_cache.invalidate([user.id])
+    await profile_cache.invalidate([user.id, follower.id])
+
     return {"result": True}
 
 
 @router.post("/tweets/{idx}/likes")
 async def like_to_tweet(
-    idx: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    idx: int,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
     """
     Like a tweet.
 
     Args:
         idx (int): The ID of the tweet to like.
-        user (User): The authenticated user (from dependencies).
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
@@ -238,21 +539,31 @@ async def like_to_tweet(
     new_like = Like(user_id=user.id, tweet_id=tweet.id)
 
     db.add(new_like)
+    await apply_like_delta(tweet.id, 1, db)
+    await event_hub.publish(
+        {"type": "like", "tweet_id": tweet.id, "author_id": tweet.user_id, "delta": 1},
+        db,
+    )
     await db.commit()
 
+    await feed_cache.invalidate(await get_timeline_readers(tweet.id, db))
+    await author_versions.invalidate([tweet.user_id])
+
     return {"result": True}
 
 
 @router.delete("/tweets/{idx}/likes")
 async def remove_like(
-    idx: int, user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    idx: int,
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ) -> Dict[str, Any]:
     """
     Remove a like from a tweet.
 
     Args:
         idx (int): The ID of the tweet to remove the like from.
-        user (User): The authenticated user (from dependencies).
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
@@ -272,104 +583,450 @@ async def remove_like(
         raise HTTPException(status_code=400, detail="You haven't liked this tweet yet")
 
     await db.delete(like)
+    await apply_like_delta(tweet.id, -1, db)
+    await event_hub.publish(
+        {"type": "like", "tweet_id": tweet.id, "author_id": tweet.user_id, "delta": -1},
+        db,
+    )
     await db.commit()
 
+    await feed_cache.invalidate(await get_timeline_readers(tweet.id, db))
+    await author_versions.invalidate([tweet.user_id])
+
     return {"result": True}
 
 
+@router.get("/tweets/{idx}/likes")
+async def get_tweet_likes(
+    idx: int,
+    limit: int = Query(LIKES_PAGE_SIZE, ge=1, le=LIKES_MAX_PAGE_SIZE),
+    cursor: Optional[int] = None,
+    db: AsyncSession = Depends(get_db),
+) -> LikesResponse:
+    """
+    Retrieve the likes of a tweet page by page, in the order they were given.
+
+    Pages are selected by keyset on the like ID from ix_likes_tweet_id_id.
+
+    Args:
+        idx (int): The ID of the tweet.
+        limit (int): Maximum number of likes on the page.
+        cursor (Optional[int]): Cursor returned with the previous page.
+        db (AsyncSession): Database session (from dependencies).
+
+    Returns:
+        LikesResponse: The page of likes.
+    """
+    tweet = await db.get(Tweet, idx)
+
+    if tweet is None:
+        raise HTTPException(status_code=404, detail="Tweet not found")
+
+    likes_query = (
+        select(Like.id, Like.user_id, User.name)
+        .join(User, User.id == Like.user_id)
+        .where(Like.tweet_id == idx)
+    )
+    if cursor is not None:
+        likes_query = likes_query.where(Like.id > cursor)
+    rows = (await db.execute(likes_query.order_by(Like.id).limit(limit + 1))).all()
+    page = rows[:limit]
+
+    return LikesResponse(
+        result=True,
+        likes=[LikeOut(user_id=user_id, name=name) for _, user_id, name in page],
+        next_cursor=page[-1].id if len(rows) > limit else None,
+    )
+
+
+@router.get("/tweets/events")
+async def get_feed_events(
+    user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+) -> StreamingResponse:
+    """
+    Stream events of followed authors as Server-Sent Events.
+
+    Replaces polling of the feed: the client receives "tweet" events with the
+    IDs of new tweets and "like" events with changes of like counts, and
+    reloads the feed on a "resync" event, sent when it fell behind. Followed
+    authors are resolved once on connect, so the client reconnects after
+    following or unfollowing someone. An open stream holds no database session.
+
+    Args:
+        user (Principal): The authenticated user (from dependencies).
+        db (AsyncSession): Database session (from dependencies).
+
+    Returns:
+        StreamingResponse: The event stream.
+    """
+    followings = await get_followings(user, db)
+
+    async def stream():
+        # Subscribed only once the response is sent, so a client gone before
+        # that leaves no subscription behind.
+        subscription = event_hub.subscribe(following.id for following in followings)
+        try:
+            async for chunk in encode_events(subscription, FEED_EVENTS_KEEPALIVE):
+                yield chunk
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+def cached_json_response(body: bytes, etag: Optional[str]) -> Response:
+    """
+    Wrap an encoded body into a response that clients revalidate with its ETag.
+
+    Without an ETag the client has nothing to revalidate and requests the
+    body again.
+    """
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag is not None:
+        headers["ETag"] = etag
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+async def store_page_response(
+    cache: ResponseCache,
+    owner_id: int,
+    version: str,
+    key: str,
+    body: bytes,
+    etag: str,
+    db: AsyncSession,
+) -> Response:
+    """
+    Store a freshly rendered page in its cache and answer with it.
+
+    The version was read before the page, so a body read from a lagging
+    replica may predate it. Such bodies are neither stored nor tagged with
+    the version's ETag, otherwise they would be served and revalidated as
+    current until the next change; they are only returned to this client.
+
+    Args:
+        cache (ResponseCache): feed_cache or profile_cache.
+        owner_id (int): The ID of the user owning the cached scope.
+        version (str): Version of the scope read before the page.
+        key (str): Key of the page within the scope.
+        body (bytes): The encoded page.
+        etag (str): ETag derived from the version and the key.
+        db (AsyncSession): Database session the page was read with.
+
+    Returns:
+        Response: Encoded page, with its ETag if it was read from the primary.
+    """
+    if is_replica(db):
+        return cached_json_response(body, None)
+
+    await cache.set(owner_id, version, key, body)
+    return cached_json_response(body, etag)
+
+
+def not_modified_response(etag: str) -> Response:
+    """
+    Answer a conditional request whose representation has not changed.
+    """
+    return Response(
+        status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"}
+    )
+
+
+async def get_feed_version(user_id: int, pull_authors: List[int]) -> str:
+    """
+    Combine the version tokens of a user's feed and of followed pull-mode authors.
+
+    Tweets of pull-mode authors do not invalidate their followers' feeds
+    one by one, so the feed version also changes when any of them changes.
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        pull_authors (List[int]): IDs of followed authors merged at read time.
+
+    Returns:
+        str: Version of the feed.
+    """
+    version = await feed_cache.version(user_id)
+    if not pull_authors:
+        return version
+
+    tokens = await author_versions.versions(pull_authors)
+    return hashlib.sha1(":".join([version, *tokens]).encode()).hexdigest()
+
+
 @router.get("/tweets")
 async def get_tweets_by_followings(
-    user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    limit: int = Query(FEED_PAGE_SIZE, ge=1, le=FEED_STREAM_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ranking: str = Query(FEED_RANKING),
+    stream: bool = False,
+    since_version: Optional[int] = Query(None, ge=0),
+    likes: str = Query(FEED_LIKES_MODE),
+    if_none_match: Optional[str] = Header(None),
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    session_factory=Depends(get_session_factory),
 ) -> TweetResponse:
     """
     Retrieve tweets by users the authenticated user follows.
 
+    Tweets are read from the user's materialized timeline, which is filled
+    on write by tweet creation and follow, merged with the tweets of followed
+    authors in pull mode, which are not fanned out.
+    The feed is ordered by the score of the selected ranking strategy and
+    paginated by keyset on (score, tweet id): the cursor carries the sort key
+    of the last tweet of the previous page, so every page costs the same.
+    Rendered pages are kept in feed_cache until a change of the feed invalidates them.
+    The feed version also serves as the ETag, so a conditional request for an
+    unchanged page is answered with 304 without selecting or rendering tweets.
+    Pages read from a replica are not cached and carry no ETag, as they may
+    be older than the version (see store_page_response()).
+
+    With stream=true the page is encoded incrementally from a database cursor,
+    FEED_STREAM_BATCH_SIZE tweets at a time, which allows pages of up to
+    FEED_STREAM_MAX_PAGE_SIZE tweets; streamed pages are not stored in feed_cache.
+
+    The first page carries the feed version. Passing it back as since_version
+    returns only tweets created or liked since then, ordered by version; tweets
+    the client already has may be returned again. If more than `limit` tweets
+    changed, next_cursor is set and is passed together with the same
+    since_version; the last page carries the new version to use for the next
+    refresh.
+
+    With likes=preview every tweet carries like_count, liked_by_me and only
+    the first LIKE_PREVIEW_SIZE likers; the full list is paginated by
+    GET /api/tweets/{idx}/likes.
+
+    With FEED_ENGINE set to "sql", regular pages are rendered to JSON by
+    Postgres in one statement (see render_feed_page()); streamed pages and
+    changes are always rendered through the ORM. With READ_BACKEND set to
+    "core" or "raw", other pages are read as plain rows instead of ORM objects
+    (see read_feed_page()).
+
     Args:
-        user (User): The authenticated user (from dependencies).
+        limit (int): Maximum number of tweets on the page.
+        cursor (Optional[str]): Cursor returned with the previous page.
+        ranking (str): Name of the ranking strategy, FEED_RANKING by default.
+        stream (bool): Whether to stream the page instead of rendering it at once.
+        since_version (Optional[int]): Feed version the client already has.
+        likes (str): "full" for complete liker lists or "preview", FEED_LIKES_MODE by default.
+        if_none_match (Optional[str]): ETag of the page the client already has.
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
+        session_factory: Factory of the session used by a streamed page (from dependencies).
 
     Returns:
         TweetResponse: The response containing the list of tweets and associated details.
     """
-    following_query = await db.execute(
-        select(Follow.follower_id).where(Follow.user_id == user.id)
+    strategy = RANKINGS.get(ranking)
+    if strategy is None:
+        raise HTTPException(status_code=400, detail="Unknown ranking")
+    if not stream and limit > FEED_MAX_PAGE_SIZE:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Pages above {FEED_MAX_PAGE_SIZE} tweets require stream=true",
+        )
+    if likes not in ("full", "preview"):
+        raise HTTPException(status_code=400, detail="Unknown likes mode")
+
+    pull_authors = await get_pull_authors(user.id, db)
+    version = await get_feed_version(user.id, pull_authors)
+    if since_version is None:
+        cache_key = f"{likes}:{ranking}:{limit}:{cursor or ''}"
+    else:
+        cache_key = f"{likes}:since:{since_version}:{limit}:{cursor or ''}"
+    etag = make_etag(version, cache_key)
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    cached = await feed_cache.get(user.id, version, cache_key)
+    if cached is not None:
+        return cached_json_response(cached, etag)
+
+    preview = LikesPreview(LIKE_PREVIEW_SIZE, user.id) if likes == "preview" else None
+    if since_version is not None:
+        watermark, after = None, None
+        if cursor is not None:
+            watermark, after = decode_changes_cursor(cursor, since_version)
+        tweets, watermark = await select_feed_changes(
+            user.id, since_version, limit + 1, after, watermark, db
+        )
+        page = tweets[:limit]
+
+        next_cursor = None
+        if len(tweets) > limit:
+            next_cursor = encode_changes_cursor(
+                since_version, watermark, page[-1].version, page[-1].id
+            )
+        body = (
+            TweetResponse(
+                result=True,
+                tweets=await hydrate_tweets(page, db, preview=preview),
+                next_cursor=next_cursor,
+                version=None if next_cursor is not None else watermark,
+            )
+            .model_dump_json()
+            .encode()
+        )
+
+        return await store_page_response(
+            feed_cache, user.id, version, cache_key, body, etag, db
+        )
+
+    after = decode_cursor(cursor, ranking) if cursor is not None else None
+    if stream:
+        headers = {"Cache-Control": "private, no-cache"}
+        if not is_replica(db):
+            headers["ETag"] = etag
+        return StreamingResponse(
+            stream_feed_page(
+                session_factory,
+                user.id,
+                pull_authors,
+                strategy,
+                limit,
+                after,
+                FEED_STREAM_BATCH_SIZE,
+                preview,
+            ),
+            media_type="application/json",
+            headers=headers,
+        )
+
+    if FEED_ENGINE == "sql":
+        body = await render_feed_page(
+            user.id, pull_authors, strategy, limit, after, db, preview
+        )
+
+        return await store_page_response(
+            feed_cache, user.id, version, cache_key, body, etag, db
+        )
+
+    feed_version = None
+    if READ_BACKEND != "orm":
+        tweets, feed_version = await read_feed_page(
+            user.id, pull_authors, strategy, limit + 1, after, db, READ_BACKEND
+        )
+    elif after is None:
+        tweets, feed_version = await select_first_feed_page(
+            user.id, pull_authors, strategy, limit + 1, db
+        )
+    else:
+        tweets = await select_feed_page(
+            user.id, pull_authors, strategy, limit + 1, after, db
+        )
+    page = tweets[:limit]
+
+    next_cursor = None
+    if len(tweets) > limit:
+        next_cursor = encode_cursor(ranking, strategy.score_of(page[-1]), page[-1].id)
+
+    result_tweets = await hydrate_tweets(
+        page, db, preview=preview, backend=READ_BACKEND
+    )
+
+    body = (
+        TweetResponse(
+            result=True,
+            tweets=result_tweets,
+            next_cursor=next_cursor,
+            version=feed_version,
+        )
+        .model_dump_json()
+        .encode()
     )
-    following_ids = following_query.scalars().all()
-
-    tweets_by_following = await db.execute(
-        select(Tweet)
-        .options(selectinload(Tweet.user), selectinload(Tweet.likes))
-        .outerjoin(Like)
-        .where(Tweet.user_id.in_(following_ids))
-        .group_by(Tweet.id)
-        .order_by(func.count(Like.id).desc())
+
+    return await store_page_response(
+        feed_cache, user.id, version, cache_key, body, etag, db
     )
 
-    result_tweets = [
-        TweetOut(
-            id=tweet.id,
-            content=tweet.content,
-            attachments=tweet.attachment if tweet.attachment else [],
-            user=UserOut(id=tweet.user.id, name=tweet.user.name),
-            likes=[
-                {
-                    "user_id": like.user_id,
-                    "name": (await db.get(User, like.user_id)).name,
-                }
-                for like in tweet.likes
-            ],
+
+async def get_profile_response(
+    user_id: int, if_none_match: Optional[str], db: AsyncSession
+) -> Response:
+    """
+    Build the profile response of a user, serving it from profile_cache when possible.
+
+    With READ_BACKEND set to "core" or "raw" the profile is read as plain rows
+    (see read_profile()).
+
+    Args:
+        user_id (int): The ID of the user whose profile is requested.
+        if_none_match (Optional[str]): ETag of the profile the client already has.
+        db (AsyncSession): Database session.
+
+    Returns:
+        Response: Encoded UserResponse, or 304 if the client's copy is current.
+    """
+    version = await profile_cache.version(user_id)
+    etag = make_etag(version, "profile")
+    if etag_matches(if_none_match, etag):
+        return not_modified_response(etag)
+
+    cached = await profile_cache.get(user_id, version, "profile")
+    if cached is not None:
+        return cached_json_response(cached, etag)
+
+    if READ_BACKEND == "orm":
+        user = await get_user_by_id(user_id, db)
+
+        followers = await get_followers(user, db)
+        followings = await get_followings(user, db)
+
+        user_out = UserOut(id=user.id, name=user.name)
+
+        profile = UserResponse(
+            result=True, user=user_out, followers=followers, followings=followings
         )
-        for tweet in tweets_by_following.scalars().all()
-    ]
+    else:
+        profile = await read_profile(user_id, db, READ_BACKEND)
 
-    return TweetResponse(result=True, tweets=result_tweets)
+    body = profile.model_dump_json().encode()
+
+    return await store_page_response(
+        profile_cache, user_id, version, "profile", body, etag, db
+    )
 
 
 @router.get("/users/me")
 async def get_user_info(
-    user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)
+    if_none_match: Optional[str] = Header(None),
+    user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
 ) -> UserResponse:
     """
     Get authenticated user's profile information, followers, and followings.
 
     Args:
-        user (User): The authenticated user (from dependencies).
+        if_none_match (Optional[str]): ETag of the profile the client already has.
+        user (Principal): The authenticated user (from dependencies).
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
         UserResponse: The response containing user details, followers, and followings.
     """
-    followers = await get_followers(user, db)
-    followings = await get_followings(user, db)
-
-    user_out = UserOut(id=user.id, name=user.name)
-
-    return UserResponse(
-        result=True, user=user_out, followers=followers, followings=followings
-    )
+    return await get_profile_response(user.id, if_none_match, db)
 
 
 @router.get("/users/{idx}")
 async def get_user_info_by_id(
-    idx: int, db: AsyncSession = Depends(get_db)
+    idx: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
 ) -> UserResponse:
     """
     Get profile information, followers, and followings for a user by ID.
 
     Args:
         idx (int): The ID of the user to retrieve.
+        if_none_match (Optional[str]): ETag of the profile the client already has.
         db (AsyncSession): Database session (from dependencies).
 
     Returns:
         UserResponse: The response containing user details, followers, and followings.
     """
-    user = await get_user_by_id(idx, db)
-
-    followers = await get_followers(user, db)
-    followings = await get_followings(user, db)
-
-    user_out = UserOut(id=user.id, name=user.name)
-
-    return UserResponse(
-        result=True, user=user_out, followers=followers, followings=followings
-    )
+    return await get_profile_response(idx, if_none_match, db)
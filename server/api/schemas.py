@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Optional, Union
 
 from pydantic import BaseModel, Field
 
@@ -87,14 +87,62 @@ class TweetOut(BaseTweet):
     likes: List[Like] = []
 
 
+class TweetPreviewOut(TweetOut):
+    """
+    Model representing a tweet in response with a preview of its likes.
+
+    Attributes:
+        likes (List[Like]): The first likes for the tweet.
+        like_count (int): Total number of likes.
+        liked_by_me (bool): Whether the reader liked the tweet.
+    """
+
+    like_count: int
+    liked_by_me: bool
+
+
 class TweetResponse(BaseModel):
     """
     Model representing a response containing a list of tweets.
 
     Attributes:
         result (bool): Status of the response.
-        tweets (List[TweetOut]): List of tweets.
+        tweets (List[Union[TweetPreviewOut, TweetOut]]): List of tweets, with
+            previews of their likes in preview mode.
+        next_cursor (Optional[str]): Opaque cursor of the next page, None on the last page.
+        version (Optional[int]): Feed version to pass as since_version on the next refresh,
+            returned with the first page and with the last page of changes.
+    """
+
+    result: bool
+    tweets: List[Union[TweetPreviewOut, TweetOut]]
+    next_cursor: Optional[str] = None
+    version: Optional[int] = None
+
+
+class MediaUploadIn(BaseModel):
+    """
+    Model for a request of a direct upload of a media file.
+
+    Attributes:
+        filename (str): Name of the file, its extension is kept.
+        content_type (Optional[str]): Content type the file will be uploaded with.
+    """
+
+    filename: str
+    content_type: Optional[str] = None
+
+
+class LikesResponse(BaseModel):
+    """
+    Model representing a response containing a page of likes of a tweet.
+
+    Attributes:
+        result (bool): Status of the response.
+        likes (List[Like]): Likes in the order they were given.
+        next_cursor (Optional[int]): Cursor of the next page, None on the last page.
     """
 
     result: bool
-    tweets: List[TweetOut]
+    likes: List[Like]
+    next_cursor: Optional[int] = None
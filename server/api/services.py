@@ -1,101 +1,655 @@
-from typing import List
+import base64
+import binascii
+import hashlib
+import json
+from typing import List, NamedTuple, Optional, Tuple, Union
 
 from fastapi import Depends, HTTPException, Header
+from sqlalchemy import Integer, delete, event, func, insert, literal, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.future import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .models import User, Follow
+from .auth import Principal, PrincipalCache
+from .cache import RedisCacheBackend
+from .counters import ShardedCounter
+from .models import (
+    FANOUT_PULL,
+    FANOUT_PUSH,
+    User,
+    Follow,
+    Tweet,
+    Timeline,
+    xid_bigint,
+)
 from .schemas import UserOut
+from .tokens import (
+    TokenError,
+    TokenRevocations,
+    TokenSigner,
+    parse_token_keys,
+)
+from server.config import (
+    LIKE_COUNTER_SHARDS,
+    FOLLOWER_COUNTER_SHARDS,
+    FANOUT_FOLLOWER_THRESHOLD,
+    FANOUT_HYSTERESIS,
+    AUTH_CACHE_TTL,
+    AUTH_NEGATIVE_CACHE_TTL,
+    AUTH_CACHE_MAX_ENTRIES,
+    AUTH_NEGATIVE_CACHE_MAX_ENTRIES,
+    AUTH_TOKEN_KEYS,
+    AUTH_TOKEN_TTL,
+    TOKEN_REVOCATION_URL,
+)
 from server.database.db_connection import get_db
 
 
-async def get_current_user(
-    db: AsyncSession = Depends(get_db), api_key: str = Header(...)
-) -> User:
+like_counter = ShardedCounter(
+    Tweet.like_count,
+    shards=LIKE_COUNTER_SHARDS,
+    touch={"version": xid_bigint(func.pg_current_xact_id())},
+)
+follower_counter = ShardedCounter(User.follower_count, shards=FOLLOWER_COUNTER_SHARDS)
+
+
+principal_cache = PrincipalCache(
+    ttl=AUTH_CACHE_TTL,
+    negative_ttl=AUTH_NEGATIVE_CACHE_TTL,
+    max_entries=AUTH_CACHE_MAX_ENTRIES,
+    max_negative_entries=AUTH_NEGATIVE_CACHE_MAX_ENTRIES,
+)
+
+
+token_signer = TokenSigner(parse_token_keys(AUTH_TOKEN_KEYS), ttl=AUTH_TOKEN_TTL)
+token_revocations = TokenRevocations(
+    RedisCacheBackend(TOKEN_REVOCATION_URL) if TOKEN_REVOCATION_URL else None
+)
+
+
+@event.listens_for(User.api_key, "set")
+def evict_changed_api_key(target, value, oldvalue, initiator):
+    """
+    Drop cached entries of a replaced API key and of a newly assigned one.
+    """
+    if isinstance(oldvalue, str):
+        principal_cache.evict(oldvalue)
+    if isinstance(value, str):
+        principal_cache.evict(value)
+
+
+async def get_api_key_user(
+    db: AsyncSession = Depends(get_db), api_key: Optional[str] = Header(None)
+) -> Principal:
     """
     Retrieve the current user based on the provided API key.
 
+    Keys are resolved through principal_cache, so most requests do not query
+    the database for authentication; unknown keys are cached too.
+
     Args:
         db (AsyncSession): Database session.
-        api_key (str): API key provided in the request header.
+        api_key (Optional[str]): API key provided in the request header.
 
     Raises:
-        HTTPException: If the API key is invalid.
+        HTTPException: If the API key is missing or invalid.
 
     Returns:
-        User: The user object corresponding to the API key.
+        Principal: The user corresponding to the API key.
     """
-    user = await db.execute(select(User).where(User.api_key == api_key))
-    user = user.scalars().first()
+    if api_key is None:
+        raise HTTPException(status_code=403, detail="Invalid API key")
 
-    if user is None:
+    cached, principal = principal_cache.get(api_key)
+    if not cached:
+        user = await db.execute(
+            select(User.id, User.name).where(User.api_key == api_key)
+        )
+        user = user.first()
+        principal = Principal(*user) if user is not None else None
+        principal_cache.set(api_key, principal)
+
+    if principal is None:
         raise HTTPException(status_code=403, detail="Invalid API key")
 
-    return user
+    return principal
+
+
+async def get_token_claims(authorization: Optional[str] = Header(None)):
+    """
+    Verify the session token from an "Authorization: Bearer" header.
+
+    Verification checks the signature and expiry in CPU and the revocation
+    list in token_revocations, without querying the database.
+
+    Args:
+        authorization (Optional[str]): Value of the Authorization request header.
+
+    Raises:
+        HTTPException: If the header has no valid, unrevoked token.
+
+    Returns:
+        TokenClaims: Claims of the token.
+    """
+    scheme, _, token = (authorization or "").partition(" ")
+    if (
+        scheme.lower() != "bearer"
+        or not token_signer.enabled
+        or not token_revocations.enabled
+    ):
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    try:
+        claims = token_signer.verify(token.strip())
+    except TokenError as e:
+        raise HTTPException(
+            status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"}
+        )
+    if await token_revocations.is_revoked(claims.token_id):
+        raise HTTPException(
+            status_code=401,
+            detail="Token revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return claims
+
+
+async def get_current_user(
+    db: AsyncSession = Depends(get_db),
+    api_key: Optional[str] = Header(None),
+    authorization: Optional[str] = Header(None),
+) -> Principal:
+    """
+    Retrieve the current user from a session token or an API key.
+
+    A bearer token issued by POST /api/auth/token takes precedence and is
+    verified without the database, see get_token_claims(). An Authorization
+    header with another scheme is ignored in favour of the API key.
+
+    Args:
+        db (AsyncSession): Database session.
+        api_key (Optional[str]): API key provided in the request header.
+        authorization (Optional[str]): Value of the Authorization request header.
+
+    Raises:
+        HTTPException: If the credentials are missing or invalid.
+
+    Returns:
+        Principal: The authenticated user.
+    """
+    scheme, _, _ = (authorization or "").partition(" ")
+    if scheme.lower() == "bearer":
+        return (await get_token_claims(authorization)).principal
 
+    return await get_api_key_user(db, api_key)
 
-async def get_user_by_id(user_id: int, db: AsyncSession) -> User:
+
+class UserSummary(NamedTuple):
+    """
+    Columns of a user read by handlers, loaded without an ORM instance.
+
+    Attributes:
+        id (int): The ID of the user.
+        name (str): Name of the user.
+        follower_count (int): Number of followers.
+        fanout_mode (str): FANOUT_PUSH or FANOUT_PULL.
+    """
+
+    id: int
+    name: str
+    follower_count: int
+    fanout_mode: str
+
+
+async def get_user_by_id(
+    user_id: int, db: AsyncSession, lock: Optional[str] = None
+) -> UserSummary:
     """
     Retrieve a user by their ID.
 
     Args:
         user_id (int): The ID of the user to retrieve.
         db (AsyncSession): Database session.
+        lock (Optional[str]): Lock the user row until the end of the transaction,
+            "update" for FOR UPDATE or "key share" for FOR KEY SHARE.
 
     Raises:
         HTTPException: If the user with the given ID is not found.
 
     Returns:
-        User: The user object corresponding to the provided ID.
+        UserSummary: The user corresponding to the provided ID.
     """
-    user_select = await db.execute(select(User).where(User.id == user_id))
-    user = user_select.scalars().first()
+    user_query = select(
+        User.id, User.name, User.follower_count, User.fanout_mode
+    ).where(User.id == user_id)
+    if lock == "update":
+        user_query = user_query.with_for_update()
+    elif lock == "key share":
+        user_query = user_query.with_for_update(read=True, key_share=True)
+    user_select = await db.execute(user_query)
+    user = user_select.first()
 
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return user
+    return UserSummary(*user)
 
 
-async def get_followers(user: User, db: AsyncSession) -> List[UserOut]:
+async def get_followers(
+    user: Union[User, Principal, UserSummary], db: AsyncSession
+) -> List[UserOut]:
     """
     Retrieve a list of followers for a given user.
 
     Args:
-        user (User): The user for whom to retrieve followers.
+        user (Union[User, Principal, UserSummary]): The user for whom to retrieve followers.
         db (AsyncSession): Database session.
 
     Returns:
         List[UserOut]: A list of users who follow the given user.
     """
     followers_query = await db.execute(
-        select(User)
+        select(User.id, User.name)
         .join(Follow, Follow.user_id == User.id)
         .where(Follow.follower_id == user.id)
     )
     return [
-        UserOut(id=follower.id, name=follower.name)
-        for follower in followers_query.scalars().all()
+        UserOut(id=follower_id, name=name)
+        for follower_id, name in followers_query.all()
     ]
 
 
-async def get_followings(user: User, db: AsyncSession) -> List[UserOut]:
+async def get_followings(
+    user: Union[User, Principal, UserSummary], db: AsyncSession
+) -> List[UserOut]:
     """
     Retrieve a list of users followed by a given user.
 
     Args:
-        user (User): The user whose followings are to be retrieved.
+        user (Union[User, Principal, UserSummary]): The user whose followings are to be retrieved.
         db (AsyncSession): Database session.
 
     Returns:
         List[UserOut]: A list of users that the given user is following.
     """
     followings_query = await db.execute(
-        select(User)
+        select(User.id, User.name)
         .join(Follow, Follow.follower_id == User.id)
         .where(Follow.user_id == user.id)
     )
     return [
-        UserOut(id=following.id, name=following.name)
-        for following in followings_query.scalars().all()
+        UserOut(id=following_id, name=name)
+        for following_id, name in followings_query.all()
     ]
+
+
+def is_pull_author(author: Union[User, UserSummary]) -> bool:
+    """
+    Check whether an author's tweets are merged into feeds at read time.
+
+    Args:
+        author (Union[User, UserSummary]): The author of tweets.
+
+    Returns:
+        bool: True if the author's tweets are pulled by readers.
+    """
+    return author.fanout_mode == FANOUT_PULL
+
+
+def select_fanout_mode(author: UserSummary) -> str:
+    """
+    Choose the fan-out mode of an author from their follower count.
+
+    Authors with at least FANOUT_FOLLOWER_THRESHOLD followers are not fanned
+    out on write, since that would insert one timeline row per follower.
+    Pull-mode authors keep their mode until they drop below the threshold
+    reduced by FANOUT_HYSTERESIS. A threshold of 0 fans out every author.
+
+    Args:
+        author (UserSummary): The author of tweets with their current mode.
+
+    Returns:
+        str: FANOUT_PUSH or FANOUT_PULL.
+    """
+    if FANOUT_FOLLOWER_THRESHOLD <= 0:
+        return FANOUT_PUSH
+    if author.follower_count >= FANOUT_FOLLOWER_THRESHOLD:
+        return FANOUT_PULL
+    if author.follower_count < FANOUT_FOLLOWER_THRESHOLD * (1 - FANOUT_HYSTERESIS):
+        return FANOUT_PUSH
+    return author.fanout_mode
+
+
+async def switch_fanout_mode(
+    author: UserSummary, db: AsyncSession
+) -> Tuple[UserSummary, List[int]]:
+    """
+    Store the fan-out mode chosen by select_fanout_mode() for an author.
+
+    Tweets of pull-mode authors never reach timelines, so on the switch back
+    to push mode all their tweets are copied into the timelines of their
+    followers. The author row must be locked with FOR UPDATE, and follows
+    lock it with FOR KEY SHARE, so that no follow is missed by the copy.
+
+    Args:
+        author (UserSummary): The author, read with lock="update".
+        db (AsyncSession): Database session.
+
+    Returns:
+        Tuple[UserSummary, List[int]]: The author with the new mode and the IDs
+            of the users whose timelines received tweets.
+    """
+    mode = select_fanout_mode(author)
+    if mode == author.fanout_mode:
+        return author, []
+
+    await db.execute(update(User).where(User.id == author.id).values(fanout_mode=mode))
+    readers = []
+    if mode == FANOUT_PUSH:
+        readers = await backfill_author_timelines(author.id, db)
+    return author._replace(fanout_mode=mode), readers
+
+
+async def get_pull_authors(user_id: int, db: AsyncSession) -> List[int]:
+    """
+    Retrieve the followed authors whose tweets are merged into a feed at read time.
+
+    Args:
+        user_id (int): The ID of the user reading the feed.
+        db (AsyncSession): Database session.
+
+    Returns:
+        List[int]: IDs of the followed authors in pull mode.
+    """
+    authors = await db.execute(
+        select(Follow.follower_id)
+        .join(User, User.id == Follow.follower_id)
+        .where(Follow.user_id == user_id, User.fanout_mode == FANOUT_PULL)
+        .order_by(Follow.follower_id)
+    )
+    return authors.scalars().all()
+
+
+async def fan_out_tweet(tweet: Tweet, db: AsyncSession) -> List[int]:
+    """
+    Place a new tweet into the timelines of all followers of its author.
+
+    Args:
+        tweet (Tweet): The freshly created tweet.
+        db (AsyncSession): Database session.
+
+    Returns:
+        List[int]: IDs of the users whose timelines received the tweet.
+    """
+    readers = await db.execute(
+        insert(Timeline)
+        .from_select(
+            ["user_id", "tweet_id", "author_id"],
+            select(
+                Follow.user_id,
+                literal(tweet.id, Integer),
+                literal(tweet.user_id, Integer),
+            ).where(Follow.follower_id == tweet.user_id),
+        )
+        .returning(Timeline.user_id)
+    )
+    return readers.scalars().all()
+
+
+async def backfill_author_timelines(author_id: int, db: AsyncSession) -> List[int]:
+    """
+    Place all tweets of an author into the timelines of all their followers.
+
+    Entries already in a timeline are kept.
+
+    Args:
+        author_id (int): The ID of the author.
+        db (AsyncSession): Database session.
+
+    Returns:
+        List[int]: IDs of the users whose timelines received tweets.
+    """
+    readers = await db.execute(
+        pg_insert(Timeline)
+        .from_select(
+            ["user_id", "tweet_id", "author_id"],
+            select(Follow.user_id, Tweet.id, Tweet.user_id)
+            .join(Follow, Follow.follower_id == Tweet.user_id)
+            .where(Tweet.user_id == author_id),
+        )
+        .on_conflict_do_nothing(constraint="unique_timeline_entry")
+        .returning(Timeline.user_id)
+    )
+    return sorted(set(readers.scalars().all()))
+
+
+async def remove_tweet_from_timelines(tweet_id: int, db: AsyncSession) -> List[int]:
+    """
+    Remove a tweet from every timeline it was placed into.
+
+    Args:
+        tweet_id (int): The ID of the tweet being deleted.
+        db (AsyncSession): Database session.
+
+    Returns:
+        List[int]: IDs of the users whose timelines contained the tweet.
+    """
+    readers = await db.execute(
+        delete(Timeline)
+        .where(Timeline.tweet_id == tweet_id)
+        .returning(Timeline.user_id)
+    )
+    return readers.scalars().all()
+
+
+async def get_timeline_readers(tweet_id: int, db: AsyncSession) -> List[int]:
+    """
+    Retrieve the users whose timelines contain a tweet.
+
+    Args:
+        tweet_id (int): The ID of the tweet.
+        db (AsyncSession): Database session.
+
+    Returns:
+        List[int]: IDs of the users whose feeds show the tweet.
+    """
+    readers = await db.execute(
+        select(Timeline.user_id).where(Timeline.tweet_id == tweet_id)
+    )
+    return readers.scalars().all()
+
+
+async def add_author_to_timeline(
+    user_id: int, author_id: int, db: AsyncSession
+) -> None:
+    """
+    Backfill a user's timeline with the tweets of a newly followed author.
+
+    Args:
+        user_id (int): The ID of the user who owns the timeline.
+        author_id (int): The ID of the followed author.
+        db (AsyncSession): Database session.
+    """
+    await db.execute(
+        insert(Timeline).from_select(
+            ["user_id", "tweet_id", "author_id"],
+            select(literal(user_id, Integer), Tweet.id, Tweet.user_id).where(
+                Tweet.user_id == author_id
+            ),
+        )
+    )
+
+
+async def remove_author_from_timeline(
+    user_id: int, author_id: int, db: AsyncSession
+) -> None:
+    """
+    Remove the tweets of an unfollowed author from a user's timeline.
+
+    Args:
+        user_id (int): The ID of the user who owns the timeline.
+        author_id (int): The ID of the unfollowed author.
+        db (AsyncSession): Database session.
+    """
+    await db.execute(
+        delete(Timeline).where(
+            Timeline.user_id == user_id, Timeline.author_id == author_id
+        )
+    )
+
+
+async def apply_like_delta(tweet_id: int, delta: int, db: AsyncSession) -> None:
+    """
+    Adjust the maintained like counter of a tweet.
+
+    Must be called in the same transaction that inserts or deletes the like.
+    The tweet gets a new version together with the counter. With
+    LIKE_COUNTER_SHARDS set the change goes to a shard of like_counter and
+    reaches Tweet.like_count and Tweet.version on the next compaction.
+
+    Args:
+        tweet_id (int): The ID of the liked tweet.
+        delta (int): Change of the counter, 1 for a like and -1 for its removal.
+        db (AsyncSession): Database session.
+    """
+    await like_counter.add(tweet_id, delta, db)
+
+
+def encode_cursor(ranking: str, score: Union[int, float], tweet_id: int) -> str:
+    """
+    Encode the sort key of the last tweet on a page into an opaque cursor.
+
+    Args:
+        ranking (str): Name of the ranking strategy of the feed.
+        score (Union[int, float]): The ranking score of the tweet.
+        tweet_id (int): The ID of the tweet.
+
+    Returns:
+        str: URL-safe cursor string.
+    """
+    payload = json.dumps([ranking, score, tweet_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def decode_cursor(cursor: str, ranking: str) -> Tuple[Union[int, float], int]:
+    """
+    Decode a cursor produced by encode_cursor.
+
+    Args:
+        cursor (str): The cursor received from the client.
+        ranking (str): Name of the ranking strategy of the requested page.
+
+    Raises:
+        HTTPException: If the cursor is malformed or belongs to another ranking.
+
+    Returns:
+        Tuple[Union[int, float], int]: The score and the ID of the last tweet of the previous page.
+    """
+    try:
+        cursor_ranking, score, tweet_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if (
+        cursor_ranking != ranking
+        or not isinstance(score, (int, float))
+        or not isinstance(tweet_id, int)
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return score, tweet_id
+
+
+def encode_changes_cursor(
+    since_version: int, watermark: int, version: int, tweet_id: int
+) -> str:
+    """
+    Encode the position within the changes since a feed version into an opaque cursor.
+
+    Args:
+        since_version (int): Feed version the changes are read since.
+        watermark (int): Feed version read with the first page of the changes.
+        version (int): The version of the last tweet on the page.
+        tweet_id (int): The ID of the last tweet on the page.
+
+    Returns:
+        str: URL-safe cursor string.
+    """
+    payload = json.dumps(["since", since_version, watermark, version, tweet_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_changes_cursor(
+    cursor: str, since_version: int
+) -> Tuple[int, Tuple[int, int]]:
+    """
+    Decode a cursor produced by encode_changes_cursor.
+
+    Args:
+        cursor (str): The cursor received from the client.
+        since_version (int): Feed version of the requested changes.
+
+    Raises:
+        HTTPException: If the cursor is malformed or belongs to other changes.
+
+    Returns:
+        Tuple[int, Tuple[int, int]]: The watermark of the first page and the version
+            and the ID of the last tweet of the previous page.
+    """
+    try:
+        kind, cursor_since, watermark, version, tweet_id = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if (
+        kind != "since"
+        or cursor_since != since_version
+        or not all(isinstance(value, int) for value in (watermark, version, tweet_id))
+    ):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return watermark, (version, tweet_id)
+
+
+def make_etag(version: str, key: str) -> str:
+    """
+    Build a weak entity tag from the version of a cached scope and the page key.
+
+    Args:
+        version (str): Version token of the feed or profile.
+        key (str): Key of the requested page within the scope.
+
+    Returns:
+        str: Value of the ETag header.
+    """
+    digest = hashlib.sha1(f"{version}:{key}".encode()).hexdigest()[:20]
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an entity tag using weak comparison.
+
+    Args:
+        if_none_match (Optional[str]): Value of the If-None-Match request header.
+        etag (str): Current entity tag of the resource.
+
+    Returns:
+        bool: True if the client already has the current representation.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in candidates
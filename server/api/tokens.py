@@ -0,0 +1,201 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import logging
+import time
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+from uuid import uuid4
+
+from .auth import Principal
+from .cache import CacheBackend, CacheError, InMemoryCacheBackend
+
+
+logger = logging.getLogger(__name__)
+
+
+class TokenError(Exception):
+    """
+    Raised when a session token is malformed, forged, signed with an unknown key or expired.
+    """
+
+
+class TokenClaims(NamedTuple):
+    """
+    Verified content of a session token.
+
+    Attributes:
+        principal (Principal): The user the token was issued to.
+        token_id (str): Unique ID of the token, used for revocation.
+        expires_at (int): Expiry time as a Unix timestamp.
+    """
+
+    principal: Principal
+    token_id: str
+    expires_at: int
+
+
+def parse_token_keys(value: str) -> Dict[str, bytes]:
+    """
+    Parse signing keys configured as "kid:secret" pairs separated by commas.
+
+    Args:
+        value (str): The configured keys, the first one signs new tokens.
+
+    Returns:
+        Dict[str, bytes]: Secrets by key ID, in configuration order.
+    """
+    keys = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        kid, separator, secret = item.strip().partition(":")
+        if not separator or not kid or not secret:
+            raise ValueError("Token keys must be given as kid:secret pairs")
+        keys[kid] = secret.encode()
+    return keys
+
+
+def _encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class TokenSigner:
+    """
+    Issuer and verifier of stateless HMAC-SHA256 session tokens.
+
+    A token is "<kid>.<payload>.<signature>", where the payload carries the
+    user's ID and name, a token ID and the expiry time, so verification needs
+    no database. The key with ID kid signs it; new tokens are signed with the
+    first key and tokens of all configured keys are accepted, so a key is
+    rotated by prepending a new one and removing the old one after the TTL.
+
+    Params:
+        keys (Dict[str, bytes]): Secrets by key ID, the first one signs new tokens.
+        ttl (int): Lifetime of issued tokens in seconds.
+        clock (Callable[[], float]): Source of the current Unix time.
+
+    Methods:
+        issue(principal): Returns a new token and its claims.
+        verify(token): Returns the claims of a valid token.
+    """
+
+    def __init__(
+        self, keys: Dict[str, bytes], ttl: int, clock: Callable[[], float] = time.time
+    ):
+        self.keys = keys
+        self.ttl = ttl
+        self.clock = clock
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keys)
+
+    def issue(self, principal: Principal) -> Tuple[str, TokenClaims]:
+        kid = next(iter(self.keys))
+        claims = TokenClaims(principal, uuid4().hex, int(self.clock()) + self.ttl)
+        payload = _encode(
+            json.dumps(
+                [principal.id, principal.name, claims.token_id, claims.expires_at]
+            ).encode()
+        )
+        return f"{kid}.{payload}.{self._sign(kid, payload)}", claims
+
+    def verify(self, token: str) -> TokenClaims:
+        """
+        Raises:
+            TokenError: If the token is not valid.
+        """
+        try:
+            kid, payload, signature = token.split(".")
+        except ValueError:
+            raise TokenError("Malformed token")
+        if kid not in self.keys:
+            raise TokenError("Unknown signing key")
+        if not hmac.compare_digest(signature, self._sign(kid, payload)):
+            raise TokenError("Invalid signature")
+
+        try:
+            user_id, name, token_id, expires_at = json.loads(_decode(payload))
+        except (binascii.Error, ValueError, TypeError):
+            raise TokenError("Malformed token")
+        if expires_at <= self.clock():
+            raise TokenError("Token expired")
+
+        return TokenClaims(Principal(user_id, name), token_id, expires_at)
+
+    def _sign(self, kid: str, payload: str) -> str:
+        digest = hmac.new(
+            self.keys[kid], f"{kid}.{payload}".encode(), hashlib.sha256
+        ).digest()
+        return _encode(digest)
+
+
+class TokenRevocations:
+    """
+    List of revoked session tokens kept in a storage backend until the tokens expire.
+
+    The backend must be shared by all workers and must not evict entries
+    before their TTL, otherwise a revoked token is accepted again; an
+    in-memory backend is refused for that reason. A failing backend counts
+    as a revocation on lookup, so callers fall back to API key
+    authentication, while revoke() raises CacheError. Without a backend
+    revocations are disabled, and so are the tokens that depend on them.
+
+    Params:
+        backend (Optional[CacheBackend]): Shared storage of the revoked token IDs.
+        clock (Callable[[], float]): Source of the current Unix time.
+
+    Methods:
+        revoke(claims): Revokes a token.
+        is_revoked(token_id): Checks whether a token is revoked.
+        available(): Checks whether the backend answers.
+        close(): Releases the backend.
+    """
+
+    prefix = "revoked-token"
+
+    def __init__(
+        self, backend: Optional[CacheBackend], clock: Callable[[], float] = time.time
+    ):
+        if isinstance(backend, InMemoryCacheBackend):
+            raise ValueError("Token revocations need a shared, non-evicting backend")
+        self.backend = backend
+        self.clock = clock
+
+    @property
+    def enabled(self) -> bool:
+        return self.backend is not None
+
+    async def revoke(self, claims: TokenClaims) -> None:
+        ttl = max(claims.expires_at - self.clock(), 1)
+        await self.backend.set(f"{self.prefix}:{claims.token_id}", b"1", ttl)
+
+    async def is_revoked(self, token_id: str) -> bool:
+        try:
+            return await self.backend.get(f"{self.prefix}:{token_id}") is not None
+        except CacheError as e:
+            logger.warning("Token revocation lookup failed: %s", e)
+            return True
+
+    async def available(self) -> bool:
+        """
+        Check that revocations can be looked up, so that issued tokens are usable.
+        """
+        if not self.enabled:
+            return False
+        try:
+            await self.backend.get(f"{self.prefix}:check")
+        except CacheError as e:
+            logger.warning("Token revocation store unavailable: %s", e)
+            return False
+        return True
+
+    async def close(self) -> None:
+        if self.enabled:
+            await self.backend.close()
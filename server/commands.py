@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, func, update
+from sqlalchemy.future import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from server.api.models import MEDIA_PENDING, CounterShard, Media, Tweet, Like
+from server.api.services import like_counter, follower_counter
+from server.config import MEDIA_PENDING_TTL
+from server.database.db_connection import AsyncSessionLocal
+
+
+async def backfill_like_counts(db: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Recompute the maintained like counters of all tweets from the likes table.
+
+    Tweets are processed in ID ranges, each committed separately, so that
+    row locks are held only for one batch at a time. Every batch holds the
+    lock of like_counter, so compaction does not run meanwhile, and deletes
+    the shards of its tweets in the statement recounting the likes. Shard
+    changes committed after the statement's snapshot, whose likes the recount
+    does not see, are kept: the deleted values exceed the visible ones by them.
+
+    Args:
+        db (AsyncSession): Database session.
+        batch_size (int): Number of tweet IDs processed per transaction.
+
+    Returns:
+        int: Number of tweets whose counter was corrected.
+    """
+    max_id = (await db.execute(select(func.max(Tweet.id)))).scalar() or 0
+
+    updated = 0
+    for start in range(0, max_id, batch_size):
+        in_batch = (
+            CounterShard.counter == like_counter.name,
+            CounterShard.object_id > start,
+            CounterShard.object_id <= start + batch_size,
+        )
+        drained = (
+            delete(CounterShard)
+            .where(*in_batch)
+            .returning(CounterShard.object_id, CounterShard.value)
+            .cte("drained")
+        )
+        drained_sum = (
+            select(func.coalesce(func.sum(drained.c.value), 0))
+            .where(drained.c.object_id == Tweet.id)
+            .scalar_subquery()
+        )
+        visible_sum = (
+            select(func.coalesce(func.sum(CounterShard.value), 0))
+            .where(*in_batch, CounterShard.object_id == Tweet.id)
+            .scalar_subquery()
+        )
+        like_count = (
+            select(func.count(Like.id))
+            .where(Like.tweet_id == Tweet.id)
+            .scalar_subquery()
+            + drained_sum
+            - visible_sum
+        )
+
+        await like_counter.lock(db, wait=True)
+        result = await db.execute(
+            update(Tweet)
+            .where(
+                Tweet.id > start,
+                Tweet.id <= start + batch_size,
+                Tweet.like_count != like_count,
+            )
+            .values(like_count=like_count, **like_counter.touch)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        updated += result.rowcount
+
+    return updated
+
+
+async def expire_pending_media(db: AsyncSession, max_age: int) -> int:
+    """
+    Delete media whose direct upload was started but not completed in time.
+
+    The objects possibly sent to S3 for them are left to the lifecycle rules
+    of the bucket.
+
+    Args:
+        db (AsyncSession): Database session.
+        max_age (int): Age in seconds after which a pending upload expires.
+
+    Returns:
+        int: Number of deleted media.
+    """
+    result = await db.execute(
+        delete(Media)
+        .where(
+            Media.status == MEDIA_PENDING,
+            Media.created_at < datetime.utcnow() - timedelta(seconds=max_age),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return result.rowcount
+
+
+async def run_backfill_like_counts(batch_size: int) -> None:
+    async with AsyncSessionLocal() as db:
+        updated = await backfill_like_counts(db, batch_size)
+    print(f"Updated like counters of {updated} tweets")
+
+
+async def run_compact_counters() -> None:
+    async with AsyncSessionLocal() as db:
+        for counter in (like_counter, follower_counter):
+            updated = await counter.compact(db)
+            print(f"Compacted {counter.name} of {updated} rows")
+
+
+async def run_expire_pending_media(max_age: int) -> None:
+    async with AsyncSessionLocal() as db:
+        deleted = await expire_pending_media(db, max_age)
+    print(f"Deleted {deleted} expired pending media")
+
+
+def main() -> None:
+    """
+    Entry point of the maintenance commands: `python -m server.commands <command>`.
+    """
+    parser = argparse.ArgumentParser(prog="python -m server.commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill = subparsers.add_parser(
+        "backfill-like-counts", help="Recompute tweets.like_count from likes"
+    )
+    backfill.add_argument("--batch-size", type=int, default=1000)
+
+    subparsers.add_parser(
+        "compact-counters", help="Fold sharded counters into their columns"
+    )
+
+    expire = subparsers.add_parser(
+        "expire-pending-media", help="Delete media whose upload was never completed"
+    )
+    expire.add_argument("--max-age", type=int, default=MEDIA_PENDING_TTL)
+
+    args = parser.parse_args()
+
+    if args.command == "backfill-like-counts":
+        asyncio.run(run_backfill_like_counts(args.batch_size))
+    elif args.command == "compact-counters":
+        asyncio.run(run_compact_counters())
+    elif args.command == "expire-pending-media":
+        asyncio.run(run_expire_pending_media(args.max_age))
+
+
+if __name__ == "__main__":
+    main()
@@ -10,8 +10,96 @@ def get_database_url():
     else:
         return os.environ.get("DATABASE_URL")
 
+ENV: str = os.environ.get("ENV", "development")
+
+DB_POOL_SIZE: int = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW: int = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT: float = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE: int = int(os.environ.get("DB_POOL_RECYCLE", 30 * 60))
+DB_POOL_PRE_PING: bool = os.environ.get("DB_POOL_PRE_PING", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+# Statement logging: "off", "all" (debug only), "slow" or "sampled".
+DB_STATEMENT_LOGGING: str = os.environ.get("DB_STATEMENT_LOGGING", "off")
+DB_SLOW_STATEMENT_MS: float = float(os.environ.get("DB_SLOW_STATEMENT_MS", 200))
+DB_STATEMENT_SAMPLE_RATE: float = float(
+    os.environ.get("DB_STATEMENT_SAMPLE_RATE", 0.01)
+)
+
+# Comma-separated URLs of read replicas serving GET requests.
+DATABASE_REPLICA_URLS: str = os.environ.get("DATABASE_REPLICA_URLS", "")
+READ_YOUR_WRITES_WINDOW: float = float(os.environ.get("READ_YOUR_WRITES_WINDOW", 5))
+REPLICA_MAX_LAG: float = float(os.environ.get("REPLICA_MAX_LAG", 2))
+REPLICA_LAG_CHECK_INTERVAL: float = float(
+    os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 1)
+)
+
 ACCESS_KEY: str | None = os.environ.get("ACCESS_KEY")
 SECRET_KEY: str | None = os.environ.get("SECRET_KEY")
 ENDPOINT_URL: str | None = os.environ.get("ENDPOINT_URL")
 BUCKET_NAME: str | None = os.environ.get("BUCKET_NAME")
 WEB_URL: str | None = os.environ.get("WEB_URL")
+S3_MAX_CONNECTIONS: int = int(os.environ.get("S3_MAX_CONNECTIONS", 10))
+S3_CONNECT_TIMEOUT: float = float(os.environ.get("S3_CONNECT_TIMEOUT", 5))
+S3_READ_TIMEOUT: float = float(os.environ.get("S3_READ_TIMEOUT", 30))
+S3_KEEPALIVE_TIMEOUT: float = float(os.environ.get("S3_KEEPALIVE_TIMEOUT", 30))
+# Media uploads are sent in parts of this size, S3 requires at least 5 MiB.
+S3_PART_SIZE: int = int(os.environ.get("S3_PART_SIZE", 8 * 1024 * 1024))
+S3_UPLOAD_CONCURRENCY: int = int(os.environ.get("S3_UPLOAD_CONCURRENCY", 4))
+S3_PART_RETRIES: int = int(os.environ.get("S3_PART_RETRIES", 3))
+S3_RETRY_BACKOFF: float = float(os.environ.get("S3_RETRY_BACKOFF", 0.5))
+S3_PRESIGNED_URL_TTL: int = int(os.environ.get("S3_PRESIGNED_URL_TTL", 15 * 60))
+# Seconds after which media whose direct upload was never completed is deleted.
+MEDIA_PENDING_TTL: int = int(os.environ.get("MEDIA_PENDING_TTL", 24 * 60 * 60))
+
+FEED_PAGE_SIZE: int = int(os.environ.get("FEED_PAGE_SIZE", 50))
+FEED_MAX_PAGE_SIZE: int = int(os.environ.get("FEED_MAX_PAGE_SIZE", 200))
+FEED_RANKING: str = os.environ.get("FEED_RANKING", "likes")
+FEED_STREAM_MAX_PAGE_SIZE: int = int(os.environ.get("FEED_STREAM_MAX_PAGE_SIZE", 5000))
+FEED_STREAM_BATCH_SIZE: int = int(os.environ.get("FEED_STREAM_BATCH_SIZE", 100))
+FEED_ENGINE: str = os.environ.get("FEED_ENGINE", "orm")
+READ_BACKEND: str = os.environ.get("READ_BACKEND", "orm")
+FEED_LIKES_MODE: str = os.environ.get("FEED_LIKES_MODE", "full")
+LIKE_PREVIEW_SIZE: int = int(os.environ.get("LIKE_PREVIEW_SIZE", 3))
+LIKES_PAGE_SIZE: int = int(os.environ.get("LIKES_PAGE_SIZE", 50))
+LIKES_MAX_PAGE_SIZE: int = int(os.environ.get("LIKES_MAX_PAGE_SIZE", 200))
+
+LIKE_COUNTER_SHARDS: int = int(os.environ.get("LIKE_COUNTER_SHARDS", 0))
+FOLLOWER_COUNTER_SHARDS: int = int(os.environ.get("FOLLOWER_COUNTER_SHARDS", 0))
+COUNTER_COMPACTION_INTERVAL: int = int(
+    os.environ.get("COUNTER_COMPACTION_INTERVAL", 60)
+)
+
+CACHE_BACKEND: str = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_URL: str = os.environ.get("CACHE_URL", "redis://localhost:6379/0")
+CACHE_MAX_BYTES: int = int(os.environ.get("CACHE_MAX_BYTES", 64 * 1024 * 1024))
+FEED_CACHE_TTL: float = float(os.environ.get("FEED_CACHE_TTL", 30))
+PROFILE_CACHE_TTL: float = float(os.environ.get("PROFILE_CACHE_TTL", 60))
+
+FEED_EVENTS_CHANNEL: str = os.environ.get("FEED_EVENTS_CHANNEL", "feed_events")
+FEED_EVENTS_QUEUE_SIZE: int = int(os.environ.get("FEED_EVENTS_QUEUE_SIZE", 100))
+FEED_EVENTS_KEEPALIVE: float = float(os.environ.get("FEED_EVENTS_KEEPALIVE", 15))
+# Seconds startup waits for the LISTEN connection before continuing without it.
+FEED_EVENTS_CONNECT_TIMEOUT: float = float(
+    os.environ.get("FEED_EVENTS_CONNECT_TIMEOUT", 5)
+)
+
+AUTH_CACHE_TTL: float = float(os.environ.get("AUTH_CACHE_TTL", 60))
+AUTH_NEGATIVE_CACHE_TTL: float = float(os.environ.get("AUTH_NEGATIVE_CACHE_TTL", 10))
+AUTH_CACHE_MAX_ENTRIES: int = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", 10000))
+AUTH_NEGATIVE_CACHE_MAX_ENTRIES: int = int(
+    os.environ.get("AUTH_NEGATIVE_CACHE_MAX_ENTRIES", 1000)
+)
+AUTH_TOKEN_KEYS: str = os.environ.get("AUTH_TOKEN_KEYS", "")
+AUTH_TOKEN_TTL: int = int(os.environ.get("AUTH_TOKEN_TTL", 15 * 60))
+# Redis-compatible server holding revoked session tokens. It is shared by all
+# workers and must not evict keys before they expire (maxmemory-policy noeviction).
+# Session tokens are not issued without it.
+TOKEN_REVOCATION_URL: str = os.environ.get("TOKEN_REVOCATION_URL", "")
+
+FANOUT_FOLLOWER_THRESHOLD: int = int(os.environ.get("FANOUT_FOLLOWER_THRESHOLD", 10000))
+# Pull-mode authors return to fan-out only below THRESHOLD * (1 - HYSTERESIS)
+# followers, so authors near the threshold do not switch back and forth.
+FANOUT_HYSTERESIS: float = float(os.environ.get("FANOUT_HYSTERESIS", 0.2))
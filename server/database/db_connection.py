@@ -1,37 +1,366 @@
-from typing import AsyncIterator
+import asyncio
+import itertools
+import logging
+import math
+import random
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from typing import AsyncIterator, Callable, List, Optional, Sequence
 
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from fastapi import Request, Response
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, AsyncSession
 from sqlalchemy.orm import declarative_base, sessionmaker
 
-from server.config import get_database_url
+from server.config import (
+    get_database_url,
+    ENV,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_LOGGING,
+    DB_SLOW_STATEMENT_MS,
+    DB_STATEMENT_SAMPLE_RATE,
+    DATABASE_REPLICA_URLS,
+    READ_YOUR_WRITES_WINDOW,
+    REPLICA_MAX_LAG,
+    REPLICA_LAG_CHECK_INTERVAL,
+)
+
+
+logger = logging.getLogger(__name__)
+statement_logger = logging.getLogger("server.database.statements")
 
+STATEMENT_LOGGING_MODES = ("off", "all", "slow", "sampled")
 
 Base = declarative_base()
 
-def get_engine(database_url: str):
+
+def install_statement_logging(
+    engine: AsyncEngine, mode: str, slow_ms: float, sample_rate: float
+) -> None:
+    """
+    Log executed statements of an engine selectively.
+
+    "slow" logs statements that took at least slow_ms milliseconds with a
+    warning, "sampled" logs a random sample_rate share of statements; both
+    time statements with cursor events. "all" and "off" are handled by the
+    engine's echo flag and install nothing.
+
+    Args:
+        engine (AsyncEngine): The engine to instrument.
+        mode (str): One of STATEMENT_LOGGING_MODES.
+        slow_ms (float): Duration threshold of the "slow" mode.
+        sample_rate (float): Share of statements logged in the "sampled" mode.
+    """
+    if mode not in ("slow", "sampled"):
+        return
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        context._started_at = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def log_statement(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context._started_at) * 1000
+        if mode == "slow" and elapsed_ms >= slow_ms:
+            statement_logger.warning(
+                "Slow statement (%.1f ms): %s", elapsed_ms, statement
+            )
+        elif mode == "sampled" and random.random() < sample_rate:
+            statement_logger.info("Statement (%.1f ms): %s", elapsed_ms, statement)
+
+
+def get_engine(database_url: str) -> AsyncEngine:
     """
     Creates an asynchronous SQLAlchemy engine for connecting to the database.
 
+    The pool and statement logging follow the DB_* settings of server.config.
+    Logging every statement ("all") is meant for debugging and is reported
+    when used with ENV=production.
+
     Args:
         database_url (str): The URL for connecting to the database.
 
     Returns:
         AsyncEngine: The created asynchronous engine.
     """
-    return create_async_engine(database_url, echo=True)
+    if DB_STATEMENT_LOGGING not in STATEMENT_LOGGING_MODES:
+        raise ValueError(f"Unknown statement logging mode: {DB_STATEMENT_LOGGING}")
+    if ENV == "production" and DB_STATEMENT_LOGGING == "all":
+        logger.warning(
+            "Every SQL statement is logged in production, "
+            "set DB_STATEMENT_LOGGING to off, slow or sampled"
+        )
+
+    engine = create_async_engine(
+        database_url,
+        echo=DB_STATEMENT_LOGGING == "all",
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+    install_statement_logging(
+        engine, DB_STATEMENT_LOGGING, DB_SLOW_STATEMENT_MS, DB_STATEMENT_SAMPLE_RATE
+    )
+    return engine
+
+
+SAFE_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+# Cookie carrying the Unix time until which the client reads from the primary.
+PRIMARY_UNTIL_COOKIE = "primary_until"
+
+# Seconds the replica is behind the primary; 0 when it has replayed all
+# received WAL, so an idle primary does not look like lag. NULL on a primary.
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class SessionRouter:
+    """
+    Chooser of the database a request's session is bound to.
+
+    Requests with safe methods read from a replica, picked round-robin among
+    those whose last measured lag is within max_lag; other requests go to the
+    primary. A client that sent a write reads from the primary for
+    sticky_window seconds afterwards, so it sees its own writes. Clients are
+    identified by their credentials and remembered per process; as the next
+    read may reach another worker, the deadline is also handed to the client
+    in the PRIMARY_UNTIL_COOKIE cookie and honoured by every worker, see
+    pin_writes_to_primary(). Without healthy replicas everything goes to the
+    primary. Sessions of replicas are marked, see is_replica().
+
+    Params:
+        primary (AsyncEngine): Engine of the primary database.
+        replicas (Sequence[AsyncEngine]): Engines of the read replicas.
+        sticky_window (float): Seconds a client reads from the primary after a write.
+        max_lag (float): Replication lag in seconds above which a replica is bypassed.
+        check_interval (float): Seconds between lag checks.
+        clock (Callable[[], float]): Source of the current Unix time, shared by workers.
+
+    Methods:
+        factory_for(method, client_key, pinned_until): Returns the session factory
+            for a request.
+        mark_write(client_key): Pins a client to the primary and returns the deadline.
+        check_lag(): Measures the lag of all replicas.
+        start(): Starts checking the lag periodically.
+        stop(): Stops checking and disposes of the replica engines.
+    """
+
+    def __init__(
+        self,
+        primary: AsyncEngine,
+        replicas: Sequence[AsyncEngine],
+        sticky_window: float,
+        max_lag: float,
+        check_interval: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.primary = sessionmaker(
+            bind=primary, expire_on_commit=False, class_=AsyncSession
+        )
+        self.replica_engines = list(replicas)
+        self.replicas = [
+            sessionmaker(
+                bind=replica,
+                expire_on_commit=False,
+                class_=AsyncSession,
+                info={"replica": True},
+            )
+            for replica in self.replica_engines
+        ]
+        # Unknown until the first check, so replicas are not used before it.
+        self.lags: List[float] = [math.inf] * len(self.replicas)
+        self.sticky_window = sticky_window
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.clock = clock
+        self.sticky: OrderedDict[str, float] = OrderedDict()
+        self.turn = itertools.count()
+        self.task: Optional[asyncio.Task] = None
+
+    def factory_for(
+        self,
+        method: str,
+        client_key: Optional[str],
+        pinned_until: Optional[float] = None,
+    ) -> sessionmaker:
+        if method not in SAFE_METHODS:
+            if client_key:
+                self.mark_write(client_key)
+            return self.primary
+
+        now = self.clock()
+        if client_key and self.sticky.get(client_key, 0) > now:
+            return self.primary
+        # Deadlines come from the client, so one never pins it longer than a write.
+        if pinned_until is not None and now < pinned_until <= now + self.sticky_window:
+            return self.primary
+
+        healthy = [
+            replica
+            for replica, lag in zip(self.replicas, self.lags)
+            if lag <= self.max_lag
+        ]
+        if not healthy:
+            return self.primary
+        return healthy[next(self.turn) % len(healthy)]
+
+    def mark_write(self, client_key: Optional[str]) -> float:
+        now = self.clock()
+        deadline = now + self.sticky_window
+        if client_key:
+            self.sticky[client_key] = deadline
+            self.sticky.move_to_end(client_key)
+        # Entries are ordered by expiry, as the window is the same for all.
+        while self.sticky and next(iter(self.sticky.values())) <= now:
+            self.sticky.popitem(last=False)
+        return deadline
+
+    async def check_lag(self) -> None:
+        for index, replica in enumerate(self.replica_engines):
+            try:
+                async with replica.connect() as conn:
+                    lag = (await conn.execute(REPLICA_LAG_QUERY)).scalar()
+            except (SQLAlchemyError, OSError) as e:
+                logger.warning("Lag check of replica %s failed: %s", index, e)
+                self.lags[index] = math.inf
+                continue
+
+            self.lags[index] = float(lag or 0)
+            if self.lags[index] > self.max_lag:
+                logger.warning(
+                    "Replica %s is %.1f s behind, reading from the primary",
+                    index,
+                    self.lags[index],
+                )
+
+    async def start(self) -> None:
+        if not self.replicas:
+            return
+        await self.check_lag()
+        self.task = asyncio.create_task(self._monitor())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            with suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+        for replica in self.replica_engines:
+            await replica.dispose()
+
+    async def _monitor(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_lag()
 
 
 engine = get_engine(get_database_url())
 AsyncSessionLocal = sessionmaker(
     bind=engine, expire_on_commit=False, class_=AsyncSession
 )
+session_router = SessionRouter(
+    engine,
+    [
+        get_engine(url.strip())
+        for url in DATABASE_REPLICA_URLS.split(",")
+        if url.strip()
+    ],
+    sticky_window=READ_YOUR_WRITES_WINDOW,
+    max_lag=REPLICA_MAX_LAG,
+    check_interval=REPLICA_LAG_CHECK_INTERVAL,
+)
+
+
+def is_replica(db: AsyncSession) -> bool:
+    """
+    Tell whether a session reads from a replica, which may lag behind the primary.
+    """
+    return db.info.get("replica", False)
+
+
+def get_client_key(request: Request) -> Optional[str]:
+    """
+    Identify the client of a request by its credentials, for read-your-writes routing.
+    """
+    return request.headers.get("api-key") or request.headers.get("authorization")
+
+
+def get_pinned_until(request: Request) -> Optional[float]:
+    """
+    Read the deadline of reading from the primary set by a previous write.
+    """
+    try:
+        return float(request.cookies[PRIMARY_UNTIL_COOKIE])
+    except (KeyError, ValueError):
+        return None
 
 
-async def get_db() -> AsyncIterator[AsyncSession]:
+async def pin_writes_to_primary(request: Request, call_next) -> Response:
+    """
+    Middleware handing the read-your-writes deadline of a write to the client.
+
+    The deadline is taken when the handler has finished, so the window starts
+    after the write is committed, and is sent back by the client with its
+    next requests, whichever worker serves them.
+
+    Args:
+        request (Request): The current request.
+        call_next: The rest of the application.
+
+    Returns:
+        Response: The response, with PRIMARY_UNTIL_COOKIE set after a write.
+    """
+    response = await call_next(request)
+    if request.method not in SAFE_METHODS:
+        deadline = session_router.mark_write(get_client_key(request))
+        response.set_cookie(
+            PRIMARY_UNTIL_COOKIE,
+            f"{deadline:.3f}",
+            max_age=math.ceil(session_router.sticky_window),
+            httponly=True,
+            samesite="lax",
+        )
+    return response
+
+
+def get_session_factory(request: Request) -> sessionmaker:
+    """
+    Provide the factory of database sessions for the request.
+
+    Used by handlers whose work outlives the request dependencies, such as
+    streaming responses, which must open and close their own session.
+
+    Args:
+        request (Request): The current request, deciding between primary and replica.
+
+    Returns:
+        sessionmaker: Factory creating AsyncSession instances.
+    """
+    return session_router.factory_for(
+        request.method, get_client_key(request), get_pinned_until(request)
+    )
+
+
+async def get_db(request: Request) -> AsyncIterator[AsyncSession]:
     """
     Asynchronous generator for obtaining a database session.
 
-    Uses a context manager to create and close the database session.
+    Uses a context manager to create and close the database session. Safe
+    requests are served by a replica, see SessionRouter; the deadline after
+    writes is renewed by pin_writes_to_primary().
+
+    Args:
+        request (Request): The current request, deciding between primary and replica.
 
     Yields:
         AsyncSession: The active database session.
@@ -39,6 +368,8 @@ async def get_db() -> AsyncIterator[AsyncSession]:
     Notes:
         The session is automatically closed after use.
     """
-    async with AsyncSessionLocal() as session:
+    factory = session_router.factory_for(
+        request.method, get_client_key(request), get_pinned_until(request)
+    )
+    async with factory() as session:
         yield session
-
@@ -1,24 +1,79 @@
-from contextlib import asynccontextmanager
+import asyncio
+from contextlib import asynccontextmanager, suppress
+import logging
 import os
 
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse, FileResponse
 
-from server.database.db_connection import engine, Base
-from server.api.routers import router
+from server.config import (
+    COUNTER_COMPACTION_INTERVAL,
+    FEED_EVENTS_CONNECT_TIMEOUT,
+    get_database_url,
+)
+from server.database.db_connection import (
+    engine,
+    Base,
+    AsyncSessionLocal,
+    session_router,
+    pin_writes_to_primary,
+)
+from server.api.routers import router, cache_backend, event_hub, s3_client
+from server.api.services import like_counter, follower_counter, token_revocations
+
+logger = logging.getLogger(__name__)
+
+
+async def compact_counters_periodically(interval: int):
+    """
+    Fold sharded counters into their columns every `interval` seconds.
+
+    A failed round is logged and retried at the next interval, so that a
+    database outage does not stop compaction for the lifetime of the worker.
+    """
+    counters = [
+        counter for counter in (like_counter, follower_counter) if counter.sharded
+    ]
+    while True:
+        await asyncio.sleep(interval)
+        for counter in counters:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await counter.compact(db)
+            except Exception:
+                logger.exception("Compaction of %s failed", counter.name)
 
 
 @asynccontextmanager
 async def lifespan(application: FastAPI):
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+
+    compaction = None
+    if like_counter.sharded or follower_counter.sharded:
+        compaction = asyncio.create_task(
+            compact_counters_periodically(COUNTER_COMPACTION_INTERVAL)
+        )
+    await event_hub.start(get_database_url(), FEED_EVENTS_CONNECT_TIMEOUT)
+    await session_router.start()
+    await s3_client.start()
     yield
+    await s3_client.close()
+    await session_router.stop()
+    await event_hub.stop()
+    if compaction is not None:
+        compaction.cancel()
+        with suppress(asyncio.CancelledError):
+            await compaction
+    await cache_backend.close()
+    await token_revocations.close()
     await engine.dispose()
 
 
 app: FastAPI = FastAPI(lifespan=lifespan)
 
+app.middleware("http")(pin_writes_to_primary)
 app.include_router(router)
 
 static_dir = "/static"
@@ -1,19 +1,30 @@
+import asyncio
+import importlib.util
 import os
+import re
 from datetime import datetime
+from pathlib import Path
 from typing import AsyncGenerator
+from uuid import uuid4
 
 import pytest
+from aiohttp import web
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
 from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from server.main import app
-from server.api.models import User
-from server.database.db_connection import Base, get_db
+from server.api.routers import cache_backend
+from server.api.services import principal_cache
+from server.api.models import S3Client, User
+from server.database.db_connection import Base, get_db, get_session_factory
 from server.config import get_database_url
 
 os.environ["ENV"] = "test"
 
 DATABASE_URL_TEST = get_database_url()
+MIGRATIONS_DIR = Path(__file__).parent.parent / "server" / "alembic" / "versions"
 
 test_engine = create_async_engine(DATABASE_URL_TEST, echo=True)
 TestingSessionLocal = sessionmaker(
@@ -56,6 +67,239 @@ async def test_user(db_session: AsyncSession) -> User:
 @pytest.fixture(scope="function")
 async def client(db_session) -> AsyncGenerator:
     app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[get_session_factory] = lambda: TestingSessionLocal
+    cache_backend.clear()
+    principal_cache.clear()
     async with AsyncClient(app=app, base_url="http://test") as client:
         yield client
     app.dependency_overrides.clear()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+async def run_migration(revision: str) -> None:
+    """
+    Run the upgrade of one alembic revision against the test database.
+    """
+    path = next(MIGRATIONS_DIR.glob(f"{revision}_*.py"))
+    spec = importlib.util.spec_from_file_location(path.stem, path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+
+    def upgrade(connection):
+        with Operations.context(MigrationContext.configure(connection)):
+            migration.upgrade()
+
+    async with test_engine.begin() as conn:
+        await conn.run_sync(upgrade)
+
+
+class S3StandIn:
+    """
+    Minimal HTTP server answering S3 object requests, keeping objects in memory.
+
+    Objects are stored by bucket and key, both path-style and virtual-host
+    requests are understood, and multipart uploads are supported. The peers
+    of all requests are recorded, so tests can count the connections a
+    client opened. Parts whose number is in failing_parts are rejected,
+    those in flaky_parts fail with a server error the given number of times.
+    Every request takes latency seconds, and the highest number of parts
+    received at once is recorded.
+    """
+
+    def __init__(self, bucket: str = "media", latency: float = 0):
+        self.bucket = bucket
+        self.latency = latency
+        self.objects = {}
+        self.uploads = {}
+        self.aborted = []
+        self.failing_parts = set()
+        self.flaky_parts = {}
+        self.part_attempts = {}
+        self.parts_in_flight = 0
+        self.max_parts_in_flight = 0
+        self.peers = []
+        self.runner = None
+        self.port = None
+
+    @property
+    def endpoint_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def client(self, **options) -> S3Client:
+        options.setdefault("max_attempts", 1)
+        return S3Client(
+            access_key="access",
+            secret_key="secret",
+            endpoint_url=self.endpoint_url,
+            bucket_name=self.bucket,
+            web_url="http://web",
+            **options,
+        )
+
+    async def start(self):
+        app = web.Application(client_max_size=1024**3)
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    def object_key(self, request: web.Request) -> str:
+        path = request.match_info["path"]
+        if request.host.startswith(f"{self.bucket}."):
+            return path
+        bucket, _, key = path.partition("/")
+        if bucket != self.bucket:
+            raise web.HTTPNotFound()
+        return key
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.peers.append(request.transport.get_extra_info("peername"))
+        key = self.object_key(request)
+        upload_id = request.query.get("uploadId")
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if request.method == "POST" and "uploads" in request.query:
+            upload_id = uuid4().hex
+            self.uploads[upload_id] = {}
+            return xml_response(
+                "InitiateMultipartUploadResult",
+                f"<Bucket>{self.bucket}</Bucket><Key>{key}</Key>"
+                f"<UploadId>{upload_id}</UploadId>",
+            )
+        if upload_id is not None and upload_id not in self.uploads:
+            return error_response(404, "NoSuchUpload")
+        if request.method == "PUT" and upload_id is not None:
+            number = int(request.query["partNumber"])
+            self.part_attempts[number] = self.part_attempts.get(number, 0) + 1
+            self.parts_in_flight += 1
+            self.max_parts_in_flight = max(
+                self.max_parts_in_flight, self.parts_in_flight
+            )
+            try:
+                body = await request.read()
+                await asyncio.sleep(0.01)
+            finally:
+                self.parts_in_flight -= 1
+            if number in self.failing_parts:
+                return error_response(400, "InvalidRequest")
+            if self.flaky_parts.get(number):
+                self.flaky_parts[number] -= 1
+                return error_response(500, "InternalError")
+            self.uploads[upload_id][number] = body
+            return web.Response(headers={"ETag": f'"part-{number}"'})
+        if request.method == "POST" and upload_id is not None:
+            numbers = [
+                int(number)
+                for number in re.findall(
+                    r"<PartNumber>(\d+)</PartNumber>", await request.text()
+                )
+            ]
+            parts = self.uploads.pop(upload_id)
+            self.objects[key] = b"".join(parts[number] for number in numbers)
+            return xml_response(
+                "CompleteMultipartUploadResult",
+                f'<Bucket>{self.bucket}</Bucket><Key>{key}</Key><ETag>"{key}"</ETag>',
+            )
+        if request.method == "DELETE" and upload_id is not None:
+            del self.uploads[upload_id]
+            self.aborted.append(upload_id)
+            return web.Response(status=204)
+        if request.method == "PUT":
+            self.objects[key] = await request.read()
+            return web.Response(headers={"ETag": f'"{len(self.objects)}"'})
+        if request.method in ("GET", "HEAD") and key in self.objects:
+            return web.Response(body=self.objects[key])
+        raise web.HTTPNotFound()
+
+
+def xml_response(root: str, content: str) -> web.Response:
+    return web.Response(
+        text=f'<?xml version="1.0" encoding="UTF-8"?><{root}>{content}</{root}>',
+        content_type="application/xml",
+    )
+
+
+def error_response(status: int, code: str) -> web.Response:
+    response = xml_response("Error", f"<Code>{code}</Code><Message>{code}</Message>")
+    response.set_status(status)
+    return response
+
+
+@pytest.fixture
+async def s3_standin():
+    server = S3StandIn()
+    await server.start()
+    yield server
+    await server.stop()
+
+
+class RedisStandIn:
+    """
+    Minimal server speaking the Redis protocol, supporting GET and SET with PX and NX.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                command = await self.read_command(reader)
+                writer.write(self.execute(command))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+
+    async def read_command(self, reader):
+        count = int((await reader.readuntil(b"\r\n"))[1:-2])
+        arguments = []
+        for _ in range(count):
+            length = int((await reader.readuntil(b"\r\n"))[1:-2])
+            arguments.append((await reader.readexactly(length + 2))[:-2])
+        return arguments
+
+    def execute(self, command):
+        name = command[0].upper()
+        if name == b"GET":
+            value = self.data.get(command[1])
+            if value is None:
+                return b"$-1\r\n"
+            return b"$%d\r\n%s\r\n" % (len(value), value)
+        if name == b"SET":
+            options = [option.upper() for option in command[3:]]
+            if b"NX" in options and command[1] in self.data:
+                return b"$-1\r\n"
+            self.data[command[1]] = command[2]
+            return b"+OK\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+@pytest.fixture
+async def redis_standin():
+    server = RedisStandIn()
+    await server.start()
+    yield server
+    await server.stop()
@@ -1,14 +1,55 @@
-from datetime import datetime
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
 
+import asyncpg
 import pytest
 from unittest.mock import patch
 from io import BytesIO
 
-from sqlalchemy import select
-
-from server.api.routers import s3_client
-from server.api.models import Media, Tweet, User, Follow, Like
-from tests.conftest import db_session
+from httpx import AsyncClient
+
+from sqlalchemy import event, func, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from server.api.auth import Principal, PrincipalCache
+from server.api.events import EventHub
+from server.api.cache import CacheError, InMemoryCacheBackend, RedisCacheBackend
+from server.api.tokens import TokenError, TokenRevocations, TokenSigner
+from server.api.routers import s3_client, cache_backend, event_hub, get_feed_events
+from server.commands import backfill_like_counts, expire_pending_media
+from server.main import compact_counters_periodically
+from server.api.counters import ShardedCounter
+from server.api.services import like_counter
+from server.api.ranking import RankingStrategy
+from server.api.reads import fetch_rows
+from server.api.models import (
+    FANOUT_PULL,
+    FANOUT_PUSH,
+    MEDIA_PENDING,
+    MEDIA_READY,
+    Media,
+    Tweet,
+    User,
+    Follow,
+    Like,
+    Timeline,
+    CounterShard,
+)
+from server.database.db_connection import (
+    PRIMARY_UNTIL_COOKIE,
+    SessionRouter,
+    install_statement_logging,
+)
+from tests.conftest import (
+    FakeClock,
+    TestingSessionLocal,
+    db_session,
+    run_migration,
+    test_engine,
+)
+from server.config import FEED_MAX_PAGE_SIZE, get_database_url
 
 
 @pytest.mark.asyncio
@@ -28,7 +69,7 @@ async def test_upload_media(client, db_session):
     """
     Test of upload media to S3
     """
-    with patch("server.api.routers.s3_client.upload_file_obj") as mock_upload:
+    with patch("server.api.routers.s3_client.upload_stream") as mock_upload:
         mock_upload.return_value = None
 
         test_file = BytesIO(b"Test file content")
@@ -299,6 +340,9 @@ async def test_like_to_tweet(client, test_user, db_session):
     )
     assert likes.scalars().first() is not None
 
+    await db_session.refresh(tweet)
+    assert tweet.like_count == 1
+
 
 @pytest.mark.asyncio
 async def test_like_nonexistent_tweet(client, test_user):
@@ -337,6 +381,9 @@ async def test_remove_like(client, test_user, db_session):
     )
     assert likes.scalars().first() is None
 
+    await db_session.refresh(tweet)
+    assert tweet.like_count == 0
+
 
 @pytest.mark.asyncio
 async def test_remove_like_nonexistent_tweet(client, test_user):
@@ -374,10 +421,11 @@ async def test_get_tweets_by_followings(client, test_user, db_session):
     db_session.add_all([tweet1, tweet2])
     await db_session.commit()
 
-    follow1 = Follow(user_id=test_user.id, follower_id=user2.id)
-    follow2 = Follow(user_id=test_user.id, follower_id=user3.id)
-    db_session.add_all([follow1, follow2])
-    await db_session.commit()
+    for followed_user in (user2, user3):
+        await client.post(
+            f"/api/users/{followed_user.id}/follow",
+            headers={"api-key": test_user.api_key},
+        )
 
     response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
     assert response.status_code == 200, response.text
@@ -386,6 +434,94 @@ async def test_get_tweets_by_followings(client, test_user, db_session):
     assert len(json_response["tweets"]) == 2
 
 
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_existing_follows(client, test_user, db_session):
+    """
+    Test of backfilling timelines of follows written before the timelines migration
+    """
+    authors = [
+        User(
+            name=f"Author{number}",
+            api_key=f"author_api_key_{number}",
+            username=f"Author{number}",
+            email=f"author{number}@example.com",
+        )
+        for number in range(2)
+    ]
+    db_session.add_all(authors)
+    await db_session.commit()
+
+    tweets = [
+        Tweet(content=f"Tweet by {author.name}", user_id=author.id)
+        for author in authors
+    ]
+    db_session.add_all(tweets)
+    db_session.add_all(
+        [Follow(user_id=test_user.id, follower_id=author.id) for author in authors]
+    )
+    await db_session.commit()
+
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert response.json()["tweets"] == []
+
+    await run_migration("b5e8d2f1c3a7")
+    await run_migration("b5e8d2f1c3a7")
+    cache_backend.clear()
+
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert response.status_code == 200, response.text
+    assert sorted(tweet["id"] for tweet in response.json()["tweets"]) == sorted(
+        tweet.id for tweet in tweets
+    )
+    timeline = await db_session.execute(
+        select(Timeline).where(Timeline.user_id == test_user.id)
+    )
+    assert len(timeline.scalars().all()) == 2
+
+
+@pytest.mark.asyncio
+async def test_timeline_fan_out(client, test_user, db_session):
+    """
+    Test of keeping the materialized timeline in sync with tweets and follows
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Fanned out tweet"},
+        headers={"api-key": author.api_key},
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    timeline = await db_session.execute(
+        select(Timeline.tweet_id).where(Timeline.user_id == test_user.id)
+    )
+    assert timeline.scalars().all() == [tweet_id]
+
+    await client.delete(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert response.json()["tweets"] == []
+
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    await client.delete(f"/api/tweets/{tweet_id}", headers={"api-key": author.api_key})
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert response.json()["tweets"] == []
+
+
 @pytest.mark.asyncio
 async def test_get_user_info(client, test_user):
     """
@@ -421,3 +557,1550 @@ async def test_get_user_info_by_id(client, test_user, db_session):
     assert json_response["result"] is True
     assert json_response["user"]["id"] == user2.id
     assert json_response["user"]["name"] == user2.name
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_pagination(client, test_user, db_session):
+    """
+    Test of keyset pagination of the feed
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+
+    tweets = [Tweet(content=f"Tweet {i}", user_id=author.id) for i in range(5)]
+    db_session.add_all(tweets)
+    await db_session.commit()
+    await client.post(
+        f"/api/tweets/{tweets[2].id}/likes", headers={"api-key": test_user.api_key}
+    )
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get(
+            "/api/tweets", params=params, headers={"api-key": test_user.api_key}
+        )
+        assert response.status_code == 200, response.text
+        json_response = response.json()
+        assert len(json_response["tweets"]) <= 2
+        seen.extend(tweet["id"] for tweet in json_response["tweets"])
+        cursor = json_response["next_cursor"]
+        if cursor is None:
+            break
+
+    expected = [tweets[2].id] + sorted(
+        (tweet.id for tweet in tweets if tweet is not tweets[2]), reverse=True
+    )
+    assert seen == expected
+
+    response = await client.get(
+        "/api/tweets",
+        params={"cursor": "not-a-cursor"},
+        headers={"api-key": test_user.api_key},
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_query_count(client, test_user, db_session):
+    """
+    Test of a fixed number of queries per feed request regardless of likes
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    likers = [
+        User(
+            name=f"Liker{i}",
+            api_key=f"liker_api_key_{i}",
+            username=f"Liker{i}",
+            email=f"liker{i}@example.com",
+        )
+        for i in range(20)
+    ]
+    db_session.add_all([author, *likers])
+    await db_session.commit()
+
+    tweets = [Tweet(content=f"Tweet {i}", user_id=author.id) for i in range(3)]
+    db_session.add_all(tweets)
+    await db_session.commit()
+    db_session.add_all(
+        [
+            Like(user_id=liker.id, tweet_id=tweet.id)
+            for tweet in tweets
+            for liker in likers
+        ]
+    )
+    await db_session.commit()
+
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        response = await client.get(
+            "/api/tweets", headers={"api-key": test_user.api_key}
+        )
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    assert response.status_code == 200, response.text
+    json_response = response.json()
+    assert len(json_response["tweets"]) == 3
+    assert all(len(tweet["likes"]) == 20 for tweet in json_response["tweets"])
+    assert len(statements) <= 4, statements
+
+
+@pytest.mark.asyncio
+async def test_backfill_like_counts(test_user, db_session):
+    """
+    Test of recomputing like counters from the likes table
+    """
+    tweets = [Tweet(content=f"Tweet {i}", user_id=test_user.id) for i in range(3)]
+    db_session.add_all(tweets)
+    await db_session.commit()
+    db_session.add_all([Like(user_id=test_user.id, tweet_id=tweets[1].id)])
+    await db_session.commit()
+
+    updated = await backfill_like_counts(db_session, batch_size=2)
+    assert updated == 1
+
+    for tweet in tweets:
+        await db_session.refresh(tweet)
+    assert [tweet.like_count for tweet in tweets] == [0, 1, 0]
+
+
+@pytest.mark.asyncio
+async def test_backfill_like_counts_with_shards(test_user, db_session):
+    """
+    Test of recomputing like counters while folding their shards under the lock
+    """
+    tweets = [Tweet(content=f"Tweet {i}", user_id=test_user.id) for i in range(2)]
+    db_session.add_all(tweets)
+    await db_session.commit()
+    db_session.add_all(
+        [Like(user_id=test_user.id, tweet_id=tweet.id) for tweet in tweets]
+    )
+    db_session.add_all(
+        [
+            CounterShard(
+                counter=like_counter.name, object_id=tweets[0].id, shard=0, value=1
+            ),
+            CounterShard(
+                counter=like_counter.name, object_id=tweets[1].id, shard=0, value=3
+            ),
+        ]
+    )
+    await db_session.commit()
+
+    async with TestingSessionLocal() as other:
+        await like_counter.lock(other)
+        backfill = asyncio.create_task(backfill_like_counts(db_session))
+        await asyncio.sleep(0.2)
+        assert not backfill.done()
+        await other.rollback()
+    assert await backfill == 2
+
+    for tweet in tweets:
+        await db_session.refresh(tweet)
+    assert [tweet.like_count for tweet in tweets] == [1, 1]
+    shards = await db_session.execute(
+        select(CounterShard).where(CounterShard.counter == like_counter.name)
+    )
+    assert shards.scalars().all() == []
+
+
+@pytest.mark.asyncio
+async def test_sharded_like_counter(test_user, db_session):
+    """
+    Test of spreading like counter changes over shards and compacting them
+    """
+    tweet = Tweet(content="Hot tweet", user_id=test_user.id)
+    db_session.add(tweet)
+    await db_session.commit()
+
+    counter = ShardedCounter(Tweet.like_count, shards=4)
+    for delta in (1, 1, 1, -1, 1):
+        await counter.add(tweet.id, delta, db_session)
+    await db_session.commit()
+
+    assert await counter.totals([tweet.id], db_session) == {tweet.id: 3}
+    await db_session.refresh(tweet)
+    assert tweet.like_count == 0
+
+    async with TestingSessionLocal() as other:
+        await other.execute(
+            select(func.pg_advisory_xact_lock(func.hashtext(counter.name)))
+        )
+        assert await counter.compact(db_session) == 0
+    assert await counter.compact(db_session) == 1
+
+    await db_session.refresh(tweet)
+    assert tweet.like_count == 3
+    shards = await db_session.execute(select(CounterShard))
+    assert shards.scalars().all() == []
+    assert await counter.totals([tweet.id], db_session) == {tweet.id: 3}
+
+
+@pytest.mark.asyncio
+async def test_compaction_survives_errors(monkeypatch):
+    """
+    Test of continuing periodic compaction after a failed round
+    """
+    rounds = []
+
+    class FailingCounter:
+        name = "tweets.like_count"
+        sharded = True
+
+        async def compact(self, db):
+            rounds.append(len(rounds))
+            if len(rounds) == 1:
+                raise ConnectionError("Database unavailable")
+            return 0
+
+    monkeypatch.setattr("server.main.like_counter", FailingCounter())
+    task = asyncio.create_task(compact_counters_periodically(0))
+    while len(rounds) < 3:
+        await asyncio.sleep(0.01)
+    assert not task.done()
+    task.cancel()
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_cache(client, test_user, db_session):
+    """
+    Test of serving repeated feed reads from the cache until the feed changes
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "First tweet"},
+        headers={"api-key": author.api_key},
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    first = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    hits = cache_backend.stats()["hits"]
+    second = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert second.json() == first.json()
+    assert cache_backend.stats()["hits"] == hits + 2
+
+    await client.post(
+        f"/api/tweets/{tweet_id}/likes", headers={"api-key": author.api_key}
+    )
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert response.json()["tweets"][0]["likes"] == [
+        {"user_id": author.id, "name": author.name}
+    ]
+
+    await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Second tweet"},
+        headers={"api-key": author.api_key},
+    )
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert len(response.json()["tweets"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_pull_author(
+    client, test_user, db_session, monkeypatch
+):
+    """
+    Test of merging tweets of authors above the fan-out threshold at read time
+    """
+    monkeypatch.setattr("server.api.services.FANOUT_FOLLOWER_THRESHOLD", 2)
+
+    celebrity = User(
+        name="Celebrity",
+        api_key="celebrity_api_key",
+        username="Celebrity",
+        email="celebrity@example.com",
+    )
+    fan = User(
+        name="Fan",
+        api_key="fan_api_key",
+        username="Fan",
+        email="fan@example.com",
+    )
+    db_session.add_all([celebrity, fan])
+    await db_session.commit()
+
+    for follower in (fan, test_user):
+        await client.post(
+            f"/api/users/{celebrity.id}/follow", headers={"api-key": follower.api_key}
+        )
+    await db_session.refresh(celebrity)
+    assert celebrity.follower_count == 2
+
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Pulled tweet"},
+        headers={"api-key": celebrity.api_key},
+    )
+    tweet_id = response.json()["tweet_id"]
+
+    timeline = await db_session.execute(
+        select(Timeline).where(Timeline.tweet_id == tweet_id)
+    )
+    assert timeline.scalars().all() == []
+
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == [tweet_id]
+
+    await client.post(f"/api/tweets/{tweet_id}/likes", headers={"api-key": fan.api_key})
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert response.json()["tweets"][0]["likes"] == [
+        {"user_id": fan.id, "name": fan.name}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_fanout_mode_hysteresis(client, test_user, db_session, monkeypatch):
+    """
+    Test of keeping pulled tweets in feeds when an author returns to fan-out
+    """
+    monkeypatch.setattr("server.api.services.FANOUT_FOLLOWER_THRESHOLD", 3)
+    monkeypatch.setattr("server.api.services.FANOUT_HYSTERESIS", 0.5)
+
+    celebrity = User(
+        name="Celebrity",
+        api_key="celebrity_api_key",
+        username="Celebrity",
+        email="celebrity@example.com",
+    )
+    fans = [
+        User(
+            name=f"Fan{number}",
+            api_key=f"fan_api_key_{number}",
+            username=f"Fan{number}",
+            email=f"fan{number}@example.com",
+        )
+        for number in range(2)
+    ]
+    db_session.add_all([celebrity, *fans])
+    await db_session.commit()
+
+    for follower in (*fans, test_user):
+        await client.post(
+            f"/api/users/{celebrity.id}/follow", headers={"api-key": follower.api_key}
+        )
+
+    async def post_tweet(content):
+        response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": content},
+            headers={"api-key": celebrity.api_key},
+        )
+        await db_session.refresh(celebrity)
+        return response.json()["tweet_id"]
+
+    tweet_ids = [await post_tweet("Pulled at 3 followers")]
+    assert celebrity.fanout_mode == FANOUT_PULL
+
+    await client.delete(
+        f"/api/users/{celebrity.id}/follow", headers={"api-key": fans[0].api_key}
+    )
+    tweet_ids.append(await post_tweet("Pulled at 2 followers"))
+    assert celebrity.fanout_mode == FANOUT_PULL
+
+    await client.delete(
+        f"/api/users/{celebrity.id}/follow", headers={"api-key": fans[1].api_key}
+    )
+    tweet_ids.append(await post_tweet("Pushed at 1 follower"))
+    assert celebrity.fanout_mode == FANOUT_PUSH
+
+    timeline = await db_session.execute(
+        select(Timeline.tweet_id).where(Timeline.user_id == test_user.id)
+    )
+    assert sorted(timeline.scalars().all()) == tweet_ids
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert [tweet["id"] for tweet in response.json()["tweets"]] == tweet_ids[::-1]
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_ranking(client, test_user, db_session):
+    """
+    Test of selecting the feed ranking strategy per request
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+
+    now = datetime.utcnow()
+    old_popular = Tweet(
+        content="Old popular", user_id=author.id, created_at=now - timedelta(days=7)
+    )
+    new_liked = Tweet(content="New liked", user_id=author.id, created_at=now)
+    new_plain = Tweet(content="New plain", user_id=author.id, created_at=now)
+    db_session.add_all([old_popular, new_liked, new_plain])
+    await db_session.commit()
+
+    likers = [
+        User(
+            name=f"Liker{i}",
+            api_key=f"liker_api_key_{i}",
+            username=f"Liker{i}",
+            email=f"liker{i}@example.com",
+        )
+        for i in range(3)
+    ]
+    db_session.add_all(likers)
+    await db_session.commit()
+    for liker in likers:
+        await client.post(
+            f"/api/tweets/{old_popular.id}/likes", headers={"api-key": liker.api_key}
+        )
+    await client.post(
+        f"/api/tweets/{new_liked.id}/likes", headers={"api-key": likers[0].api_key}
+    )
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+
+    async def feed_ids(ranking, limit=10, cursor=None):
+        params = {"ranking": ranking, "limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        response = await client.get(
+            "/api/tweets", params=params, headers={"api-key": test_user.api_key}
+        )
+        assert response.status_code == 200, response.text
+        json_response = response.json()
+        return [tweet["id"] for tweet in json_response["tweets"]], json_response[
+            "next_cursor"
+        ]
+
+    assert (await feed_ids("likes"))[0] == [old_popular.id, new_liked.id, new_plain.id]
+    assert (await feed_ids("recency"))[0] == [
+        new_plain.id,
+        new_liked.id,
+        old_popular.id,
+    ]
+    assert (await feed_ids("decay"))[0] == [new_liked.id, new_plain.id, old_popular.id]
+
+    first_page, cursor = await feed_ids("decay", limit=1)
+    second_page, _ = await feed_ids("decay", limit=2, cursor=cursor)
+    assert first_page + second_page == [new_liked.id, new_plain.id, old_popular.id]
+
+    response = await client.get(
+        "/api/tweets",
+        params={"ranking": "likes", "cursor": cursor},
+        headers={"api-key": test_user.api_key},
+    )
+    assert response.status_code == 400
+
+    response = await client.get(
+        "/api/tweets",
+        params={"ranking": "random"},
+        headers={"api-key": test_user.api_key},
+    )
+    assert response.status_code == 400
+
+
+def test_ranking_strategy_requires_column():
+    """
+    Test of rejecting a ranking strategy without a score column when it is created
+    """
+
+    class Incomplete(RankingStrategy):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_not_modified(client, test_user, db_session):
+    """
+    Test of answering a conditional feed request without building the feed
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    await client.post(
+        "/api/tweets",
+        json={"tweet_data": "First tweet"},
+        headers={"api-key": author.api_key},
+    )
+
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    etag = response.headers["etag"]
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        response = await client.get(
+            "/api/tweets",
+            headers={"api-key": test_user.api_key, "if-none-match": etag},
+        )
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", count_statement)
+
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+    assert not any("FROM tweets" in statement for statement in statements)
+
+    await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Second tweet"},
+        headers={"api-key": author.api_key},
+    )
+    response = await client.get(
+        "/api/tweets", headers={"api-key": test_user.api_key, "if-none-match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert len(response.json()["tweets"]) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_user_info_not_modified(client, test_user, db_session):
+    """
+    Test of answering a conditional profile request until the profile changes
+    """
+    user2 = User(
+        name="User2",
+        api_key="test_api_key_2",
+        username="Username2",
+        email="email2@example.com",
+    )
+    db_session.add(user2)
+    await db_session.commit()
+
+    response = await client.get(f"/api/users/{user2.id}")
+    etag = response.headers["etag"]
+
+    response = await client.get(
+        f"/api/users/{user2.id}", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 304
+
+    await client.post(
+        f"/api/users/{user2.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    response = await client.get(
+        f"/api/users/{user2.id}", headers={"if-none-match": etag}
+    )
+    assert response.status_code == 200
+    assert response.json()["followers"] == [
+        {"id": test_user.id, "name": test_user.name}
+    ]
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_stream(
+    client, test_user, db_session, monkeypatch
+):
+    """
+    Test of streaming a feed page in batches with the same body as a rendered page
+    """
+    monkeypatch.setattr("server.api.routers.FEED_STREAM_BATCH_SIZE", 2)
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    for number in range(5):
+        response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": f"Tweet {number}"},
+            headers={"api-key": author.api_key},
+        )
+        await client.post(
+            f"/api/tweets/{response.json()['tweet_id']}/likes",
+            headers={"api-key": test_user.api_key},
+        )
+
+    headers = {"api-key": test_user.api_key}
+    rendered = await client.get("/api/tweets?limit=4", headers=headers)
+    streamed = await client.get("/api/tweets?limit=4&stream=true", headers=headers)
+
+    assert streamed.status_code == 200
+    assert streamed.content == rendered.content
+    assert len(streamed.json()["tweets"]) == 4
+    assert streamed.json()["next_cursor"] is not None
+
+    cursor = streamed.json()["next_cursor"]
+    last_page = await client.get(
+        f"/api/tweets?limit=4&stream=true&cursor={cursor}", headers=headers
+    )
+    assert [tweet["content"] for tweet in last_page.json()["tweets"]] == ["Tweet 0"]
+    assert last_page.json()["next_cursor"] is None
+
+    response = await client.get(
+        f"/api/tweets?limit={FEED_MAX_PAGE_SIZE + 1}", headers=headers
+    )
+    assert response.status_code == 422
+
+
+@pytest.fixture
+async def listening_event_hub(db):
+    await event_hub.start(get_database_url())
+    yield event_hub
+    await event_hub.stop()
+
+
+@pytest.mark.asyncio
+async def test_get_feed_events(client, test_user, db_session, listening_event_hub):
+    """
+    Test of pushing new tweets and likes of followed authors as Server-Sent Events
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+
+    response = await get_feed_events(user=test_user, db=db_session)
+    events = response.body_iterator
+    assert listening_event_hub.subscriptions == {}
+
+    first_chunk = asyncio.create_task(events.__anext__())
+    while not listening_event_hub.subscriptions:
+        await asyncio.sleep(0)
+    assert listening_event_hub.subscriptions.keys() == {author.id}
+
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Pushed tweet"},
+        headers={"api-key": author.api_key},
+    )
+    tweet_id = response.json()["tweet_id"]
+    chunk = await asyncio.wait_for(first_chunk, 5)
+    assert chunk.startswith(b"event: tweet\n")
+    assert json.loads(chunk.split(b"data: ")[1]) == {
+        "type": "tweet",
+        "tweet_id": tweet_id,
+        "author_id": author.id,
+    }
+
+    await client.post(
+        f"/api/tweets/{tweet_id}/likes", headers={"api-key": author.api_key}
+    )
+    chunk = await asyncio.wait_for(events.__anext__(), 5)
+    assert json.loads(chunk.split(b"data: ")[1])["delta"] == 1
+
+    await events.aclose()
+    assert listening_event_hub.subscriptions == {}
+
+    # A stream closed before it was iterated never subscribes.
+    response = await get_feed_events(user=test_user, db=db_session)
+    await response.body_iterator.aclose()
+    assert listening_event_hub.subscriptions == {}
+
+
+def test_event_subscription_overflow():
+    """
+    Test of replacing pending events with a resync event when a client falls behind
+    """
+    hub = EventHub("feed_events", queue_size=2)
+    subscription = hub.subscribe([1])
+    for tweet_id in range(3):
+        hub.dispatch({"type": "tweet", "tweet_id": tweet_id, "author_id": 1})
+    hub.dispatch({"type": "tweet", "tweet_id": 3, "author_id": 2})
+
+    assert subscription.queue.qsize() == 1
+    assert subscription.queue.get_nowait() == {"type": "resync"}
+
+
+@pytest.mark.asyncio
+async def test_event_hub_starts_without_database(monkeypatch):
+    """
+    Test of starting without live events and resyncing clients once connected
+    """
+    attempts = []
+    connect = asyncpg.connect
+
+    async def refuse_first_connect(dsn, **kwargs):
+        attempts.append(dsn)
+        if len(attempts) == 1:
+            raise OSError("Connection refused")
+        return await connect(dsn, **kwargs)
+
+    monkeypatch.setattr("server.api.events.asyncpg.connect", refuse_first_connect)
+    hub = EventHub("feed_events", queue_size=2)
+    hub.reconnect_delay = 0.2
+
+    await asyncio.wait_for(hub.start(get_database_url(), timeout=0.05), 1)
+    subscription = hub.subscribe([1])
+    try:
+        assert await asyncio.wait_for(subscription.get(), 5) == {"type": "resync"}
+    finally:
+        await hub.stop()
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_event_hub_reconnects_after_listen_failure(monkeypatch):
+    """
+    Test of reconnecting and resyncing clients when LISTEN fails on a connection
+    """
+    attempts = []
+    add_listener = asyncpg.connection.Connection.add_listener
+
+    async def fail_first_listen(connection, channel, callback):
+        attempts.append(channel)
+        if len(attempts) == 1:
+            raise asyncpg.InterfaceError("Connection is closed")
+        return await add_listener(connection, channel, callback)
+
+    monkeypatch.setattr("asyncpg.connection.Connection.add_listener", fail_first_listen)
+    hub = EventHub("feed_events", queue_size=2)
+    hub.reconnect_delay = 0.2
+
+    await asyncio.wait_for(hub.start(get_database_url(), timeout=0.05), 1)
+    subscription = hub.subscribe([1])
+    try:
+        assert await asyncio.wait_for(subscription.get(), 5) == {"type": "resync"}
+        assert not hub.listener.done()
+    finally:
+        await hub.stop()
+    assert len(attempts) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_since_version(client, test_user, db_session):
+    """
+    Test of returning only tweets created or liked since a feed version
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+    headers = {"api-key": test_user.api_key}
+
+    await client.post(f"/api/users/{author.id}/follow", headers=headers)
+    tweet_ids = []
+    for number in range(2):
+        response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": f"Tweet {number}"},
+            headers={"api-key": author.api_key},
+        )
+        tweet_ids.append(response.json()["tweet_id"])
+
+    response = await client.get("/api/tweets", headers=headers)
+    version = response.json()["version"]
+    assert version > 0
+
+    response = await client.get(f"/api/tweets?since_version={version}", headers=headers)
+    assert response.json()["tweets"] == []
+    assert response.json()["version"] == version
+
+    await client.post(f"/api/tweets/{tweet_ids[0]}/likes", headers=headers)
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Tweet 2"},
+        headers={"api-key": author.api_key},
+    )
+    new_tweet_id = response.json()["tweet_id"]
+
+    response = await client.get(f"/api/tweets?since_version={version}", headers=headers)
+    changes = response.json()
+    assert [tweet["id"] for tweet in changes["tweets"]] == [tweet_ids[0], new_tweet_id]
+    assert changes["tweets"][0]["likes"] == [
+        {"user_id": test_user.id, "name": test_user.name}
+    ]
+    assert changes["version"] > version
+
+    response = await client.get(
+        f"/api/tweets?since_version={changes['version']}", headers=headers
+    )
+    assert response.json()["tweets"] == []
+
+    pages, cursor = [], None
+    while True:
+        url = f"/api/tweets?since_version={version}&limit=1"
+        if cursor is not None:
+            url += f"&cursor={cursor}"
+        pages.append((await client.get(url, headers=headers)).json())
+        cursor = pages[-1]["next_cursor"]
+        if cursor is None:
+            break
+    assert [tweet["id"] for page in pages for tweet in page["tweets"]] == [
+        tweet_ids[0],
+        new_tweet_id,
+    ]
+    assert [page["version"] for page in pages[:-1]] == [None] * (len(pages) - 1)
+    assert pages[-1]["version"] >= changes["version"]
+
+    response = await client.get(
+        "/api/tweets?since_version=0&cursor=abc", headers=headers
+    )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_since_version_interleaved(client, test_user, db_session):
+    """
+    Test of returning a change committed after a later transaction's change was read
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+    headers = {"api-key": test_user.api_key}
+    await client.post(f"/api/users/{author.id}/follow", headers=headers)
+
+    async with TestingSessionLocal() as first, TestingSessionLocal() as second:
+        slow = Tweet(content="Started first, committed last", user_id=author.id)
+        first.add(slow)
+        await first.flush()
+
+        fast = Tweet(content="Started last, committed first", user_id=author.id)
+        second.add(fast)
+        await second.flush()
+        second.add(
+            Timeline(user_id=test_user.id, tweet_id=fast.id, author_id=author.id)
+        )
+        await second.commit()
+
+        response = await client.get("/api/tweets", headers=headers)
+        assert [tweet["id"] for tweet in response.json()["tweets"]] == [fast.id]
+        version = response.json()["version"]
+
+        first.add(Timeline(user_id=test_user.id, tweet_id=slow.id, author_id=author.id))
+        await first.commit()
+
+    response = await client.get(f"/api/tweets?since_version={version}", headers=headers)
+    assert slow.id in [tweet["id"] for tweet in response.json()["tweets"]]
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_likes_preview(client, test_user, db_session):
+    """
+    Test of rendering like previews with counts and paginating the full liker list
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    likers = [
+        User(
+            name=f"Liker {number}",
+            api_key=f"liker_api_key_{number}",
+            username=f"Liker{number}",
+            email=f"liker{number}@example.com",
+        )
+        for number in range(5)
+    ]
+    db_session.add_all([author, *likers])
+    await db_session.commit()
+
+    await client.post(
+        f"/api/users/{author.id}/follow", headers={"api-key": test_user.api_key}
+    )
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Popular tweet"},
+        headers={"api-key": author.api_key},
+    )
+    tweet_id = response.json()["tweet_id"]
+    for liker in [*likers, test_user]:
+        await client.post(
+            f"/api/tweets/{tweet_id}/likes", headers={"api-key": liker.api_key}
+        )
+
+    response = await client.get(
+        "/api/tweets?likes=preview", headers={"api-key": test_user.api_key}
+    )
+    tweet = response.json()["tweets"][0]
+    assert tweet["like_count"] == 6
+    assert tweet["liked_by_me"] is True
+    assert [like["user_id"] for like in tweet["likes"]] == [
+        liker.id for liker in likers[:3]
+    ]
+
+    response = await client.get(f"/api/tweets/{tweet_id}/likes?limit=4")
+    first_page = response.json()
+    assert [like["name"] for like in first_page["likes"]] == [
+        liker.name for liker in likers[:4]
+    ]
+
+    response = await client.get(
+        f"/api/tweets/{tweet_id}/likes?limit=4&cursor={first_page['next_cursor']}"
+    )
+    assert response.json()["likes"] == [
+        {"user_id": likers[4].id, "name": likers[4].name},
+        {"user_id": test_user.id, "name": test_user.name},
+    ]
+    assert response.json()["next_cursor"] is None
+
+    response = await client.get("/api/tweets/0/likes")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_tweets_by_followings_sql_engine(
+    client, test_user, db_session, monkeypatch
+):
+    """
+    Test of rendering feed pages in the database with the same content as the ORM path
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+    headers = {"api-key": test_user.api_key}
+
+    empty_pages = []
+    for engine in ("orm", "sql"):
+        monkeypatch.setattr("server.api.routers.FEED_ENGINE", engine)
+        cache_backend.clear()
+        empty_pages.append((await client.get("/api/tweets", headers=headers)).json())
+    monkeypatch.setattr("server.api.routers.FEED_ENGINE", "orm")
+    assert empty_pages[0]["tweets"] == []
+    assert empty_pages[1] == empty_pages[0]
+
+    await client.post(f"/api/users/{author.id}/follow", headers=headers)
+    for number in range(3):
+        response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": f"Tweet {number}"},
+            headers={"api-key": author.api_key},
+        )
+        tweet_id = response.json()["tweet_id"]
+        if number != 1:
+            await client.post(f"/api/tweets/{tweet_id}/likes", headers=headers)
+    await client.post(
+        f"/api/tweets/{tweet_id}/likes", headers={"api-key": author.api_key}
+    )
+
+    async def fetch_pages(query):
+        pages, cursor = [], None
+        while True:
+            url = f"/api/tweets?limit=2&{query}"
+            if cursor is not None:
+                url += f"&cursor={cursor}"
+            page = (await client.get(url, headers=headers)).json()
+            pages.append(page)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    for query in ("likes=full", "likes=preview", "ranking=recency"):
+        cache_backend.clear()
+        orm_pages = await fetch_pages(query)
+
+        monkeypatch.setattr("server.api.routers.FEED_ENGINE", "sql")
+        cache_backend.clear()
+        sql_pages = await fetch_pages(query)
+        monkeypatch.setattr("server.api.routers.FEED_ENGINE", "orm")
+
+        assert len(orm_pages) == 2
+        assert sql_pages == orm_pages
+
+        # Without a preview tweets keep the fields of the original payload.
+        if query == "likes=full":
+            for tweet in orm_pages[0]["tweets"] + orm_pages[1]["tweets"]:
+                assert tweet.keys() == {"content", "id", "attachments", "user", "likes"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["core", "raw"])
+async def test_read_backends(client, test_user, db_session, monkeypatch, backend):
+    """
+    Test of serving feeds and profiles without the ORM with the same responses
+    """
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+    headers = {"api-key": test_user.api_key}
+
+    await client.post(f"/api/users/{author.id}/follow", headers=headers)
+    for number in range(3):
+        response = await client.post(
+            "/api/tweets",
+            json={"tweet_data": f"Tweet {number}"},
+            headers={"api-key": author.api_key},
+        )
+        await client.post(
+            f"/api/tweets/{response.json()['tweet_id']}/likes", headers=headers
+        )
+
+    urls = [
+        "/api/tweets?limit=2",
+        "/api/tweets?limit=2&likes=preview&ranking=decay",
+        f"/api/users/{author.id}",
+        "/api/users/me",
+    ]
+    expected = []
+    for url in urls:
+        cache_backend.clear()
+        expected.append((await client.get(url, headers=headers)).json())
+
+    monkeypatch.setattr("server.api.routers.READ_BACKEND", backend)
+    for url, response_json in zip(urls, expected):
+        cache_backend.clear()
+        assert (await client.get(url, headers=headers)).json() == response_json
+
+    cursor = expected[0]["next_cursor"]
+    response = await client.get(f"/api/tweets?limit=2&cursor={cursor}", headers=headers)
+    assert [tweet["content"] for tweet in response.json()["tweets"]] == ["Tweet 0"]
+
+    response = await client.get("/api/users/0")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["core", "raw"])
+async def test_read_backends_share_transaction(db, backend):
+    """
+    Test of running reads of every backend in the transaction of the session
+    """
+    async with TestingSessionLocal() as session:
+        started = await fetch_rows(select(func.now()), session, backend)
+        await asyncio.sleep(0.01)
+        assert await fetch_rows(select(func.now()), session, backend) == started
+
+
+@pytest.mark.asyncio
+async def test_get_current_user_cache(client, test_user, db_session):
+    """
+    Test of resolving API keys from the cache, including unknown and changed keys
+    """
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        if "WHERE users.api_key" in statement:
+            statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        for _ in range(3):
+            response = await client.get(
+                "/api/users/me", headers={"api-key": test_user.api_key}
+            )
+            assert response.status_code == 200
+            response = await client.get("/api/users/me", headers={"api-key": "wrong"})
+            assert response.status_code == 403
+        assert len(statements) == 2
+        assert statements[0].startswith("SELECT users.id, users.name \nFROM users")
+
+        test_user.api_key = "new_api_key"
+        await db_session.commit()
+
+        response = await client.get("/api/users/me", headers={"api-key": "testapikey"})
+        assert response.status_code == 403
+        response = await client.get("/api/users/me", headers={"api-key": "new_api_key"})
+        assert response.json()["user"]["id"] == test_user.id
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", count_statement)
+
+
+def test_principal_cache_expiry():
+    """
+    Test of expiring resolved and unknown keys after their TTLs
+    """
+    clock = FakeClock()
+    cache = PrincipalCache(
+        ttl=60, negative_ttl=5, max_entries=2, max_negative_entries=2, clock=clock
+    )
+    cache.set("valid", Principal(1, "User"))
+    cache.set("invalid", None)
+    assert cache.get("invalid") == (True, None)
+
+    clock.now = 5
+    assert cache.get("valid") == (True, Principal(1, "User"))
+    assert cache.get("invalid") == (False, None)
+
+    cache.set("other", Principal(2, "Other"))
+    cache.set("third", Principal(3, "Third"))
+    assert cache.get("valid") == (False, None)
+
+
+def test_principal_cache_invalid_key_flood():
+    """
+    Test of keeping resolved keys cached while many distinct invalid keys arrive
+    """
+    cache = PrincipalCache(
+        ttl=60, negative_ttl=5, max_entries=2, max_negative_entries=3
+    )
+    cache.set("valid", Principal(1, "User"))
+    for number in range(100):
+        cache.set(f"invalid-{number}", None)
+
+    assert cache.get("valid") == (True, Principal(1, "User"))
+    assert len(cache.negative_entries) == 3
+    assert cache.get("invalid-99") == (True, None)
+    assert cache.get("invalid-0") == (False, None)
+
+
+@pytest.mark.asyncio
+async def test_session_tokens(client, test_user, redis_standin, monkeypatch):
+    """
+    Test of authenticating with signed session tokens, key rotation and revocation
+    """
+    signer = TokenSigner({"old": b"old-secret"}, ttl=60)
+    monkeypatch.setattr("server.api.services.token_signer", signer)
+    monkeypatch.setattr("server.api.routers.token_signer", signer)
+    revocations = TokenRevocations(
+        RedisCacheBackend(f"redis://127.0.0.1:{redis_standin.port}/0")
+    )
+    monkeypatch.setattr("server.api.services.token_revocations", revocations)
+    monkeypatch.setattr("server.api.routers.token_revocations", revocations)
+
+    response = await client.post(
+        "/api/auth/token", headers={"api-key": test_user.api_key}
+    )
+    old_token = response.json()["token"]
+
+    signer.keys = {"new": b"new-secret", "old": b"old-secret"}
+    response = await client.post(
+        "/api/auth/token", headers={"api-key": test_user.api_key}
+    )
+    new_token = response.json()["token"]
+    assert new_token.startswith("new.")
+
+    statements = []
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(test_engine.sync_engine, "before_cursor_execute", count_statement)
+    try:
+        for token in (old_token, new_token):
+            response = await client.get(
+                "/api/tweets", headers={"authorization": f"Bearer {token}"}
+            )
+            assert response.status_code == 200
+    finally:
+        event.remove(test_engine.sync_engine, "before_cursor_execute", count_statement)
+    assert not any("WHERE users.api_key" in statement for statement in statements)
+
+    kid, payload, signature = new_token.split(".")
+    forged_token = f"{kid}.{payload}.{signature[::-1]}"
+    response = await client.get(
+        "/api/tweets", headers={"authorization": f"Bearer {forged_token}"}
+    )
+    assert response.status_code == 401
+
+    response = await client.delete(
+        "/api/auth/token", headers={"authorization": f"Bearer {new_token}"}
+    )
+    assert response.status_code == 200
+    response = await client.get(
+        "/api/tweets", headers={"authorization": f"Bearer {new_token}"}
+    )
+    assert response.status_code == 401
+
+    signer.keys = {"new": b"new-secret"}
+    response = await client.get(
+        "/api/tweets", headers={"authorization": f"Bearer {old_token}"}
+    )
+    assert response.status_code == 401
+
+    response = await client.post("/api/auth/token", headers={"api-key": "wrong"})
+    assert response.status_code == 403
+
+    response = await client.get(
+        "/api/tweets",
+        headers={"authorization": "Basic dXNlcjpwYXNz", "api-key": test_user.api_key},
+    )
+    assert response.status_code == 200
+
+    async def unavailable(*args):
+        raise CacheError("Connection refused")
+
+    token = (
+        await client.post("/api/auth/token", headers={"api-key": test_user.api_key})
+    ).json()["token"]
+    monkeypatch.setattr(revocations.backend, "set", unavailable)
+    response = await client.delete(
+        "/api/auth/token", headers={"authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 503
+
+    # Tokens are not issued when their revocation cannot be looked up.
+    monkeypatch.setattr(revocations.backend, "get", unavailable)
+    response = await client.post(
+        "/api/auth/token", headers={"api-key": test_user.api_key}
+    )
+    assert response.status_code == 503
+    await revocations.close()
+
+    disabled = TokenRevocations(None)
+    monkeypatch.setattr("server.api.services.token_revocations", disabled)
+    monkeypatch.setattr("server.api.routers.token_revocations", disabled)
+    response = await client.post(
+        "/api/auth/token", headers={"api-key": test_user.api_key}
+    )
+    assert response.status_code == 503
+    response = await client.get(
+        "/api/tweets",
+        headers={"authorization": f"Bearer {token}", "api-key": test_user.api_key},
+    )
+    assert response.status_code == 401
+
+    with pytest.raises(ValueError):
+        TokenRevocations(InMemoryCacheBackend(1024))
+
+
+def test_token_signer_expiry():
+    """
+    Test of rejecting expired session tokens
+    """
+    clock = FakeClock()
+    signer = TokenSigner({"key": b"secret"}, ttl=60, clock=clock)
+    token, claims = signer.issue(Principal(1, "User"))
+
+    clock.now = 59
+    assert signer.verify(token) == claims
+
+    clock.now = 60
+    with pytest.raises(TokenError):
+        signer.verify(token)
+
+
+@pytest.mark.asyncio
+async def test_statement_logging_modes(caplog):
+    """
+    Test of slow-only and sampled statement logging
+    """
+    caplog.set_level("INFO", logger="server.database.statements")
+
+    async def run(mode, slow_ms, sample_rate):
+        engine = create_async_engine(get_database_url())
+        install_statement_logging(engine, mode, slow_ms, sample_rate)
+        caplog.clear()
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        await engine.dispose()
+        return [
+            record
+            for record in caplog.records
+            if record.name == "server.database.statements"
+        ]
+
+    records = await run("slow", 0, 0)
+    assert records and records[-1].levelname == "WARNING"
+    assert "SELECT 1" in records[-1].getMessage()
+    assert not [r for r in await run("slow", 60_000, 0) if "SELECT 1" in r.getMessage()]
+    assert [r for r in await run("sampled", 60_000, 1) if "SELECT 1" in r.getMessage()]
+    assert not await run("sampled", 0, 0)
+    assert not await run("off", 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_session_router():
+    """
+    Test of routing reads to replicas with read-your-writes and lag checks
+    """
+    clock = FakeClock()
+    replica = create_async_engine(get_database_url())
+    broken = create_async_engine(
+        "postgresql+asyncpg://postgres@/none?host=/nonexistent"
+    )
+    router = SessionRouter(
+        test_engine,
+        [replica, broken],
+        sticky_window=5,
+        max_lag=1,
+        check_interval=1,
+        clock=clock,
+    )
+    replica_factory, broken_factory = router.replicas
+
+    # Replicas are not used before their lag is known.
+    assert router.factory_for("GET", "key") is router.primary
+    await router.check_lag()
+    assert router.lags[0] == 0
+    assert router.lags[1] == float("inf")
+    assert router.factory_for("GET", "key") is replica_factory
+    assert router.factory_for("GET", None) is replica_factory
+
+    # A write pins its client to the primary for the window.
+    assert router.factory_for("POST", "key") is router.primary
+    assert router.factory_for("GET", "key") is router.primary
+    assert router.factory_for("GET", "other") is replica_factory
+    clock.now += 5
+    assert router.factory_for("GET", "key") is replica_factory
+    router.mark_write("other")
+    assert "key" not in router.sticky
+
+    router.lags[1] = 0.5
+    assert {router.factory_for("GET", None) for _ in range(4)} == {
+        replica_factory,
+        broken_factory,
+    }
+    router.lags = [2.0, float("inf")]
+    assert router.factory_for("GET", None) is router.primary
+
+    await router.stop()
+
+
+@pytest.mark.asyncio
+async def test_session_router_across_workers(client, test_user):
+    """
+    Test of reading own writes from the primary on another worker through a cookie
+    """
+    clock = FakeClock()
+    routers = [
+        SessionRouter(
+            test_engine,
+            [create_async_engine(get_database_url())],
+            sticky_window=5,
+            max_lag=1,
+            check_interval=1,
+            clock=clock,
+        )
+        for _ in range(2)
+    ]
+    writer, reader = routers
+    await reader.check_lag()
+    (replica_factory,) = reader.replicas
+
+    deadline = writer.mark_write("key")
+    assert reader.factory_for("GET", "key") is replica_factory
+    assert reader.factory_for("GET", "key", deadline) is reader.primary
+    clock.now += 5
+    assert reader.factory_for("GET", "key", deadline) is replica_factory
+    # A deadline beyond one window is not trusted.
+    assert reader.factory_for("GET", "key", clock.now + 60) is replica_factory
+
+    for router in routers:
+        await router.stop()
+
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Written"},
+        headers={"api-key": test_user.api_key},
+    )
+    assert float(response.cookies[PRIMARY_UNTIL_COOKIE]) > time.time()
+    response = await client.get("/api/tweets", headers={"api-key": test_user.api_key})
+    assert PRIMARY_UNTIL_COOKIE not in response.cookies
+
+
+@pytest.mark.asyncio
+async def test_replica_reads_not_cached(client, test_user, db_session):
+    """
+    Test of serving pages read from a replica without caching them or their ETag
+    """
+    headers = {"api-key": test_user.api_key}
+    author = User(
+        name="Author",
+        api_key="author_api_key",
+        username="Author",
+        email="author@example.com",
+    )
+    db_session.add(author)
+    await db_session.commit()
+
+    db_session.info["replica"] = True
+    try:
+        feed = await client.get("/api/tweets", headers=headers)
+        profile = await client.get("/api/users/me", headers=headers)
+    finally:
+        del db_session.info["replica"]
+    assert feed.status_code == 200, feed.text
+    assert profile.status_code == 200, profile.text
+    assert "etag" not in feed.headers
+    assert "etag" not in profile.headers
+
+    # Written behind the caches' back, like rows the replica had not replayed.
+    tweet = Tweet(content="Missed by the replica", user_id=author.id)
+    db_session.add(tweet)
+    db_session.add(Follow(user_id=test_user.id, follower_id=author.id))
+    await db_session.commit()
+    db_session.add(
+        Timeline(user_id=test_user.id, tweet_id=tweet.id, author_id=author.id)
+    )
+    await db_session.commit()
+
+    feed = await client.get("/api/tweets", headers=headers)
+    profile = await client.get("/api/users/me", headers=headers)
+    assert "etag" in feed.headers
+    assert "etag" in profile.headers
+    assert [tweet["id"] for tweet in feed.json()["tweets"]] == [tweet.id]
+    assert [user["id"] for user in profile.json()["followings"]] == [author.id]
+
+
+@pytest.mark.asyncio
+async def test_direct_media_upload(
+    client, test_user, db_session, s3_standin, monkeypatch
+):
+    """
+    Test of uploading media to storage with a presigned URL and completing it
+    """
+    monkeypatch.setattr("server.api.routers.s3_client", s3_standin.client())
+    headers = {"api-key": test_user.api_key}
+
+    response = await client.post(
+        "/api/medias/uploads",
+        json={"filename": "video.mp4", "content_type": "video/mp4"},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    media_id = response.json()["media_id"]
+    upload_url = response.json()["upload_url"]
+
+    media = await db_session.get(Media, media_id)
+    assert media.status == MEDIA_PENDING
+    assert media.object_key.endswith(".mp4")
+    assert media.file_link.endswith(media.object_key)
+    assert "X-Amz-Signature" in upload_url
+
+    response = await client.post(f"/api/medias/{media_id}/complete", headers=headers)
+    assert response.status_code == 409
+
+    # Pending media is not attached to tweets.
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "Too early", "tweet_media_ids": [media_id]},
+        headers=headers,
+    )
+    tweet = await db_session.get(Tweet, response.json()["tweet_id"])
+    assert not tweet.attachment
+
+    async with AsyncClient() as storage:
+        response = await storage.put(
+            upload_url, content=b"video", headers={"Content-Type": "video/mp4"}
+        )
+        assert response.status_code == 200
+    assert s3_standin.objects[media.object_key] == b"video"
+
+    other_user = User(
+        username="otheruser",
+        api_key="otherapikey",
+        name="Other User",
+        email="otheruser@example.com",
+        created_at=datetime.utcnow(),
+    )
+    db_session.add(other_user)
+    await db_session.commit()
+    response = await client.post(
+        f"/api/medias/{media_id}/complete", headers={"api-key": "otherapikey"}
+    )
+    assert response.status_code == 404
+    await db_session.refresh(media)
+    assert media.status == MEDIA_PENDING
+
+    for _ in range(2):
+        response = await client.post(
+            f"/api/medias/{media_id}/complete", headers=headers
+        )
+        assert response.status_code == 200, response.text
+    await db_session.refresh(media)
+    assert media.status == MEDIA_READY
+
+    response = await client.post(
+        "/api/tweets",
+        json={"tweet_data": "With video", "tweet_media_ids": [media_id]},
+        headers=headers,
+    )
+    tweet = await db_session.get(Tweet, response.json()["tweet_id"])
+    assert tweet.attachment == [media.file_link]
+    # Attached by the inserting transaction, which the version identifies.
+    written_by = await db_session.execute(
+        text("SELECT xmin::text::bigint FROM tweets WHERE id = :id"), {"id": tweet.id}
+    )
+    assert written_by.scalar() == tweet.version % 2**32
+
+    response = await client.post("/api/medias/0/complete", headers=headers)
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_expire_pending_media(test_user, db_session):
+    """
+    Test of deleting pending media older than the maximum age
+    """
+    old = datetime.utcnow() - timedelta(hours=2)
+    stale = Media(status=MEDIA_PENDING, user_id=test_user.id, created_at=old)
+    fresh = Media(status=MEDIA_PENDING, user_id=test_user.id)
+    ready = Media(status=MEDIA_READY, user_id=test_user.id, created_at=old)
+    db_session.add_all([stale, fresh, ready])
+    await db_session.commit()
+    media_ids = [stale.id, fresh.id, ready.id]
+
+    assert await expire_pending_media(db_session, 3600) == 1
+
+    db_session.expunge_all()
+    remaining = await db_session.execute(
+        select(Media.id).where(Media.id.in_(media_ids)).order_by(Media.id)
+    )
+    assert remaining.scalars().all() == [fresh.id, ready.id]
@@ -0,0 +1,128 @@
+import pytest
+
+from server.api.cache import (
+    CacheError,
+    InMemoryCacheBackend,
+    RedisCacheBackend,
+    ResponseCache,
+)
+from server.api.schemas import TweetResponse, UserResponse
+from tests.conftest import FakeClock
+
+
+@pytest.mark.asyncio
+async def test_in_memory_backend_lru_eviction():
+    """
+    Test of evicting least recently used values to fit the byte budget
+    """
+    backend = InMemoryCacheBackend(max_bytes=10)
+    await backend.set("a", b"aaaa", ttl=60)
+    await backend.set("b", b"bbbb", ttl=60)
+    assert await backend.get("a") == b"aaaa"
+
+    await backend.set("c", b"cccc", ttl=60)
+
+    assert await backend.get("b") is None
+    assert await backend.get("a") == b"aaaa"
+    assert await backend.get("c") == b"cccc"
+    assert backend.stats() == {
+        "hits": 3,
+        "misses": 1,
+        "evictions": 1,
+        "entries": 2,
+        "bytes": 10,
+    }
+
+
+@pytest.mark.asyncio
+async def test_in_memory_backend_ttl():
+    """
+    Test of expiring values after the TTL
+    """
+    clock = FakeClock()
+    backend = InMemoryCacheBackend(max_bytes=100, clock=clock)
+    await backend.set("key", b"body", ttl=5)
+
+    clock.now = 4
+    assert await backend.get("key") == b"body"
+
+    clock.now = 5
+    assert await backend.get("key") is None
+    assert backend.stats()["bytes"] == 0
+
+
+@pytest.mark.asyncio
+async def test_response_cache_invalidate():
+    """
+    Test of invalidating only the given scopes
+    """
+    cache = ResponseCache(
+        InMemoryCacheBackend(max_bytes=1000), "feed", TweetResponse, ttl=60
+    )
+    first_version = await cache.version(1)
+    second_version = await cache.version(2)
+    await cache.set(1, first_version, "page", b"one")
+    await cache.set(2, second_version, "page", b"two")
+
+    await cache.invalidate([1])
+
+    assert await cache.version(1) != first_version
+    assert await cache.get(1, await cache.version(1), "page") is None
+    assert await cache.version(2) == second_version
+    assert await cache.get(2, second_version, "page") == b"two"
+
+
+@pytest.mark.asyncio
+async def test_response_cache_schema_versioning():
+    """
+    Test of separating entries of different response schemas
+    """
+    backend = InMemoryCacheBackend(max_bytes=1000)
+    feed_cache = ResponseCache(backend, "cache", TweetResponse, ttl=60)
+    profile_cache = ResponseCache(backend, "cache", UserResponse, ttl=60)
+
+    version = await feed_cache.version(1)
+    await feed_cache.set(1, version, "page", b"feed")
+
+    assert await profile_cache.get(1, version, "page") is None
+
+
+@pytest.mark.asyncio
+async def test_redis_backend(redis_standin):
+    """
+    Test of sharing cached responses through a Redis-protocol server
+    """
+    url = f"redis://127.0.0.1:{redis_standin.port}/0"
+    first_worker = ResponseCache(RedisCacheBackend(url), "feed", TweetResponse, ttl=60)
+    second_worker = ResponseCache(RedisCacheBackend(url), "feed", TweetResponse, ttl=60)
+
+    version = await first_worker.version(1)
+    assert await second_worker.version(1) == version
+
+    await first_worker.set(1, version, "page", b"body")
+    assert await second_worker.get(1, version, "page") == b"body"
+
+    await second_worker.invalidate([1])
+    new_version = await first_worker.version(1)
+    assert new_version != version
+    assert await first_worker.get(1, new_version, "page") is None
+
+    await first_worker.backend.close()
+    await second_worker.backend.close()
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_unavailable(redis_standin):
+    """
+    Test of treating an unreachable cache server as a miss
+    """
+    port = redis_standin.port
+    await redis_standin.stop()
+
+    backend = RedisCacheBackend(f"redis://127.0.0.1:{port}/0", timeout=0.5)
+    with pytest.raises(CacheError):
+        await backend.get("key")
+
+    cache = ResponseCache(backend, "feed", TweetResponse, ttl=60)
+    version = await cache.version(1)
+    assert await cache.get(1, version, "page") is None
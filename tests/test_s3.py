@@ -0,0 +1,166 @@
+import asyncio
+
+import pytest
+
+
+class ChunkedFile:
+    """
+    Asynchronous file of a given size, recording the sizes of reads.
+
+    Reads return at most chunk bytes, like a network stream; fail_after makes
+    reads fail once that many bytes were read.
+    """
+
+    def __init__(self, size: int, chunk: int, fail_after: int = None):
+        self.data = bytes(number % 251 for number in range(size))
+        self.position = 0
+        self.chunk = chunk
+        self.fail_after = fail_after
+        self.reads = []
+
+    async def read(self, size: int) -> bytes:
+        if self.fail_after is not None and self.position >= self.fail_after:
+            raise ConnectionResetError("Client disconnected")
+        self.reads.append(size)
+        data = self.data[self.position : self.position + min(size, self.chunk)]
+        self.position += len(data)
+        await asyncio.sleep(0)
+        return data
+
+
+@pytest.mark.asyncio
+async def test_shared_client_reuses_connections(s3_standin):
+    """
+    Test of uploading through the long-lived client over one pooled connection
+    """
+    s3 = s3_standin.client()
+    await s3.start()
+    try:
+        async with s3.get_client() as first, s3.get_client() as second:
+            assert first is second
+        for number in range(3):
+            await s3.upload_file_obj(b"content %d" % number, f"file-{number}.txt")
+    finally:
+        await s3.close()
+
+    assert s3.client is None
+    assert s3_standin.objects == {
+        f"file-{number}.txt": b"content %d" % number for number in range(3)
+    }
+    assert len(set(s3_standin.peers)) == 1
+
+
+@pytest.mark.asyncio
+async def test_client_per_upload_without_start(s3_standin):
+    """
+    Test of uploading with a client per call when the shared client is not started
+    """
+    s3 = s3_standin.client()
+    for number in range(2):
+        await s3.upload_file_obj(b"content", f"file-{number}.txt")
+
+    assert set(s3_standin.objects) == {"file-0.txt", "file-1.txt"}
+    assert len(set(s3_standin.peers)) == 2
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_in_parts(s3_standin):
+    """
+    Test of streaming a file to S3 as a multipart upload with bounded reads
+    """
+    s3 = s3_standin.client()
+    file = ChunkedFile(size=2500, chunk=300)
+
+    await s3.upload_stream(file, "video.mp4", part_size=1000)
+
+    assert s3_standin.objects == {"video.mp4": file.data}
+    assert s3_standin.uploads == {}
+    assert max(file.reads) <= 1000
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_small_file(s3_standin):
+    """
+    Test of uploading a file smaller than a part with a single request
+    """
+    s3 = s3_standin.client()
+    await s3.upload_stream(ChunkedFile(size=10, chunk=300), "small.jpg", part_size=1000)
+
+    assert s3_standin.objects["small.jpg"] == ChunkedFile(size=10, chunk=1).data
+    assert len(s3_standin.peers) == 1
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_aborts_on_failure(s3_standin):
+    """
+    Test of aborting the multipart upload when a part is rejected or the file fails
+    """
+    s3 = s3_standin.client()
+    s3_standin.failing_parts = {2}
+
+    with pytest.raises(Exception):
+        await s3.upload_stream(
+            ChunkedFile(size=2500, chunk=1000), "video.mp4", part_size=1000
+        )
+    assert len(s3_standin.aborted) == 1
+
+    s3_standin.failing_parts = set()
+    with pytest.raises(ConnectionResetError):
+        await s3.upload_stream(
+            ChunkedFile(size=2500, chunk=1000, fail_after=1000),
+            "video.mp4",
+            part_size=1000,
+        )
+
+    assert len(s3_standin.aborted) == 2
+    assert s3_standin.uploads == {}
+    assert s3_standin.objects == {}
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_parallel_parts(s3_standin):
+    """
+    Test of uploading parts concurrently, bounded by the concurrency
+    """
+    s3 = s3_standin.client()
+    file = ChunkedFile(size=10_500, chunk=1000)
+
+    await s3.upload_stream(file, "video.mp4", part_size=1000, concurrency=3)
+
+    assert s3_standin.objects == {"video.mp4": file.data}
+    assert s3_standin.max_parts_in_flight == 3
+    assert len(s3_standin.part_attempts) == 11
+
+
+@pytest.mark.asyncio
+async def test_upload_stream_retries_parts(s3_standin):
+    """
+    Test of retrying parts failing with transient errors, but not rejected ones
+    """
+    s3 = s3_standin.client()
+    s3_standin.flaky_parts = {1: 2, 3: 1}
+    file = ChunkedFile(size=3500, chunk=1000)
+
+    await s3.upload_stream(
+        file, "video.mp4", part_size=1000, concurrency=2, retries=2, backoff=0.001
+    )
+
+    assert s3_standin.objects == {"video.mp4": file.data}
+    assert s3_standin.part_attempts == {1: 3, 2: 1, 3: 2, 4: 1}
+
+    s3_standin.part_attempts = {}
+    s3_standin.flaky_parts = {2: 3}
+    s3_standin.failing_parts = {3}
+    with pytest.raises(Exception):
+        await s3.upload_stream(
+            ChunkedFile(size=3500, chunk=1000),
+            "other.mp4",
+            part_size=1000,
+            concurrency=1,
+            retries=2,
+            backoff=0.001,
+        )
+
+    assert s3_standin.part_attempts == {1: 1, 2: 3}
+    assert len(s3_standin.aborted) == 1
+    assert s3_standin.uploads == {}